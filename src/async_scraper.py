@@ -0,0 +1,305 @@
+import time
+import asyncio
+import logging
+import threading
+
+try:
+    import aiohttp
+except ImportError: # optional, only needed with HTTP_ENGINE=async
+    aiohttp = None
+
+# Create module-level logger
+logger = logging.getLogger(__name__)
+
+def client_timeout(timeout):
+    """
+    aiohttp timeout of a requests style timeout, a (connect, read) tuple or the seconds of the whole
+    request. The total is the deadline of a request.
+    """
+    if isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+        return aiohttp.ClientTimeout(total=connect + read, sock_connect=connect, sock_read=read)
+    return aiohttp.ClientTimeout(total=timeout)
+
+class aimd_controller:
+    """
+    Adaptive limit of the requests in flight, additive increase and multiplicative decrease (AIMD).
+
+    A successful request raises the limit by 1/limit, about one more request in flight per round trip,
+    unless it took more than latency_tolerance times the fastest request of the run, a sign of requests
+    queueing upstream. Timeouts, 429 and 5xx responses and failed connections cut the limit by
+    decrease_factor, at most once per round of requests, since the requests already in flight report
+    the same congestion. A Retry-After on a 429 or 503 also pauses new requests.
+
+    The limit stays between min_workers and max_workers, with min_workers == max_workers it is fixed.
+    A controller kept across runs, like the one of an http_session, starts a run at the limit the
+    previous run ended with.
+    """
+    def __init__(self, min_workers:int, max_workers:int, decrease_factor:float=0.5, latency_tolerance:float=4):
+        self.min_workers = max(min_workers, 1)
+        self.max_workers = max(max_workers, self.min_workers)
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(self.min_workers)
+        self.inflight = 0
+        self.nbackoffs = 0
+        self.min_latency = None
+        self._last_backoff = 0
+        self._paused_until = 0
+        self._condition = None
+
+    @property
+    def adaptive(self):
+        return self.min_workers < self.max_workers
+
+    def start_run(self):
+        """The fastest request is measured per run, latency of the previous run says little about this one"""
+        self.min_latency = None
+        # the asyncio primitives belong to the loop of the run
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait for a request slot, returns the time the request started"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        return time.monotonic()
+
+    async def release(self, started:float, outcome:str, retry_after:float=None):
+        """Free the slot of a request, outcome is 'ok', 'backoff' or 'error' which leaves the limit as is"""
+        now = time.monotonic()
+        if outcome == 'ok':
+            latency = now - started
+            self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+            if latency <= self.latency_tolerance * self.min_latency:
+                self.limit = min(self.limit + 1 / self.limit, self.max_workers)
+        elif (outcome == 'backoff') and (started > self._last_backoff):
+            self._last_backoff = now
+            self.limit = max(self.limit * self.decrease_factor, self.min_workers)
+            self.nbackoffs += 1
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        async with self._condition:
+            self.inflight -= 1
+            self._condition.notify_all()
+
+def retry_after_seconds(response):
+    """Seconds of a Retry-After header, None if there is none or it is a date"""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+class http_session:
+    """
+    Long-lived aiohttp session of a job, reused across its scheduled runs, so the runs after the first
+    find DNS lookups cached and keep-alive connections open instead of connecting and handshaking again.
+
+    Runs are called from scheduler threads, so the session lives on an event loop in its own thread.
+    Before every run the session is checked and reconnected if it was closed or the previous run
+    hit connection errors.
+
+    Args:
+        name: name of the job, used in logs and the thread name.
+        max_workers: size of the connection pool, the most requests a run has in flight.
+        keepalive_seconds: idle connections and DNS entries are kept that long, longer than the job interval.
+        min_workers: with min_workers < max_workers the requests in flight adapt between both, see
+            aimd_controller. The controller is kept with the session, so runs continue at the learned limit.
+    """
+    def __init__(self, name:str, max_workers:int, keepalive_seconds:float=3900, min_workers:int=None):
+        self.name = name
+        self.max_workers = max(max_workers, 1)
+        self.keepalive_seconds = keepalive_seconds
+        self.controller = aimd_controller(min(min_workers or self.max_workers, self.max_workers), self.max_workers)
+        self.session = None
+        self.healthy = True
+        self.nconnects = 0
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=f'http_session_{name}', daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine_func, *args):
+        """Run coroutine_func(session, *args) on the session's loop and return its result"""
+        return asyncio.run_coroutine_threadsafe(self._run(coroutine_func, *args), self.loop).result()
+
+    def mark_unhealthy(self):
+        """Reconnect before the next run"""
+        self.healthy = False
+
+    async def _run(self, coroutine_func, *args):
+        if (self.session is None) or self.session.closed or not self.healthy:
+            await self._connect()
+        return await coroutine_func(self.session, *args)
+
+    async def _connect(self):
+        if self.session is not None:
+            logger.info(f"Reconnecting the http session of {self.name}")
+            await self.session.close()
+        connector = aiohttp.TCPConnector(
+            limit=self.max_workers,
+            keepalive_timeout=self.keepalive_seconds,
+            ttl_dns_cache=self.keepalive_seconds,
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+        self.healthy = True
+        self.nconnects += 1
+
+    def close(self):
+        if self.session is not None:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+# http sessions of the jobs by job name, reused across the runs of a job
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(name:str, max_workers:int, keepalive_seconds:float=3900, min_workers:int=None):
+    """The http_session of a job, a new one if the job has none yet or its worker limits changed"""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if (session is not None) and (
+            (session.max_workers != max(max_workers, 1))
+            or (session.controller.min_workers != max(min(min_workers or max_workers, max_workers), 1))
+        ):
+            session.close()
+            session = None
+        if session is None:
+            session = http_session(name, max_workers, keepalive_seconds=keepalive_seconds, min_workers=min_workers)
+            _sessions[name] = session
+        return session
+
+def close_sessions():
+    """Close the http sessions of all jobs"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+class async_scraper:
+    """
+    asyncio fetch engine with the interface of the thread based scrapers: construct it with the
+    identifiers and the url_re they are formatted into, run it and read the results from `results`,
+    the JSON responses as parse_func returns them. Identifiers without a result failed.
+
+    The requests of a run share one keep-alive connection pool, an aimd_controller limits the
+    requests in flight and every request has a deadline, so a few slow locations do not hold up
+    the others. With a session the pool and the controller are the http_session's and outlive the
+    run, without one the run keeps max_workers requests in flight.
+
+    Args:
+        keyword: name of the scrape, used in logs.
+        identifiers: identifiers formatted into url_re.
+        url_re: url with a {} for the identifier.
+        out_path, save_json: accepted like the thread based scrapers, responses are not saved.
+        options: 'timeout' as (connect, read) seconds or seconds of the whole request, 'sleep_in_seconds'
+            a worker waits after each request unless the controller is adaptive and 'nmaxtimeouts'
+            timeouts after which the remaining requests are given up.
+        session: optional http_session of the job, without one the run opens and closes its own pool.
+        budget: optional request_budget shared with other processes, every request takes a token of it.
+        parse_func: optional callable(identifier, response) turning a JSON response into the result
+            of the identifier, like the thread based scrapers do. A response it fails on counts as error.
+    """
+    def __init__(self, keyword:str, identifiers:list, url_re:str, out_path:str=None, save_json:bool=False, options:dict=None, session:http_session=None, budget=None, parse_func=None):
+        if aiohttp is None:
+            raise ImportError("HTTP_ENGINE=async needs aiohttp, install it with: pip install .[async]")
+        options = options or {}
+        self.keyword = keyword
+        self.identifiers = identifiers
+        self.url_re = url_re
+        self.session = session
+        self.budget = budget
+        self.parse_func = parse_func
+        self.timeout = options.get('timeout', 30)
+        self.sleep_in_seconds = options.get('sleep_in_seconds', 0)
+        self.nmaxtimeouts = options.get('nmaxtimeouts', float('inf'))
+        self.results = {}
+        self.ntimeouts = 0
+        self.nerrors = 0
+        self.nconnection_errors = 0
+        self.controller = None
+
+    def run(self, max_workers:int=1):
+        """Fetch every identifier with up to max_workers requests in flight"""
+        started = time.perf_counter()
+        if self.session is None:
+            asyncio.run(self._run(max(max_workers, 1)))
+        else:
+            self.session.run(self._fetch_all, max(max_workers, 1))
+            if self.nconnection_errors > 0:
+                self.session.mark_unhealthy()
+        logger.info(
+            f"{self.keyword}: {len(self.results)}/{len(self.identifiers)} results, {self.ntimeouts} timeouts "
+            f"and {self.nerrors} errors in {time.perf_counter() - started:.1f} seconds, "
+            f"{int(self.controller.limit)} requests in flight after {self.controller.nbackoffs} backoffs"
+        )
+        return self.results
+
+    async def _run(self, max_workers:int):
+        connector = aiohttp.TCPConnector(limit=max_workers)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await self._fetch_all(session, max_workers)
+
+    async def _fetch_all(self, session, max_workers:int):
+        if self.session is not None:
+            self.controller = self.session.controller
+        else:
+            self.controller = aimd_controller(max_workers, max_workers)
+        self.controller.start_run()
+        timeout = client_timeout(self.timeout)
+        await asyncio.gather(*(self._fetch(session, timeout, identifier) for identifier in self.identifiers))
+
+    async def _fetch(self, session, timeout, identifier):
+        started = await self.controller.acquire()
+        outcome, retry_after = 'error', None
+        try:
+            if self.ntimeouts >= self.nmaxtimeouts:
+                return
+            if self.budget is not None:
+                await self.budget.acquire_async()
+                # waiting for a token is not latency of the upstream
+                started = time.monotonic()
+            try:
+                async with session.get(self.url_re.format(identifier), timeout=timeout) as response:
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        outcome = 'ok'
+                        self._store(identifier, data)
+                    else:
+                        self.nerrors += 1
+                        logger.debug(f"{self.keyword}: request for {identifier} returned status {response.status}")
+                        if (response.status == 429) or (response.status >= 500):
+                            outcome, retry_after = 'backoff', retry_after_seconds(response)
+            except asyncio.TimeoutError:
+                self.ntimeouts += 1
+                outcome = 'backoff'
+                logger.debug(f"{self.keyword}: request for {identifier} timed out")
+                if self.ntimeouts == self.nmaxtimeouts:
+                    logger.warning(f"{self.keyword}: {self.ntimeouts} requests timed out, giving up the remaining requests")
+            except aiohttp.ClientConnectionError as e:
+                self.nerrors += 1
+                self.nconnection_errors += 1
+                outcome = 'backoff'
+                logger.debug(f"{self.keyword}: connection for {identifier} failed: {e}")
+            except (aiohttp.ClientError, ValueError) as e:
+                # ValueError: the response was not JSON
+                self.nerrors += 1
+                logger.debug(f"{self.keyword}: request for {identifier} failed: {e}")
+            if (self.sleep_in_seconds > 0) and not self.controller.adaptive:
+                await asyncio.sleep(self.sleep_in_seconds)
+        finally:
+            await self.controller.release(started, outcome, retry_after)
+
+    def _store(self, identifier, data):
+        if self.parse_func is None:
+            self.results[identifier] = data
+            return
+        try:
+            self.results[identifier] = self.parse_func(identifier, data)
+        except Exception as e:
+            self.nerrors += 1
+            logger.warning(f"{self.keyword}: failed to parse the response for {identifier}: {e}")
@@ -0,0 +1,180 @@
+import time
+import queue
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+# Create module-level logger
+logger = logging.getLogger(__name__)
+
+# PRAGMAs applied once to every connection, can be overridden per database
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL', # safe in WAL mode, only the last commits can be lost on power loss
+    'cache_size': -16000, # negative values are in KiB, so 16MB
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 120000, # wait 2 minutes.
+    'foreign_keys': 'ON',
+}
+
+# One manager per database path, so db instances created on every scheduled run share connections
+_managers = {}
+_managers_lock = threading.Lock()
+
+def parse_pragmas(pragmas_string:str):
+    """Parse a PRAGMA profile like 'cache_size=-32000;mmap_size=0' into a dict"""
+    pragmas = {}
+    for pragma in pragmas_string.split(';'):
+        if pragma.strip():
+            key, value = pragma.split('=', 1)
+            pragmas[key.strip()] = value.strip()
+    return pragmas
+
+def get_connection_manager(path:str, **kwargs):
+    """Get the connection manager of a database file, it is created on first use"""
+    with _managers_lock:
+        manager = _managers.get(path)
+        if manager is None:
+            manager = connection_manager(path, **kwargs)
+            _managers[path] = manager
+        return manager
+
+def close_connection_manager(path:str):
+    """Close all connections of a database file"""
+    with _managers_lock:
+        manager = _managers.pop(path, None)
+    if manager is not None:
+        manager.close()
+
+def _detach(conn, schema:str):
+    if schema in (row[1] for row in conn.execute("PRAGMA database_list")):
+        conn.execute(f"DETACH DATABASE {schema}")
+
+
+
+class connection_manager:
+    """
+    Owns one long-lived writer connection and a small pool of read-only connections.
+
+    The writer is shared by all threads in the process and guarded by a lock, so writes from
+    several jobs are serialized in-process instead of waiting on SQLite's file lock.
+
+    Args:
+        path: path of the database file.
+        pragmas: PRAGMAs overriding DEFAULT_PRAGMAS.
+        nreaders: maximum number of read-only connections.
+        cached_statements: size of the prepared statement cache of every connection.
+    """
+    def __init__(self, path:str, pragmas:dict=None, nreaders:int=2, cached_statements:int=256):
+        self.path = path
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.cached_statements = cached_statements
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._readers = queue.Queue()
+        self._reader_slots = threading.Semaphore(nreaders)
+        self._all_readers = []
+        self._rollback_callbacks = {}
+
+    def on_rollback(self, key:str, callback):
+        """
+        Call callback after the writer rolled back, e.g. to drop cached ids of rows that were
+        never committed. A callback registered again under the same key replaces the old one.
+        """
+        self._rollback_callbacks[key] = callback
+
+    def _rollback(self):
+        self._writer.rollback()
+        for callback in list(self._rollback_callbacks.values()):
+            callback()
+
+    def _connect(self, read_only:bool):
+        if read_only:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=30,
+                                   cached_statements=self.cached_statements, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, timeout=30,
+                                   cached_statements=self.cached_statements, check_same_thread=False)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        logger.debug(f"Opened {'read-only' if read_only else 'writer'} connection to {self.path}")
+        return conn
+
+    @contextmanager
+    def writer(self, metrics=None):
+        """
+        Yield the writer connection while holding the write lock. Commits when the block
+        finishes and rolls back if it or the commit raises, see on_rollback. With a run_metrics the time waiting for the
+        lock and the commit time are added to its lock_wait and commit timers.
+        """
+        started = time.perf_counter()
+        with self._writer_lock:
+            if metrics is not None:
+                metrics.add_time('lock_wait', time.perf_counter() - started)
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+            try:
+                yield self._writer
+            except BaseException:
+                self._rollback()
+                raise
+            else:
+                started = time.perf_counter()
+                try:
+                    self._writer.commit()
+                except BaseException:
+                    self._rollback()
+                    raise
+                if metrics is not None:
+                    metrics.add_time('commit', time.perf_counter() - started)
+
+    @contextmanager
+    def reader(self):
+        """Yield a read-only connection from the pool, blocks while all readers are in use"""
+        with self._reader_slots:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect(read_only=True)
+                self._all_readers.append(conn)
+            try:
+                yield conn
+            finally:
+                self._readers.put(conn)
+
+    def detach(self, schema:str):
+        """
+        DETACH an attached database from the writer and the idle read-only connections, so other
+        connections can lock it exclusively. Returns False if a read-only connection is in use and
+        may still have it attached.
+        """
+        with self._writer_lock:
+            if self._writer is not None:
+                _detach(self._writer, schema)
+            idle = []
+            try:
+                while True:
+                    idle.append(self._readers.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                for conn in idle:
+                    _detach(conn, schema)
+            finally:
+                for conn in idle:
+                    self._readers.put(conn)
+            return len(idle) == len(self._all_readers)
+
+    def close(self):
+        """Close the writer and all read-only connections"""
+        # readers first, only a read-write connection closing last can checkpoint and remove the -wal and -shm files
+        for conn in self._all_readers:
+            conn.close()
+        self._all_readers = []
+        self._readers = queue.Queue()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        logger.debug(f"Closed connections to {self.path}")
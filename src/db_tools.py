@@ -2,27 +2,332 @@ import os
 import sqlite3
 import logging
 from importlib import resources
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
 import hashlib
+import time
+from functools import lru_cache
+from connection_manager import get_connection_manager, close_connection_manager
+from file_lock import file_lock
+from shards import (
+    shard_month, shard_schema, list_shard_months, attached_shard_months, is_frozen,
+    create_shard, attach_shard, detach_shard, union_view_sql, freeze_shard, missing_shard_columns,
+)
 
 # Create module-level logger
 logger = logging.getLogger(__name__)
 
+# Versioned schema migrations, (version, create scripts) applied in order to databases with a
+# lower PRAGMA user_version. Databases created before versioning have user_version 0, so the
+# scripts have to be idempotent (IF NOT EXISTS). Only append new versions, never edit old ones.
+MIGRATIONS = [
+    (1, [
+        'create_locations_table.sql',
+        'create_evseIds_table.sql',
+        'create_connectorGroups_table.sql',
+        'create_availabilityLog_table.sql',
+        'create_availabilityAggregated_table.sql',
+        'create_latest_connectorGroups_newest_revision_view.sql',
+        'create_priceGroups_table.sql',
+        'create_priceTimeSlots_table.sql',
+    ]),
+    (2, [
+        'create_availabilityLog_intervals_view.sql',
+    ]),
+    (3, [
+        'create_priceTimetables_table.sql',
+    ]),
+    (4, [
+        'create_syncMetadata_table.sql',
+    ]),
+    (5, [
+        'create_availabilityLogCompact_tables.sql',
+    ]),
+    (6, [
+        'create_latestRevision_table.sql',
+        'create_latest_connectorGroups_latestRevision_view.sql',
+    ]),
+    (7, [
+        'create_read_api_indexes.sql',
+    ]),
+    (8, [
+        'create_scrapeRuns_table.sql',
+    ]),
+    (9, [
+        'create_runId_indexes.sql',
+        'create_availabilityLogCompact_runId_view.sql',
+    ]),
+    (10, [
+        'create_availabilityFetches_table.sql',
+    ]),
+    (11, [
+        'create_writerBatches_table.sql',
+    ]),
+]
+
+# columns added to an existing table by a migration, CREATE TABLE IF NOT EXISTS does not add them.
+MIGRATION_ADDED_COLUMNS = {
+    3: {'priceTimeSlots': {'firstSeenAt': 'DATETIME', 'lastSeenAt': 'DATETIME'}},
+    9: {
+        'availabilityLog': {'runId': 'INTEGER REFERENCES scrapeRuns(runId)'},
+        'availabilityAggregated': {'runId': 'INTEGER REFERENCES scrapeRuns(runId)'},
+        'availabilityLogCompact': {'runId': 'INTEGER REFERENCES scrapeRuns(runId)'},
+        'priceTimeSlots': {'runId': 'INTEGER REFERENCES scrapeRuns(runId)'},
+    },
+}
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def load_sql_scripts(package:str='sql_scripts'):
+    """Read every .sql script under the sql_scripts folders once, keyed by (folder, script name)"""
+    scripts = {}
+    for folder in resources.files(package).iterdir():
+        if not folder.is_dir():
+            continue
+        for script in folder.iterdir():
+            if script.name.endswith('.sql'):
+                scripts[(folder.name, script.name)] = script.read_text(encoding='utf-8')
+    return scripts
+
+def add_missing_columns(cursor, table_name, columns:dict):
+    """Add the columns (name -> type) that do not exist yet in table_name"""
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    existing_columns = set(row[1] for row in cursor.fetchall())
+    for column, column_type in columns.items():
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {column_type}")
+            logger.info(f"Added column {column} to {table_name}")
+
+def validate_sql_scripts(scripts:dict):
+    """
+    Build the schema in an in-memory database and prepare every other script against it.
+    Raises a ValueError naming the script if one of them is invalid.
+    """
+    conn = sqlite3.connect(':memory:')
+    try:
+        for version, script_names in MIGRATIONS:
+            for table_name, columns in MIGRATION_ADDED_COLUMNS.get(version, {}).items():
+                add_missing_columns(conn.cursor(), table_name, columns)
+            for script_name in script_names:
+                try:
+                    conn.executescript(scripts[('create', script_name)])
+                except sqlite3.Error as e:
+                    raise ValueError(f"create/{script_name} is not valid: {e}") from e
+
+        for (folder, script_name), sql_script in scripts.items():
+            if folder == 'create':
+                continue
+            try:
+                # EXPLAIN prepares the statement without running it. The scripts have no '?' in literals or comments
+                conn.execute(f"EXPLAIN {sql_script}", [None] * sql_script.count('?'))
+            except sqlite3.Error as e:
+                raise ValueError(f"{folder}/{script_name} is not valid: {e}") from e
+    finally:
+        conn.close()
+
+# Loaded once per process. Reusing the same statement text lets sqlite3's statement cache hit.
+SQL_SCRIPTS = load_sql_scripts()
+validate_sql_scripts(SQL_SCRIPTS)
+
+def sql_script_text(folder:str, script_name:str):
+    """Get the text of a script in sql_scripts/<folder>"""
+    return SQL_SCRIPTS[(folder, script_name)]
+
+def split_sql_script(sql_script:str):
+    """Split a script into statements, so it can run inside a transaction unlike executescript"""
+    statements, statement = [], ''
+    for line in sql_script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ''
+    # the last statement of a script may not end with a semicolon
+    if statement.strip():
+        statements.append(statement.strip())
+    return statements
+
+def apply_migrations(conn):
+    """
+    Apply the migrations newer than the database's PRAGMA user_version and return the applied versions.
+
+    Runs in one BEGIN IMMEDIATE transaction, so when several containers start at once the first
+    migrates and the others wait and then find nothing left to do.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.cursor()
+        current_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        applied = []
+        for version, script_names in MIGRATIONS:
+            if version <= current_version:
+                continue
+            logger.debug(f"Applying migration {version}")
+            # columns first, the scripts of the same version may index them
+            for table_name, columns in MIGRATION_ADDED_COLUMNS.get(version, {}).items():
+                add_missing_columns(cursor, table_name, columns)
+            for script_name in script_names:
+                logger.debug(f"Executing script: {script_name}")
+                for statement in split_sql_script(sql_script_text('create', script_name)):
+                    cursor.execute(statement)
+            # PRAGMA does not take parameters, version is an int from MIGRATIONS
+            cursor.execute(f"PRAGMA user_version = {version}")
+            applied.append(version)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return applied
+
+@lru_cache(maxsize=None)
+def insert_statement(table_name:str, columns:tuple, on_conflict:str=None):
+    """Build the INSERT statement for a table and columns once"""
+    placeholders = ', '.join(['?' for _ in columns])
+    insert = f"INSERT OR {on_conflict}" if on_conflict else "INSERT"
+    return f"{insert} INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+
 def compute_evseids_hash(evseIds_list):
     """Create a consistent hash from evseIds list"""
     # Sort to ensure same list gives same hash
-    sorted_ids = sorted(evseIds_list)
+    return _compute_sorted_evseids_hash(tuple(sorted(evseIds_list)))
+
+@lru_cache(maxsize=65536)
+def _compute_sorted_evseids_hash(sorted_ids):
+    # the same plug groups are hashed on every price run, so the hashes are cached
+    sorted_ids = list(sorted_ids)
     # Convert to JSON string for consistent representation
     ids_string = json.dumps(sorted_ids, sort_keys=True)
     # Create hash
     return hashlib.sha256(ids_string.encode()).hexdigest()[:16]  # Use first 16 chars
 
+def compute_timetable_fingerprint(data_rows):
+    """Create a consistent hash of the priceTimeSlots rows of a timetable"""
+    slots = [timeslot_key(data_row) for data_row in data_rows]
+    slots_string = json.dumps(slots)
+    return hashlib.sha256(slots_string.encode()).hexdigest()[:16]
+
+def timeslot_key(data_row):
+    """The columns identifying a priceTimeSlots row within its priceGroup"""
+    return (
+        data_row['product'],
+        data_row['isFlat'],
+        data_row['from_datetime'],
+        data_row['to_datetime'],
+        data_row['price'],
+        data_row['is_next_day'],
+    )
+
+# Last logged (status, timestamp, written_at) per (locationId, evseId), one cache per database.
+# Kept at module level so it survives the db instances created on every scheduled run.
+_last_status_caches = {}
+
+# priceGroupId per (locationId, evseIdsHash), one cache per database.
+_priceGroup_caches = {}
+
+# (locationId, revision, evseId) keys known to exist in evseIds, one cache per database.
+_evseIds_caches = {}
+
+# (fingerprint, lastSeenAt) of the latest stored timetable per priceGroupId, one cache per database.
+_timetable_fingerprint_caches = {}
+
+# evseKey per (locationId, revision, evseId) and statusId per status of the compact layout, one cache per database.
+_evseKey_caches = {}
+_statusId_caches = {}
+
+# locationId lists per select, with the connection state they were read at, one cache per database.
+_locationIds_caches = {}
+
+def compact_timestamp(timestamp):
+    """Epoch seconds of an API timestamp like '2025-01-01T00:00:00Z', other values are kept as text"""
+    if timestamp is None:
+        return None
+    timestamp = str(timestamp)
+    try:
+        dt = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+    except ValueError:
+        return timestamp
+    # only lossless conversions, the compatibility view formats the epoch back into the same text
+    if dt.strftime("%Y-%m-%dT%H:%M:%SZ") != timestamp:
+        return timestamp
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
 
 
 class db:
-    def __init__(self, name:str):
+    def __init__(
+            self,
+            name:str,
+            delta_keyframe_minutes:float=0,
+            dedup_price_timetables:bool=False,
+            cached_statements:int=256,
+            pragmas:dict=None,
+            nreaders:int=2,
+            shard_availability:bool=False,
+            compact_availability:bool=False,
+            fetch_cache_seconds:float=0,
+        ):
+        """
+        Args:
+            name: path of the database without the .db suffix.
+            delta_keyframe_minutes: if > 0 availabilityLog only gets a row when an evse changes
+                status, or when its last row is older than this many minutes (a keyframe).
+            dedup_price_timetables: if True priceTimeSlots are stored as validity intervals
+                (firstSeenAt/lastSeenAt) and unchanged timetables are not written again.
+            cached_statements: size of the prepared statement cache of every connection.
+            pragmas: PRAGMAs overriding connection_manager.DEFAULT_PRAGMAS on the shared connections.
+            nreaders: number of read-only connections kept open for selects.
+            shard_availability: if True availabilityLog rows are written into monthly shard files
+                next to the database instead of the main availabilityLog table.
+            compact_availability: if True availabilityLog rows are written into availabilityLogCompact,
+                which stores integer keys and epoch seconds. Can not be combined with shard_availability.
+            fetch_cache_seconds: if > 0 the availability of a location is stored at most once per
+                fetch_cache_seconds across the availability jobs, see select_recently_fetched_locationIds.
+        """
+        if shard_availability and compact_availability:
+            raise ValueError("shard_availability and compact_availability can not be combined")
         self.name = name
+        self.delta_keyframe_minutes = delta_keyframe_minutes
+        self.dedup_price_timetables = dedup_price_timetables
+        self.cached_statements = cached_statements
+        self.pragmas = pragmas
+        self.nreaders = nreaders
+        self.shard_availability = shard_availability
+        self.compact_availability = compact_availability
+        self.fetch_cache_seconds = fetch_cache_seconds
+        # schema qualified when the rows go into an attached shard
+        self.availabilityLog_table = 'availabilityLog'
+
+    def connect(self):
+        """Open a new connection to the database, prefer the shared connections of self.connections"""
+        return sqlite3.connect(f'{self.name}.db', timeout=30, cached_statements=self.cached_statements)
+
+    @property
+    def connections(self):
+        """
+        The connection manager of the database. It is shared by all db instances of the same
+        database in the process, so its connections are reused across scheduled runs.
+        A rollback of the writer drops the caches, they may hold ids of rows that were rolled back.
+        """
+        manager = get_connection_manager(
+            f'{self.name}.db',
+            pragmas=self.pragmas,
+            nreaders=self.nreaders,
+            cached_statements=self.cached_statements,
+        )
+        manager.on_rollback('db_caches', self.clear_caches)
+        return manager
+
+    def close_connections(self):
+        """Close the shared connections of the database"""
+        close_connection_manager(f'{self.name}.db')
+
+    def clear_caches(self):
+        """Drop the in-memory caches kept for this database"""
+        _last_status_caches.pop(self.name, None)
+        _timetable_fingerprint_caches.pop(self.name, None)
+        _evseIds_caches.pop(self.name, None)
+        _priceGroup_caches.pop(self.name, None)
+        _evseKey_caches.pop(self.name, None)
+        _statusId_caches.pop(self.name, None)
+        _locationIds_caches.pop(self.name, None)
 
     def check_if_db_exists(self):  
         _exists=os.path.exists(f'{self.name}.db')
@@ -35,111 +340,214 @@ class db:
             return False
         
         try:
-            conn = sqlite3.connect(f'{self.name}.db', timeout=30)
-            cursor = conn.cursor()
-            
-            # Check current mode
-            cursor.execute('PRAGMA journal_mode')
-            current_mode = cursor.fetchone()[0]
-            logger.info(f"Current journal mode: {current_mode}")
-            
-            # Enable WAL mode
-            cursor.execute('PRAGMA journal_mode=WAL')
-            new_mode = cursor.fetchone()[0]
-            
-            # Set busy timeout
-            cursor.execute('PRAGMA busy_timeout=120000') # wait 2 minutes. 
-                        
+            # busy_timeout is part of the PRAGMA profile of the connection manager
+            with self.connections.writer() as conn:
+                cursor = conn.cursor()
+                
+                # Check current mode
+                cursor.execute('PRAGMA journal_mode')
+                current_mode = cursor.fetchone()[0]
+                logger.info(f"Current journal mode: {current_mode}")
+                
+                # Enable WAL mode
+                cursor.execute('PRAGMA journal_mode=WAL')
+                new_mode = cursor.fetchone()[0]
+                            
             logger.info(f"Journal mode changed: {current_mode} → {new_mode}")
             return new_mode.lower() == 'wal'
         
         except Exception as e:
             logger.error(f"Failed to enable WAL mode: {e}")
             return False
-        finally: 
-            if conn: 
-                conn.close()
 
 
-    def create_db(self): 
-        if self.check_if_db_exists():
-            logger.debug(f"Database {self.name} already exist - adding tables if they currently do not exist:")
-        else: 
-            logger.debug(f"Database {self.name} Initialized - adding tables:")
-        
-        # connect to db 
-        conn = sqlite3.connect(f'{self.name}.db', timeout = 30)
-        cursor = conn.cursor()
-        
-        # scripts to execute in specific order
-        script_order = [
-            'create_locations_table.sql',
-            'create_evseIds_table.sql',
-            'create_connectorGroups_table.sql',
-            'create_availabilityLog_table.sql',
-            'create_availabilityAggregated_table.sql',
-            'create_latest_connectorGroups_newest_revision_view.sql',
-            'create_priceGroups_table.sql',
-            'create_priceTimeSlots_table.sql',
-        ]
-
-        # Get list of tables before edits
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
-        tables_before = set(row[0] for row in cursor.fetchall())
-        logger.debug(f"Tables before edits: {sorted(tables_before) if tables_before else 'None'}")
-
-        for script_name in script_order: 
-            logger.debug(f"Executing script: {script_name}")
-            sql_script = resources.read_text('sql_scripts.create', script_name)
-            cursor.executescript(sql_script)
-        
-        # Get list of tables after edits
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
-        tables_after = set(row[0] for row in cursor.fetchall())
-        logger.debug(f"Tables after edits: {sorted(tables_after)}")
-
-        # Log what tables were added
-        tables_added = tables_after - tables_before
-        if tables_added:
-            logger.info(f"New tables added: {sorted(tables_added)}")
+    def create_db(self):
+        """
+        Bring the schema up to date. Only migrations newer than the database's PRAGMA user_version
+        are applied, so once a database is current this is a single PRAGMA read and scheduled runs
+        no longer take schema locks.
+        """
+        with self.connections.writer() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        if version > SCHEMA_VERSION:
+            logger.warning(f"Database {self.name} has schema version {version}, newer than {SCHEMA_VERSION} known by this code")
+            return
+
+        if version > 0:
+            logger.debug(f"Database {self.name} already exist at schema version {version}")
         else:
-            logger.debug("No new tables were added")
-        
-        conn.commit()
-        conn.close()
+            logger.debug(f"Database {self.name} Initialized - adding tables:")
+
+        # connect to db, apply_migrations commits itself
+        with self.connections.writer() as conn:
+            cursor = conn.cursor()
+
+            # Get list of tables before edits
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
+            tables_before = set(row[0] for row in cursor.fetchall())
+            logger.debug(f"Tables before edits: {sorted(tables_before) if tables_before else 'None'}")
+
+            applied = apply_migrations(conn)
 
-        logger.info(f"Database initialized successfully at {self.name}.db")
+            # Get list of tables after edits
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
+            tables_after = set(row[0] for row in cursor.fetchall())
+            logger.debug(f"Tables after edits: {sorted(tables_after)}")
+
+            # Log what tables were added
+            tables_added = tables_after - tables_before
+            if tables_added:
+                logger.info(f"New tables added: {sorted(tables_added)}")
+            else:
+                logger.debug("No new tables were added")
+
+        if applied:
+            logger.info(f"Applied migrations {applied} to {self.name}.db")
+        logger.info(f"Database initialized successfully at {self.name}.db (schema version {SCHEMA_VERSION})")
 
         # switching to wal mode: 
         self.enable_wal_mode()
 
-
     def insert_row(self, conn, table_name, row_dict):
         """Insert a row into specified table"""
-        
+        nsuccess, failures = self.insert_rows(conn, table_name, [row_dict])
+        if nsuccess:
+            return True, None
+        return False, failures[0][1]
+
+    def insert_rows(self, conn, table_name, rows, on_conflict:str=None):
+        """
+        Insert a batch of rows into specified table.
+
+        Rows sharing the same columns are written with one executemany under a single
+        savepoint. If a batch fails it is bisected until the offending rows are isolated,
+        so only those rows are skipped.
+
+        on_conflict can be set to 'IGNORE' or 'REPLACE' to use INSERT OR IGNORE / INSERT OR REPLACE.
+
+        Returns:
+            nsuccess: number of inserted rows, ignored rows count as inserted
+            failures: list of (row_dict, error) tuples for the rows that were not inserted
+        """
         cursor = conn.cursor()
 
         # ensures that foreign_keys are always enabled.
         cursor.execute("PRAGMA foreign_keys = ON;")
-               
-        # Build the INSERT statement dynamically
-        columns = ', '.join(row_dict.keys())
-        placeholders = ', '.join(['?' for _ in row_dict])
-        values = list(row_dict.values())
-        sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-        try:                
-            cursor.execute("SAVEPOINT sp")
-            cursor.execute(sql, values)
+
+        # group rows by their columns, as executemany needs a single statement
+        batches = {}
+        for row_dict in rows:
+            batches.setdefault(tuple(row_dict.keys()), []).append(row_dict)
+
+        nsuccess, failures = 0, []
+        for columns, batch in batches.items():
+            sql = insert_statement(table_name, columns, on_conflict)
+            values = [tuple(row_dict.values()) for row_dict in batch]
+            nsuccess += self._insert_batch(cursor, sql, batch, values, failures)
+
+        if failures:
+            logger.debug(f"❌ Failed to insert {len(failures)}/{len(rows)} rows into {table_name}: {failures[0][1]}")
+        logger.debug(f"✅ Successfully inserted {nsuccess} rows into {table_name}")
+        return nsuccess, failures
+
+    def _insert_batch(self, cursor, sql, batch, values, failures):
+        """Insert values under one savepoint, bisecting the batch on failure"""
+        cursor.execute("SAVEPOINT sp")
+        try:
+            cursor.executemany(sql, values)
             cursor.execute("RELEASE sp")
-            logger.debug(f"✅ Successfully inserted row into {table_name}")
-            return True, None
+            return len(values)
         except sqlite3.Error as e:
             cursor.execute("ROLLBACK TO sp")
+            if len(values) == 1:
+                cursor.execute("RELEASE sp")
+                failures.append((batch[0], e))
+                return 0
+
+            mid = len(values) // 2
+            nsuccess = self._insert_batch(cursor, sql, batch[:mid], values[:mid], failures)
+            nsuccess += self._insert_batch(cursor, sql, batch[mid:], values[mid:], failures)
             cursor.execute("RELEASE sp")
-            logger.debug(f"❌ Error inserting into {table_name}: {e}", exc_info=True)
-            return False, e
+            return nsuccess
+
+    def insert_rows_in_locations_tables(self, conn, locations:dict):
+        """
+        Insert all scraped locations and their connectorGroups with one executemany per table.
+        Known (locationId, revision) rows are ignored instead of failing one by one.
+
+        Returns:
+            nlocations: number of new location revisions
+            nconnectorGroups: number of new connectorGroups
+            nmissing_ConnectorCounts: number of locations without "connectorCounts"
+        """
+        location_rows, connectorGroup_rows = [], []
+        nmissing_ConnectorCounts = 0
+        for location in locations.values():
+            location_rows.append(self.build_locations_row(location))
+
+            try: 
+                connector_dict = location['connectorCounts']
+            except KeyError:
+                connector_dict = location['plugTypes']
+                nmissing_ConnectorCounts += 1
+
+            for connectorGroup, connectorCount in enumerate(connector_dict):
+                connectorGroup_rows.append(self.build_connectorGroup_row(location, connectorGroup, connectorCount))
+
+        # both tables are only appended to, so new rows are counted from their newest rowids.
+        # total_changes would also count the latestRevision trigger.
+        sql_script = sql_script_text('select', 'select_locations_fingerprint.sql')
+        locations_before, connectorGroups_before = conn.execute(sql_script).fetchone()
+        self.insert_rows(conn, 'locations', location_rows, on_conflict='IGNORE')
+        self.insert_rows(conn, 'connectorGroups', connectorGroup_rows, on_conflict='IGNORE')
+        locations_after, connectorGroups_after = conn.execute(sql_script).fetchone()
+        nlocations = (locations_after or 0) - (locations_before or 0)
+        nconnectorGroups = (connectorGroups_after or 0) - (connectorGroups_before or 0)
+        return nlocations, nconnectorGroups, nmissing_ConnectorCounts
+
+    def select_lastSyncedAt(self, syncName:str):
+        """Time of the last successful sync as an UTC datetime, None if it never ran"""
+        with self.connections.reader() as conn:
+            row = conn.execute(sql_script_text('select', 'select_lastSyncedAt_by_syncName.sql'), (syncName,)).fetchone()
+        if row is None:
+            return None
+        return datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+
+    def update_lastSyncedAt(self, conn, syncName:str, nrows:int=None):
+        """Record a successful sync, is committed with the rows of the sync"""
+        lastSyncedAt = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        conn.execute(sql_script_text('insert', 'upsert_syncMetadata.sql'), (syncName, lastSyncedAt, nrows))
+
+    def insert_scrapeRun(self, conn, jobName:str, startedAt:str, intervalSeconds:float=None):
+        """Register a run in scrapeRuns and return its runId"""
+        cursor = conn.cursor()
+        cursor.execute(sql_script_text('insert', 'insert_scrapeRuns.sql'), (jobName, startedAt, intervalSeconds))
+        return cursor.lastrowid
+
+    def update_scrapeRun(self, conn, runId:int, finishedAt:str, status:str, totalSeconds:float, timers:dict, counters:dict):
+        """Store the timers and counters of a finished run, see run_metrics.TIMERS and run_metrics.COUNTERS"""
+        conn.execute(sql_script_text('update', 'update_scrapeRuns_by_runId.sql'), (
+            finishedAt, status, totalSeconds,
+            timers['fetch'], timers['parse'], timers['lock_wait'], timers['insert'], timers['commit'],
+            counters['requests'], counters['timeouts'], counters['results'], counters['rows'], counters['failures'],
+            runId,
+        ))
+
+    def select_latest_scrapeRuns(self):
+        """Latest finished run of every job as dicts with the columns of scrapeRuns"""
+        with self.connections.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql_script_text('select', 'select_latest_scrapeRuns.sql'))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
     def insert_row_in_locations_table(self, conn, location):
+        self.insert_row(conn, 'locations', row_dict=self.build_locations_row(location))
+
+    def build_locations_row(self, location):
+        """Build the locations row of a location object without inserting it."""
         # adding these to ensure that if there is ever a case v_coords coordinates or timestamp does not exist then
         # we can still call with get and get nan values
         location_coords = location.get('coordinates', {})
@@ -157,11 +565,16 @@ class db:
             'ts_seconds': location_timestamp.get('seconds'),
             'ts_nanoseconds': location_timestamp.get('nanoseconds'),
         }
-        
-        self.insert_row(conn, 'locations', row_dict=data_row)
+        return data_row
 
     def insert_row_in_connectorGroup_table(self, conn, location:dict, connectorGroup:int, connectorCount:dict):
+        data_row = self.build_connectorGroup_row(location, connectorGroup, connectorCount)
+        success, error=self.insert_row(conn, 'connectorGroups', row_dict=data_row)
+
+        return success, error
 
+    def build_connectorGroup_row(self, location:dict, connectorGroup:int, connectorCount:dict):
+        """Build the connectorGroups row of a connectorCount object without inserting it."""
         data_row = {
             'locationId': location.get('locationId') ,
             'revision': location.get('revision'), 
@@ -170,16 +583,18 @@ class db:
             'speed': connectorCount.get('speed'),
             'count': connectorCount.get('count'),
         }
-        
-        success, error=self.insert_row(conn, 'connectorGroups', row_dict=data_row)
-
-        return success, error
+        return data_row
 
 
     def insert_row_in_evseIds_table(self, conn, location, evse:dict): 
         """
         The evse object is a dict and is a value returned from the 'evses' object. 
         """
+        return self.insert_rows(conn, table_name='evseIds', rows=self.build_evseIds_rows(location, evse))
+
+    def build_evseIds_rows(self, location, evse:dict):
+        """Build the evseIds rows for an evse object without inserting them."""
+        rows = []
         connectors = evse.get('connectors', {})
         for evseConnectorId in connectors.keys():
             # I expect there is only one ky in connectors but if there is more I should get an unique error.
@@ -200,9 +615,91 @@ class db:
             'connectorId': plug_info.get('connectorId'),
             'speed': plug_info.get('speed'),
             }
-            success, error=self.insert_row(conn, table_name='evseIds', row_dict=data_row)
+            rows.append(data_row)
+        return rows
+
+    def insert_row_in_availabilityLog_table(self, conn, loc_avail_query, runId:int=None):
+        """
+        Log the availability of every evse at a location together with the aggregated
+        availability per connectorGroup, in one transaction. runId is the scrapeRuns run the rows belong to.
+        """
+        self.attach_availability_shard(conn)
+        cursor = conn.cursor()
+        # has to be enabled before the transaction is opened
+        cursor.execute("PRAGMA foreign_keys = ON;")
+        cursor.execute("SAVEPOINT sp_location")
+        try:
+            if self.claim_availability_fetch(conn, loc_avail_query.get('locationId'), runId):
+                nsuccess, nplugs, written_rows = self._insert_availabilityLog_rows(conn, loc_avail_query, runId)
+                self.insert_rows_in_availabilityAggregated_table(conn, loc_avail_query, runId)
+            else:
+                logger.debug(f"Availability of locationId={loc_avail_query.get('locationId')} was stored by another job within {self.fetch_cache_seconds} seconds, skipping it")
+                nsuccess, nplugs, written_rows = 0, 0, []
+        except Exception:
+            cursor.execute("ROLLBACK TO sp_location")
+            cursor.execute("RELEASE sp_location")
+            # keys added to the caches in the savepoint are rolled back as well
+            _evseIds_caches.pop(self.name, None)
+            _evseKey_caches.pop(self.name, None)
+            _statusId_caches.pop(self.name, None)
+            raise
+        cursor.execute("RELEASE sp_location")
+
+        if self.delta_keyframe_minutes > 0:
+            self.update_last_status_cache(written_rows)
 
-    def insert_row_in_availabilityLog_table(self, conn, loc_avail_query):
+        return nsuccess, nplugs
+
+    def claim_availability_fetch(self, conn, locationId:str, runId:int=None):
+        """
+        Claim storing the availability of a location for the job of runId. Returns False if another
+        job stored it within fetch_cache_seconds, its rows would only repeat that job's rows.
+        Part of the transaction of the rows, so concurrent jobs can not both claim a location.
+        """
+        if self.fetch_cache_seconds <= 0:
+            return True
+        cursor = conn.cursor()
+        cursor.execute(
+            sql_script_text('insert', 'upsert_availabilityFetches.sql'),
+            (locationId, runId, int(time.time()), runId, self.fetch_cache_seconds),
+        )
+        return cursor.rowcount == 1
+
+    def select_recently_fetched_locationIds(self, jobName:str=None):
+        """Locations whose availability another job than jobName stored within fetch_cache_seconds"""
+        if self.fetch_cache_seconds <= 0:
+            return set()
+        with self.connections.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                sql_script_text('select', 'select_recent_availabilityFetches.sql'),
+                (int(time.time() - self.fetch_cache_seconds), jobName),
+            )
+            return set(row[0] for row in cursor.fetchall())
+
+    def claim_writer_batch(self, conn, batchId:str):
+        """
+        Record a batch of the writer service clients in the transaction of its rows. Returns None if it
+        was not written yet, otherwise the (nsuccess, ntotal) it was written with.
+        """
+        cursor = conn.cursor()
+        cursor.execute(sql_script_text('insert', 'insert_writerBatches.sql'), (batchId, int(time.time())))
+        if cursor.rowcount == 1:
+            return None
+        cursor.execute(sql_script_text('select', 'select_writerBatches_by_batchId.sql'), (batchId,))
+        return tuple(cursor.fetchone())
+
+    def update_writer_batch(self, conn, batchId:str, nsuccess:int, ntotal:int):
+        """Store the counts of a recorded batch, returned when it is claimed again"""
+        conn.execute(sql_script_text('update', 'update_writerBatches_by_batchId.sql'), (nsuccess, ntotal, batchId))
+
+    def delete_writer_batches(self, conn, max_age_hours:float):
+        """Forget the batches recorded more than max_age_hours ago, their clients finished long before"""
+        cursor = conn.cursor()
+        cursor.execute(sql_script_text('update', 'delete_writerBatches_before.sql'), (int(time.time() - max_age_hours * 3600),))
+        logger.debug(f"Deleted {cursor.rowcount} writer batches")
+
+    def _insert_availabilityLog_rows(self, conn, loc_avail_query, runId:int=None):
         evses = loc_avail_query.get('availability', {}).get('evses', {})
         evses_pluginfo = loc_avail_query.get('evses')
         nplugs = len(evses_pluginfo.keys())
@@ -215,34 +712,21 @@ class db:
                 loc_avail_query.get('locationId'),
             )
         
-        # keep count of successes: 
-        nsuccess = 0
+        # Construct all data rows for the location, so they can be inserted as one batch
+        data_rows, evse_keys = [], {}
         for evse_key in evses.keys():
             try:
                 evse = evses.get(evse_key)
-                evse_pluginfo=evses_pluginfo.get(evse_key, {})
-                
-                # Construct a data row
                 data_row = {
                 'locationId': loc_avail_query.get('locationId', 'returnsError'),
                 'revision': loc_avail_query.get('revision', 'returnsError'),
                 'evseId': evse.get('evseId', 'returnsError'),
                 'status': evse.get('status', 'returnsNoError'),
-                'timestamp': evse.get('timestamp')
+                'timestamp': evse.get('timestamp'),
+                'runId': runId,
                 }
-                success = False
-                success, error=self.insert_row(conn, 'availabilityLog', row_dict=data_row)
-
-                if (not success) and (error.sqlite_errorcode == 787):
-                    self.insert_row_in_evseIds_table(
-                        conn=conn,
-                        location=loc_avail_query, 
-                        evse=evse_pluginfo
-                    )
-                    success, error=self.insert_row(conn, 'availabilityLog', row_dict=data_row)
-                
-                # add to nsuccess
-                nsuccess += int(success)
+                data_rows.append(data_row)
+                evse_keys[id(data_row)] = evse_key
 
             except AttributeError as e:
                 logger.warning(
@@ -251,48 +735,456 @@ class db:
                     evse_key,
                     exc_info=True)
                 continue
-        return nsuccess, nplugs
 
-    def select_all_locationIds(self,):
-        """Get all locationIds (latest revision only)"""
-        
-        logger.debug(f"Selecting all locationIds (latest revision only)")
+        # in delta mode evses without a status change are not written, but count as logged
+        nunchanged = 0
+        if self.delta_keyframe_minutes > 0:
+            changed_rows = self.filter_changed_availability_rows(conn, data_rows)
+            nunchanged = len(data_rows) - len(changed_rows)
+            data_rows = changed_rows
 
-        sql_script=resources.read_text('sql_scripts.select', 'select_all_locationIds.sql')
+        # insert the evses that are not known yet in one batch before logging their availability
+        known_evseIds = self.load_evseIds_cache(conn)
+        missing_evses = {}
+        for data_row in data_rows:
+            key = (data_row['locationId'], data_row['revision'], data_row['evseId'])
+            if key not in known_evseIds:
+                missing_evses[key] = evses_pluginfo.get(evse_keys[id(data_row)], {})
+        if missing_evses:
+            self.upsert_evseIds(conn, loc_avail_query, missing_evses)
 
-        conn = sqlite3.connect(f'{self.name}.db', timeout = 30)
+        # keep count of successes: 
+        nsuccess, failures = self.insert_availabilityLog_batch(conn, data_rows)
+
+        # rows can still fail on the foreign key if the evse has no connectors or evseIds was
+        # changed by another process. Insert those evses and retry the failing rows.
+        retry_rows, failed_rows, retry_evses = [], [], {}
+        for data_row, error in failures:
+            if error.sqlite_errorcode != 787:
+                failed_rows.append(data_row)
+                continue
+            key = (data_row['locationId'], data_row['revision'], data_row['evseId'])
+            retry_evses[key] = evses_pluginfo.get(evse_keys[id(data_row)], {})
+            retry_rows.append(data_row)
+
+        if retry_rows:
+            self.upsert_evseIds(conn, loc_avail_query, retry_evses)
+            nretried, retry_failures = self.insert_availabilityLog_batch(conn, retry_rows)
+            nsuccess += nretried
+            failed_rows += [data_row for data_row, _ in retry_failures]
+
+        failed_ids = set(id(data_row) for data_row in failed_rows)
+        written_rows = [data_row for data_row in data_rows if id(data_row) not in failed_ids]
+
+        return nsuccess + nunchanged, nplugs, written_rows
+
+    def insert_availabilityLog_batch(self, conn, data_rows):
+        """Insert availabilityLog rows into the configured layout, returns (nsuccess, failures) like insert_rows"""
+        if self.compact_availability:
+            return self.insert_compact_availabilityLog_rows(conn, data_rows)
+        return self.insert_rows(conn, self.availabilityLog_table, data_rows)
+
+    def insert_compact_availabilityLog_rows(self, conn, data_rows):
+        """
+        Insert availabilityLog rows into availabilityLogCompact. failures holds the availabilityLog rows
+        that were not inserted, so the foreign key retry works as for the availabilityLog table.
+        A second row of an evse within the same second is ignored.
+        """
+        evseKeys, failures = self.resolve_evseKeys(conn, data_rows)
+        statusIds = self.resolve_statusIds(conn, set(data_row['status'] for data_row in data_rows))
+
+        createdAt = int(time.time())
+        compact_rows, source_rows = [], {}
+        for data_row in data_rows:
+            evseKey = evseKeys.get((data_row['locationId'], data_row['revision'], data_row['evseId']))
+            if evseKey is None: # in failures
+                continue
+            compact_row = {
+                'evseKey': evseKey,
+                'createdAt': createdAt,
+                'statusId': statusIds.get(data_row['status']),
+                'timestamp': compact_timestamp(data_row['timestamp']),
+                'runId': data_row.get('runId'),
+            }
+            compact_rows.append(compact_row)
+            source_rows[id(compact_row)] = data_row
+
+        nsuccess, compact_failures = self.insert_rows(conn, 'availabilityLogCompact', compact_rows, on_conflict='IGNORE')
+        failures += [(source_rows[id(compact_row)], error) for compact_row, error in compact_failures]
+        return nsuccess, failures
+
+    def resolve_evseKeys(self, conn, data_rows):
+        """
+        Get the evseKey of every row's evse, evses without a key get one.
+        Returns the evseKey cache and the (data_row, error) of rows whose evse could not get a key.
+        """
+        evseKeys = _evseKey_caches.get(self.name)
+        if evseKeys is None:
+            sql_script = sql_script_text('select', 'select_all_evseKeys.sql')
+            evseKeys = {
+                (locationId, revision, evseId): evseKey
+                for evseKey, locationId, revision, evseId in conn.execute(sql_script).fetchall()
+            }
+            _evseKey_caches[self.name] = evseKeys
+            logger.info(f"Loaded {len(evseKeys)} evseKeys")
+
+        missing = {}
+        for data_row in data_rows:
+            key = (data_row['locationId'], data_row['revision'], data_row['evseId'])
+            if key not in evseKeys:
+                missing.setdefault(key, []).append(data_row)
+        if not missing:
+            return evseKeys, []
+
+        key_rows = [{'locationId': key[0], 'revision': key[1], 'evseId': key[2]} for key in missing]
+        _, key_failures = self.insert_rows(conn, 'evseKeys', key_rows, on_conflict='IGNORE')
+        failures = []
+        for key_row, error in key_failures:
+            failures += [(data_row, error) for data_row in missing[tuple(key_row.values())]]
+
+        sql_script = sql_script_text('select', 'select_evseKey_by_evse.sql')
+        for key in missing:
+            row = conn.execute(sql_script, key).fetchone()
+            if row is not None:
+                evseKeys[key] = row[0]
+        return evseKeys, failures
+
+    def resolve_statusIds(self, conn, statuses:set):
+        """Get the statusId cache, adding the statuses that are not in statusEnum yet"""
+        statusIds = _statusId_caches.get(self.name)
+        if statusIds is None:
+            statusIds = {}
+            _statusId_caches[self.name] = statusIds
+
+        missing = [status for status in statuses if (status is not None) and (status not in statusIds)]
+        if missing or not statusIds:
+            self.insert_rows(conn, 'statusEnum', [{'status': status} for status in missing], on_conflict='IGNORE')
+            sql_script = sql_script_text('select', 'select_all_statusEnum.sql')
+            for statusId, status in conn.execute(sql_script).fetchall():
+                statusIds[status] = statusId
+        return statusIds
+
+    def load_evseIds_cache(self, conn):
+        """Load the (locationId, revision, evseId) keys of all rows in evseIds"""
+        known_evseIds = _evseIds_caches.get(self.name)
+        if known_evseIds is None:
+            sql_script = sql_script_text('select', 'select_all_evseIds_keys.sql')
+            cursor = conn.cursor()
+            cursor.execute(sql_script)
+            known_evseIds = set(cursor.fetchall())
+            _evseIds_caches[self.name] = known_evseIds
+            logger.info(f"Loaded {len(known_evseIds)} known evseIds")
+        return known_evseIds
+
+    def upsert_evseIds(self, conn, location, evses:dict):
+        """
+        Insert the evseIds rows of several evses in one batch, rows that already exist are ignored.
+
+        Args:
+            location: the location (or availability query) the evses belong to.
+            evses: dict mapping (locationId, revision, evseId) keys to evse objects from 'evses'.
+        """
+        data_rows = []
+        for evse in evses.values():
+            data_rows += self.build_evseIds_rows(location, evse)
+        nsuccess, failures = self.insert_rows(conn, 'evseIds', data_rows, on_conflict='IGNORE')
+
+        # with OR IGNORE only rows failing for another reason end up in failures
+        failed_keys = set((row['locationId'], row['revision'], row['evseId']) for row, _ in failures)
+        known_evseIds = self.load_evseIds_cache(conn)
+        for data_row in data_rows:
+            key = (data_row['locationId'], data_row['revision'], data_row['evseId'])
+            if key not in failed_keys:
+                known_evseIds.add(key)
+        logger.debug(f"Upserted {nsuccess} evseIds rows for locationId={location.get('locationId')}")
+        return nsuccess, failures
+
+    def aggregate_availability(self, loc_avail_query):
+        """
+        Count available and total evses per (plugType, speed) for one availability scrape.
+
+        Returns:
+            dict mapping (plugType, speed) to (availableCount, totalCount)
+        """
+        evses = loc_avail_query.get('availability', {}).get('evses', {})
+        evses_pluginfo = loc_avail_query.get('evses', {})
+
+        counts = {}
+        for evse_key in evses.keys():
+            evse = evses.get(evse_key) or {}
+            connectors = evses_pluginfo.get(evse_key, {}).get('connectors', {})
+            # an evse is expected to only have one connector, see insert_row_in_evseIds_table
+            plug_info = next(iter(connectors.values()), {})
+            key = (plug_info.get('plugType'), plug_info.get('speed'))
+            navailable, ntotal = counts.get(key, (0, 0))
+            counts[key] = (navailable + int(evse.get('status') == 'Available'), ntotal + 1)
+        return counts
+
+    def insert_rows_in_availabilityAggregated_table(self, conn, loc_avail_query, runId:int=None):
+        """
+        Insert the aggregated availability of one scrape. The counts are matched to the
+        connectorGroups of the scraped revision in one set-based statement.
+        """
+        counts = self.aggregate_availability(loc_avail_query)
+        locationId = loc_avail_query.get('locationId')
+        revision = loc_avail_query.get('revision')
+
+        sql_script = sql_script_text('insert', 'insert_availabilityAggregated_by_plugType_speed.sql')
         cursor = conn.cursor()
-        try:
-            cursor.execute(sql_script,)
+        cursor.executemany(sql_script, [
+            (navailable, ntotal, runId, locationId, revision, plugType, speed)
+            for (plugType, speed), (navailable, ntotal) in counts.items()
+        ])
+        logger.debug(f"Inserted {cursor.rowcount} aggregated rows for locationId={locationId}")
+
+    def load_last_status_cache(self, conn):
+        """Load the last logged status of every (locationId, evseId) from availabilityLog"""
+        if self.shard_availability or self.compact_availability:
+            # the availabilityLog views of the reader include the shards and the compact table
+            with self.connections.reader() as reader_conn:
+                self.attach_availability_views(reader_conn)
+                sql_script = sql_script_text('select', 'select_last_status_by_evse_from_intervals.sql')
+                rows = reader_conn.execute(sql_script).fetchall()
+        else:
+            sql_script = sql_script_text('select', 'select_last_status_by_evse.sql')
+            cursor = conn.cursor()
+            cursor.execute(sql_script)
+            rows = cursor.fetchall()
+        cache = {
+            (locationId, evseId): (status, timestamp, written_at)
+            for locationId, evseId, status, timestamp, written_at in rows
+        }
+        _last_status_caches[self.name] = cache
+        logger.info(f"Loaded last status of {len(cache)} evses for delta logging")
+        return cache
+
+    def filter_changed_availability_rows(self, conn, data_rows):
+        """Return the availabilityLog rows that changed status or are due for a keyframe"""
+        cache = _last_status_caches.get(self.name)
+        if cache is None:
+            cache = self.load_last_status_cache(conn)
+
+        keyframe_before = time.time() - self.delta_keyframe_minutes * 60
+        changed_rows = []
+        for data_row in data_rows:
+            last = cache.get((data_row['locationId'], data_row['evseId']))
+            if (last is None) or (last[:2] != (data_row['status'], data_row['timestamp'])) or (last[2] < keyframe_before):
+                changed_rows.append(data_row)
+        return changed_rows
+
+    def update_last_status_cache(self, data_rows):
+        """Register availabilityLog rows that were just written in the last status cache"""
+        cache = _last_status_caches.setdefault(self.name, {})
+        written_at = time.time()
+        for data_row in data_rows:
+            cache[(data_row['locationId'], data_row['evseId'])] = (data_row['status'], data_row['timestamp'], written_at)
+
+    def select_status_intervals(self, locationId:str, start:str='0000-00-00', end:str='9999-12-31'):
+        """
+        Get the status time series of all evses at a location, rebuilt from availabilityLog.
+        Each row is (evseId, status, timestamp, validFrom, validTo), where validTo is None for the current status.
+        """
+        logger.debug(f"Selecting status intervals for locationId: {locationId}")
+
+        sql_script = sql_script_text('select', 'select_status_intervals_by_locationId.sql')
+
+        with self.connections.reader() as conn:
+            self.attach_availability_views(conn)
+            cursor = conn.cursor()
+            cursor.execute(sql_script, (locationId, start, end))
             results = cursor.fetchall()
-        except:
-            pass
+
+        return results
+
+    def iter_select(self, script_name:str, params:tuple=(), batch_size:int=500):
+        """
+        Yield the rows of a select script, fetched batch_size rows at a time so long histories are never
+        held in memory at once. The reader connection stays in use until the generator is exhausted or closed.
+        """
+        with self.connections.reader() as conn:
+            self.attach_availability_views(conn)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql_script_text('select', script_name), params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                cursor.close()
+
+    def iter_status_history(self, locationId:str, evseId:str=None, start:str='0000-00-00', end:str='9999-12-31', batch_size:int=500):
+        """
+        Yield the logged statuses of all evses at a location, or of one evse, with start <= createdAt < end.
+        Each row is (evseId, createdAt, status, timestamp), ordered by evseId and createdAt.
+        """
+        logger.debug(f"Selecting status history for locationId: {locationId}, evseId: {evseId}")
+        if evseId is None:
+            return self.iter_select('select_status_history_by_locationId.sql', (locationId, start, end), batch_size)
+        return self.iter_select('select_status_history_by_evseId.sql', (locationId, evseId, start, end), batch_size)
+
+    def iter_occupancy(self, locationId:str, start:str='0000-00-00', end:str='9999-12-31', batch_size:int=500):
+        """
+        Yield the occupancy of the connectorGroups at a location with start <= createdAt < end.
+        Each row is (createdAt, connectorGroup, availableCount, totalCount), ordered by createdAt and connectorGroup.
+        """
+        logger.debug(f"Selecting occupancy for locationId: {locationId}")
+        return self.iter_select('select_occupancy_by_locationId.sql', (locationId, start, end), batch_size)
+
+    def iter_current_prices(self, locationId:str, batch_size:int=500):
+        """
+        Yield the current prices of every priceGroup at a location, taken from its newest timetable.
+        Each row is (priceGroupId, connectorGroup, plugType, speed, product, isFlat, from_datetime, to_datetime, price).
+        """
+        logger.debug(f"Selecting current prices for locationId: {locationId}")
+        return self.iter_select('select_current_prices_by_locationId.sql', (locationId,), batch_size)
+
+    def iter_availability_snapshot(self, runId:int, batch_size:int=500):
+        """
+        Yield the availabilityLog rows written by one run as (locationId, evseId, status, timestamp).
+        In delta mode these are only the evses whose status changed or got a keyframe in that run.
+        """
+        logger.debug(f"Selecting availability snapshot of runId: {runId}")
+        return self.iter_select('select_availability_snapshot_by_runId.sql', (runId,), batch_size)
+
+    def iter_occupancy_snapshot(self, runId:int, batch_size:int=500):
+        """Yield the availabilityAggregated rows of one run as (locationId, connectorGroup, availableCount, totalCount)"""
+        logger.debug(f"Selecting occupancy snapshot of runId: {runId}")
+        return self.iter_select('select_occupancy_snapshot_by_runId.sql', (runId,), batch_size)
+
+    def iter_price_snapshot(self, runId:int, batch_size:int=500):
+        """
+        Yield the priceTimeSlots rows written by one run as
+        (locationId, priceGroupId, product, isFlat, from_datetime, to_datetime, isCurrent, price).
+        Deduplicated slots belong to the run that first stored them.
+        """
+        logger.debug(f"Selecting price snapshot of runId: {runId}")
+        return self.iter_select('select_priceTimeSlots_snapshot_by_runId.sql', (runId,), batch_size)
+
+    def attach_availability_shard(self, conn):
+        """
+        Point availabilityLog inserts at the shard of the current month, attaching it on the writer
+        connection if needed. ATTACH is not possible inside a transaction, so db_writer calls this
+        before it begins a batch. Shards of other months are detached, so they can be frozen.
+        """
+        if not self.shard_availability:
+            return
+        month = shard_month()
+        attached = attached_shard_months(conn)
+        if month not in attached:
+            if conn.in_transaction:
+                if not attached:
+                    raise RuntimeError("The availabilityLog shard has to be attached outside a transaction")
+                # the month changed during a transaction, the new shard is attached before the next one
+                month = attached[-1]
+            else:
+                for attached_month in attached:
+                    detach_shard(conn, attached_month)
+                create_shard(self.name, month, sql_script_text('create', 'create_availabilityLog_shard_table.sql'))
+                attach_shard(conn, self.name, month)
+        self.availabilityLog_table = f'{shard_schema(month)}.availabilityLog'
+
+    def attach_availability_views(self, conn):
+        """
+        Create TEMP views named availabilityLog and availabilityLog_intervals on a read-only connection,
+        which shadow the main ones, so existing queries also read the shards and availabilityLogCompact.
+        Only as many of the newest shards as SQLite allows attaching are included.
+        """
+        if not (self.shard_availability or self.compact_availability):
+            return
+        months = list_shard_months(self.name) if self.shard_availability else []
+        max_shards = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(months) > max_shards:
+            logger.warning(f"Only the newest {max_shards} of {len(months)} availabilityLog shards can be attached")
+            months = months[-max_shards:]
+
+        attached = attached_shard_months(conn)
+        has_views = conn.execute("SELECT 1 FROM temp.sqlite_master WHERE name = 'availabilityLog'").fetchone() is not None
+        if (attached == months) and (has_views or not self.compact_availability):
+            return
+        for month in attached:
+            if month not in months:
+                detach_shard(conn, month)
+        for month in months:
+            if month not in attached:
+                attach_shard(conn, self.name, month, read_only=True)
+        conn.execute("DROP VIEW IF EXISTS temp.availabilityLog_intervals")
+        conn.execute("DROP VIEW IF EXISTS temp.availabilityLog")
+        extra_selects = []
+        if self.compact_availability:
+            extra_selects.append(sql_script_text('select', 'select_availabilityLogCompact_as_availabilityLog.sql'))
+        # frozen shards written before a column was added read it as NULL
+        missing_columns = {month: missing_shard_columns(conn, month) for month in months}
+        conn.execute(union_view_sql(months, extra_selects, missing_columns))
+        conn.execute(sql_script_text('create', 'create_temp_availabilityLog_intervals_view.sql'))
+
+    def freeze_availability_shards(self):
+        """
+        Vacuum the shards of closed months and make them read-only. A shard is closed one day after
+        its month ended, so runs that started before midnight have finished writing into it.
+        The shared connections detach a shard before it is frozen, a shard that is still in use,
+        here or by another process, is left for a later run.
+        """
+        if not self.shard_availability:
+            return []
+        closed_before = shard_month(datetime.now(timezone.utc) - timedelta(days=1))
+        frozen = []
+        # one container freezes, the others find the shards frozen
+        with file_lock(f'{self.name}.shards.lock'):
+            for month in list_shard_months(self.name):
+                if month >= closed_before or is_frozen(self.name, month):
+                    continue
+                if not self.connections.detach(shard_schema(month)):
+                    logger.info(f"availabilityLog shard {month} is read right now, freezing it on a later run")
+                    continue
+                try:
+                    freeze_shard(self.name, month)
+                except sqlite3.OperationalError as e:
+                    logger.warning(f"availabilityLog shard {month} is still in use, freezing it on a later run: {e}")
+                    continue
+                frozen.append(month)
+        return frozen
+
+    def select_all_locationIds(self,):
+        """Get all locationIds (latest revision only)"""
         
-        finally: 
-            if conn:
-                conn.close()
+        logger.debug(f"Selecting all locationIds (latest revision only)")
 
-        return [row[0] for row in results]  # Extract locationIds
+        with self.connections.reader() as conn:
+            return self.select_cached_locationIds(conn, 'select_all_locationIds.sql')
 
     def select_locationIds_by_speed(self, speed:str):
         """Get locationIds with specific speed (latest revision only)"""
         
         logger.debug(f"Selecting locationIds for speed: {speed}")
 
-        sql_script=resources.read_text('sql_scripts.select', 'select_locationIds_by_plugType.sql')
+        with self.connections.reader() as conn:
+            return self.select_cached_locationIds(conn, 'select_locationIds_by_plugType.sql', (speed,))
 
-        conn = sqlite3.connect(f'{self.name}.db', timeout = 30)
-        cursor = conn.cursor()
-        try:
-            cursor.execute(sql_script, (speed,))
-            results = cursor.fetchall()
-        except:
-            pass
-        
-        finally: 
-            conn.close()
-        
-        return [row[0] for row in results]  # Extract locationIds
+    def select_cached_locationIds(self, conn, script_name:str, params:tuple=()):
+        """
+        Run a locationIds select, reusing its last result while locations and connectorGroups did not change.
+
+        PRAGMA data_version only changes when another connection commits, which is cheap to check.
+        As every scrape commits, on a change the newest rowids of locations and connectorGroups
+        decide whether the cached result is still valid.
+        """
+        cache = _locationIds_caches.setdefault(self.name, {})
+        cache_key = (script_name, params)
+        entry = cache.get(cache_key)
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if (entry is not None) and (entry['conn'] == id(conn)) and (entry['data_version'] == data_version):
+            return list(entry['locationIds'])
+
+        fingerprint = conn.execute(sql_script_text('select', 'select_locations_fingerprint.sql')).fetchone()
+        if (entry is None) or (entry['fingerprint'] != fingerprint):
+            cursor = conn.cursor()
+            cursor.execute(sql_script_text('select', script_name), params)
+            entry = {'locationIds': [row[0] for row in cursor.fetchall()], 'fingerprint': fingerprint}
+            cache[cache_key] = entry
+        entry.update(conn=id(conn), data_version=data_version)
+        return list(entry['locationIds'])
 
     def query_for_matching_connectorGroups(self, conn, locationId, plugType, speed):
         revision, connectorGroup = 0, 0
@@ -300,7 +1192,7 @@ class db:
             cursor = conn.cursor()
 
             # Load SQL script from file
-            sql_script = resources.read_text('sql_scripts.select', 'select_connectorGroup_by_plugType_speed.sql')
+            sql_script = sql_script_text('select', 'select_connectorGroup_by_plugType_speed.sql')
                 
             cursor.execute(sql_script, (locationId, plugType, speed))
             result = cursor.fetchone()
@@ -321,7 +1213,7 @@ class db:
     def query_priceGroups_for_priceGroupId(self, conn, locationId, evseidsHash):
         cursor = conn.cursor()
         # Load SQL script from file
-        sql_script = resources.read_text('sql_scripts.select', 'select_priceGroupId_by_locationId_evseidsHash.sql')
+        sql_script = sql_script_text('select', 'select_priceGroupId_by_locationId_evseidsHash.sql')
         
         cursor.execute(sql_script, (locationId, evseidsHash))
         result = cursor.fetchone()
@@ -365,12 +1257,13 @@ class db:
         success, error = self.insert_row(conn, 'priceGroups', row_dict=data_row)
         return success, error
     
-    def insert_rows_in_priceTimeSlots_table(self, conn, plug_data):
+    def insert_rows_in_priceTimeSlots_table(self, conn, plug_data, runId:int=None):
         """
         Insert price data for a specific plug type at a location.
         
         Args:
             plug_data: dict containing plugType, speed, and prices information
+            runId: the scrapeRuns run the rows belong to
         
         """
         locationId = plug_data.get('locationId')
@@ -378,70 +1271,31 @@ class db:
         if not plugs: 
             logger.warning(f"No plugs found for locationId={locationId}")
 
+        # find or create the priceGroups of all plug groups at the location at once
+        priceGroups = self.resolve_priceGroupIds(conn, locationId, plugs)
+
         nsuccess_across_plugs, ntotal_across_plugs = 0, 0
         for plugGroup in plugs:
             try:
-                connectors = plugGroup.get('connectors', [])
-                if not connectors:
+                if not plugGroup.get('connectors', []):
                     logger.warning(f"No connectors found for locationId={locationId}")
 
-                # 
-                evseIds = sorted(list(set([connector['evseId'] for connector in connectors])))
-                plugTypes = list(set([connector['plugType'] for connector in connectors]))
-                speeds = list(set([connector['speed'] for connector in connectors]))
-
-                # Compute hash of evseIds
-                evseIds_hash = compute_evseids_hash(evseIds)
+                evseIds, plugTypes, speeds, evseIds_hash = self.describe_plugGroup(plugGroup)
 
-                mixedPlugTypes, mixedSpeeds = False, False
+                # mixedPlugTypes and mixedSpeeds are stored on the priceGroup
                 if len(plugTypes) > 1: 
                     logger.warning(f'for locationId={locationId},evseIds_hash={evseIds_hash} plugtypes are not homogenous, that is plugtypes {plugTypes} has more than one unique value.')
-                    mixedPlugTypes = True
                 if len(speeds) > 1: 
                     logger.warning(f'for locationId={locationId},evseIds_hash={evseIds_hash} speeds are not homogenous, that is speeds {speeds} has more than one unique value.')
-                    mixedSpeeds = True
-
-                # check if locationId, hash combo exists in priceGroups
-                # I Think I will instead just do this upon failure
-                # But I have to get priceGroupId anyways...  
-                priceGroupId=self.query_priceGroups_for_priceGroupId(
-                    conn=conn,
-                    locationId=locationId,
-                    evseidsHash=evseIds_hash
-                )
-
-                if priceGroupId is None:
-                    logger.debug(f"Failed to find an existing priceGroup for locationId={locationId}, plugType={plugTypes[0]}, speed={speeds[0]}, evseIdsHash={evseIds_hash}")
-                    logger.debug(f"Attempting Insertion")
-
-                    # insert priceGroup Row data
-                    self.insert_row_in_priceGroups_table(
-                        conn=conn,
-                        locationId=locationId,
-                        plugType=plugTypes[0],
-                        speed=speeds[0],
-                        mixedSpeeds=mixedSpeeds,
-                        mixedPlugTypes=mixedPlugTypes,
-                        evseIds=sorted(evseIds),
-                        evseIdsHash=evseIds_hash,
-                    )
-                    # and query again
-                    priceGroupId=self.query_priceGroups_for_priceGroupId(
-                        conn=conn,
-                        locationId=locationId,
-                        evseidsHash=evseIds_hash
-                    )
-                    
-                    if priceGroupId is None: 
-                        logger.warning(f'Failed to insert priceGroupId into priceGroup table for locationId={locationId}, plugtypes={plugTypes[0]}, speed={speeds[0]}')
-                    else:
-                        logger.info(f'Insertion succesful - Created new priceGroupId={priceGroupId} for evseIdsHash={evseIds_hash}')
-                else:
-                    logger.debug(f'Found existing priceGroupId={evseIds_hash}')
+
+                priceGroupId = priceGroups.get((locationId, evseIds_hash))
+                if priceGroupId is None: 
+                    logger.warning(f'Failed to insert priceGroupId into priceGroup table for locationId={locationId}, plugtypes={plugTypes[0]}, speed={speeds[0]}')
 
                 prices = plugGroup.get('prices', [])
                 nsuccess = 0
                 ntotal = 0
+                data_rows = []
                 for price_entry in prices:
                     product = price_entry.get('product')
                     isFlat = price_entry.get('isFlat')
@@ -502,19 +1356,26 @@ class db:
                             'price': price,
                             'is_next_day': time_slot.get('is_next_day'),
                             'timeTableRawData': timeTableRawData,
+                            'runId': runId,
                         }
                         
-                        success, error = self.insert_row(
-                            conn=conn,
-                            table_name='priceTimeSlots', 
-                            row_dict=data_row
-                        )
-                        
-                        if success:
-                            nsuccess += 1
-                        else:
-                            logger.warning(f"Failed to insert price data for locationId={locationId}, "
-                                        f"plugType={plugTypes[0]}, product={product}: {error}")
+                        data_rows.append(data_row)
+
+                if self.dedup_price_timetables and priceGroupId is not None:
+                    nsuccess, failures = self.insert_deduplicated_priceTimeSlots(
+                        conn=conn,
+                        priceGroupId=priceGroupId,
+                        data_rows=data_rows,
+                    )
+                else:
+                    nsuccess, failures = self.insert_rows(
+                        conn=conn,
+                        table_name='priceTimeSlots', 
+                        rows=data_rows
+                    )
+                for data_row, error in failures:
+                    logger.warning(f"Failed to insert price data for locationId={locationId}, "
+                                f"plugType={plugTypes[0]}, product={data_row['product']}: {error}")
                 
                 logger.debug(f"Inserted {nsuccess}/{ntotal} price entries for locationId={locationId}, "
                             f"plugType={plugTypes[0]}, speed={speeds[0]}")
@@ -529,3 +1390,172 @@ class db:
                 continue
 
         return nsuccess_across_plugs, ntotal_across_plugs
+
+    def describe_plugGroup(self, plugGroup):
+        """Return the sorted evseIds, the plugTypes, the speeds and the evseIds hash of a plug group"""
+        connectors = plugGroup.get('connectors', [])
+        evseIds = sorted(list(set([connector['evseId'] for connector in connectors])))
+        plugTypes = list(set([connector['plugType'] for connector in connectors]))
+        speeds = list(set([connector['speed'] for connector in connectors]))
+        return evseIds, plugTypes, speeds, compute_evseids_hash(evseIds)
+
+    def load_priceGroup_cache(self, conn):
+        """Load the priceGroupId of every (locationId, evseIdsHash) in one query"""
+        priceGroups = _priceGroup_caches.get(self.name)
+        if priceGroups is None:
+            sql_script = sql_script_text('select', 'select_all_priceGroupIds.sql')
+            cursor = conn.cursor()
+            cursor.execute(sql_script)
+            priceGroups = {
+                (locationId, evseIdsHash): priceGroupId
+                for locationId, evseIdsHash, priceGroupId in cursor.fetchall()
+            }
+            _priceGroup_caches[self.name] = priceGroups
+            logger.info(f"Loaded {len(priceGroups)} priceGroups")
+        return priceGroups
+
+    def resolve_priceGroupIds(self, conn, locationId, plugs):
+        """
+        Make sure every plug group at a location has a priceGroup. Plug groups missing from
+        the cache are matched to their connectorGroup and inserted in one batch.
+
+        Returns:
+            the priceGroup cache, a dict mapping (locationId, evseIdsHash) to priceGroupId
+        """
+        priceGroups = self.load_priceGroup_cache(conn)
+
+        new_groups = {}
+        for plugGroup in plugs:
+            try:
+                evseIds, plugTypes, speeds, evseIds_hash = self.describe_plugGroup(plugGroup)
+            except AttributeError:
+                # logged when the plug group is inserted
+                continue
+            if ((locationId, evseIds_hash) in priceGroups) or (not evseIds):
+                continue
+            new_groups[evseIds_hash] = (evseIds, plugTypes, speeds)
+
+        if not new_groups:
+            return priceGroups
+
+        cursor = conn.cursor()
+        # newest connectorGroup per (plugType, speed), like query_for_matching_connectorGroups
+        sql_script = sql_script_text('select', 'select_connectorGroups_by_locationId.sql')
+        cursor.execute(sql_script, (locationId,))
+        connectorGroups = {}
+        for plugType, speed, revision, connectorGroup in cursor.fetchall():
+            connectorGroups.setdefault((plugType, speed), (revision, connectorGroup))
+
+        data_rows = []
+        for evseIds_hash, (evseIds, plugTypes, speeds) in new_groups.items():
+            logger.debug(f"Failed to find an existing priceGroup for locationId={locationId}, plugType={plugTypes[0]}, speed={speeds[0]}, evseIdsHash={evseIds_hash}")
+            revision, connectorGroup = connectorGroups.get((plugTypes[0], speeds[0]), (0, 0))
+            if (plugTypes[0], speeds[0]) not in connectorGroups:
+                logger.warning(f"No matching connectorGroup found for locationId={locationId}, "
+                                f"plugType={plugTypes[0]}, speed={speeds[0]}")
+            data_rows.append({
+                'locationId': locationId,
+                'revision': revision,
+                'connectorGroup': connectorGroup,
+                'plugType': plugTypes[0],
+                'speed': speeds[0],
+                'evseIdsRawData': json.dumps(evseIds),
+                'evseIdsHash': evseIds_hash,
+                'mixedPlugTypes': len(plugTypes) > 1,
+                'mixedSpeeds': len(speeds) > 1,
+            })
+        self.insert_rows(conn, 'priceGroups', data_rows, on_conflict='IGNORE')
+
+        # read back the ids of the inserted priceGroups
+        sql_script = sql_script_text('select', 'select_priceGroupIds_by_locationId.sql')
+        cursor.execute(sql_script, (locationId,))
+        for evseIds_hash, priceGroupId in cursor.fetchall():
+            if (evseIds_hash in new_groups) and ((locationId, evseIds_hash) not in priceGroups):
+                logger.info(f'Insertion succesful - Created new priceGroupId={priceGroupId} for evseIdsHash={evseIds_hash}')
+            priceGroups[(locationId, evseIds_hash)] = priceGroupId
+
+        return priceGroups
+
+    def load_timetable_fingerprints(self, conn):
+        """Load the fingerprint of the latest stored timetable of every priceGroup"""
+        fingerprints = _timetable_fingerprint_caches.get(self.name)
+        if fingerprints is None:
+            sql_script = sql_script_text('select', 'select_all_priceTimetables.sql')
+            cursor = conn.cursor()
+            cursor.execute(sql_script)
+            fingerprints = {
+                priceGroupId: (fingerprint, lastSeenAt)
+                for priceGroupId, fingerprint, lastSeenAt in cursor.fetchall()
+            }
+            _timetable_fingerprint_caches[self.name] = fingerprints
+            logger.info(f"Loaded timetable fingerprints of {len(fingerprints)} priceGroups")
+        return fingerprints
+
+    def insert_deduplicated_priceTimeSlots(self, conn, priceGroupId, data_rows):
+        """
+        Store the timetable of a priceGroup as validity intervals.
+
+        An unchanged timetable (same fingerprint as the latest stored one) only gets its
+        lastSeenAt extended. Otherwise slots that are part of the latest stored timetable
+        are extended and take the isCurrent of the new timetable, and only new slots are
+        inserted with firstSeenAt = lastSeenAt = now.
+        The cache of the latest timetables can be behind the database, e.g. after a rollback
+        or when another process stored the timetable, then the latest one is read from the database.
+
+        Returns:
+            nsuccess: number of slots stored or extended
+            failures: list of (row_dict, error) tuples for the slots that were not inserted
+        """
+        fingerprints = self.load_timetable_fingerprints(conn)
+        fingerprint = compute_timetable_fingerprint(data_rows)
+        previous_fingerprint, previous_seenAt = fingerprints.get(priceGroupId, (None, None))
+        seenAt = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+        cursor = conn.cursor()
+        cursor.execute("SAVEPOINT sp_timetable")
+        try:
+            nextended = 0
+            if fingerprint == previous_fingerprint:
+                sql_script = sql_script_text('update', 'update_priceTimeSlots_lastSeenAt_by_priceGroupId.sql')
+                cursor.execute(sql_script, (seenAt, priceGroupId, previous_seenAt))
+                # no slot has the cached lastSeenAt when the cache is behind the database
+                nextended = cursor.rowcount
+            if nextended > 0:
+                nsuccess, failures = len(data_rows), []
+                logger.debug(f"Timetable of priceGroupId={priceGroupId} is unchanged, extended {nextended} slots")
+            else:
+                sql_script = sql_script_text('select', 'select_priceTimetable_lastSeenAt_by_priceGroupId.sql')
+                row = cursor.execute(sql_script, (priceGroupId,)).fetchone()
+                if (row is not None) and (row[0] != previous_seenAt):
+                    logger.debug(f"Cached timetable of priceGroupId={priceGroupId} is behind the database, using its lastSeenAt")
+                    previous_seenAt = row[0]
+
+                sql_script = sql_script_text('select', 'select_latest_priceTimeSlots_by_priceGroupId.sql')
+                cursor.execute(sql_script, (priceGroupId, previous_seenAt))
+                latest_slots = {tuple(row[1:]): row[0] for row in cursor.fetchall()}
+
+                extended_slots, new_rows = [], []
+                for data_row in data_rows:
+                    slot_id = latest_slots.pop(timeslot_key(data_row), None)
+                    if slot_id is None:
+                        new_rows.append({**data_row, 'firstSeenAt': seenAt, 'lastSeenAt': seenAt})
+                    else:
+                        # the slot that became the current one was not current in the previous timetable
+                        extended_slots.append((seenAt, data_row['isCurrent'], slot_id))
+
+                sql_script = sql_script_text('update', 'update_priceTimeSlots_lastSeenAt_isCurrent_by_id.sql')
+                cursor.executemany(sql_script, extended_slots)
+                nsuccess, failures = self.insert_rows(conn, 'priceTimeSlots', new_rows)
+                nsuccess += len(extended_slots)
+                logger.debug(f"Timetable of priceGroupId={priceGroupId} stored, extended {len(extended_slots)} and inserted {len(new_rows)} slots")
+
+            sql_script = sql_script_text('insert', 'upsert_priceTimetables.sql')
+            cursor.execute(sql_script, (priceGroupId, fingerprint, seenAt, seenAt))
+        except Exception:
+            cursor.execute("ROLLBACK TO sp_timetable")
+            cursor.execute("RELEASE sp_timetable")
+            raise
+        cursor.execute("RELEASE sp_timetable")
+
+        fingerprints[priceGroupId] = (fingerprint, seenAt)
+        return nsuccess, failures
@@ -0,0 +1,116 @@
+import time
+import queue
+import threading
+import logging
+
+# Create module-level logger
+logger = logging.getLogger(__name__)
+
+# Marks the end of the stream in the queue
+_STOP = object()
+
+class db_writer:
+    """
+    Dedicated writer thread that inserts scraped results while scraping continues.
+
+    Results are handed over through a bounded queue, so the scraper blocks when the
+    writer falls behind and memory stays flat. Every `batch_size` results are committed
+    as one transaction.
+
+    Args:
+        database: db instance to write into.
+        insert_func: callable(conn, item) returning (nsuccess, ntotal) for one item.
+        queue_size: maximum number of items waiting to be written.
+        batch_size: number of items written per transaction.
+        on_commit: optional callable(items, results) called after each transaction, results holds
+            the (nsuccess, ntotal) of every item or the exception it raised.
+        metrics: optional run_metrics, gets the lock wait, insert and commit time of the batches.
+    """
+    def __init__(self, database, insert_func, queue_size:int=64, batch_size:int=25, on_commit=None, metrics=None):
+        self.database = database
+        self.insert_func = insert_func
+        self.on_commit = on_commit
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.nsuccess = 0
+        self.ntotal = 0
+        self.nitems = 0
+        self._thread = threading.Thread(target=self._run, name='db_writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put(self, item):
+        """Hand an item to the writer, blocks while the queue is full."""
+        self.queue.put(item)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def close(self):
+        """Flush the remaining items, stop the writer thread and return (nsuccess, ntotal)."""
+        self.queue.put(_STOP)
+        self._thread.join()
+        return self.nsuccess, self.ntotal
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            # block for the first item of a batch, then drain what is already queued
+            items = [self.queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in items:
+                stop = True
+                items = [item for item in items if item is not _STOP]
+            if items:
+                self._write_batch(items)
+
+    def _write_batch(self, items):
+        results = []
+        try:
+            # the shared writer connection has foreign keys enabled and commits when the block finishes
+            with self.database.connections.writer(metrics=self.metrics) as conn:
+                # ATTACH is not possible inside the transaction
+                self.database.attach_availability_shard(conn)
+                # IMMEDIATE takes SQLite's write lock up front, waiting for other processes shows up as lock wait
+                started = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                started_inserts = time.perf_counter()
+                for item in items:
+                    try:
+                        nsuccess, ntotal = self.insert_func(conn, item)
+                        results.append((nsuccess, ntotal))
+                    except Exception as e:
+                        logger.error(f"db_writer failed to write item: {e}", exc_info=True)
+                        results.append(e)
+                if self.metrics is not None:
+                    self.metrics.add_time('lock_wait', started_inserts - started)
+                    self.metrics.add_time('insert', time.perf_counter() - started_inserts)
+        except Exception as e:
+            logger.error(f"db_writer failed to commit {len(items)} items: {e}", exc_info=True)
+            results = [e] * len(items)
+
+        for result in results:
+            if not isinstance(result, Exception):
+                self.nsuccess += result[0]
+                self.ntotal += result[1]
+        self.nitems += len(items)
+        logger.debug(f"db_writer committed {len(items)} items ({self.nitems} in total)")
+        if self.on_commit is not None:
+            # the writer thread has to keep taking items, otherwise put and close block forever
+            try:
+                self.on_commit(items, results)
+            except Exception as e:
+                logger.error(f"db_writer on_commit failed for {len(items)} items: {e}", exc_info=True)
@@ -0,0 +1,32 @@
+import os
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # not available on windows, locking is skipped there
+    fcntl = None
+
+# Create module-level logger
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def file_lock(path:str, shared:bool=False):
+    """
+    Hold an inter-process lock on path while the block runs, blocks until the lock is free.
+    Used to let one container do work the others would otherwise repeat.
+    """
+    if fcntl is None:
+        logger.debug(f"fcntl is not available, not locking {path}")
+        yield
+        return
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,96 @@
+import json
+import time
+import asyncio
+import logging
+from file_lock import file_lock
+
+# Create module-level logger
+logger = logging.getLogger(__name__)
+
+# Jobs drawing from the request budget, lower numbers win when tokens run short
+PRIORITIES = {'Rapid': 0, 'Fast': 1, 'Standard': 2, 'Prices': 3}
+
+# longest wait before a job tries again, tokens freed by other jobs are noticed by then
+_MAX_WAIT_SECONDS = 1
+
+class request_budget:
+    """
+    Token bucket shared by the scraper processes of a host through a small state file on the volume
+    every container mounts. Every request takes a token and tokens refill at rate_per_second up to
+    burst, so the requests of all jobs together stay below the rate, also when their schedules line up.
+
+    A job leaves priority * reserve_fraction * burst tokens in the bucket, so when jobs compete for
+    tokens rapid availability gets them and prices wait.
+
+    Args:
+        path: state file of the bucket, the same path for every process sharing it.
+        rate_per_second: tokens added per second.
+        jobName: job drawing from the bucket, its priority comes from PRIORITIES.
+        burst: most tokens the bucket holds, default two seconds of tokens.
+        reserve_fraction: part of the burst reserved per priority level.
+    """
+    def __init__(self, path:str, rate_per_second:float, jobName:str, burst:float=None, reserve_fraction:float=0.25):
+        self.path = path
+        self.rate_per_second = rate_per_second
+        self.burst = burst or max(2 * rate_per_second, 1)
+        self.jobName = jobName
+        self.priority = PRIORITIES.get(jobName, max(PRIORITIES.values()))
+        self.reserve = min(self.priority * reserve_fraction * self.burst, self.burst - 1)
+        self.waited_seconds = 0.0
+
+    def try_acquire(self):
+        """Take a token, returns 0 if it was taken or the seconds to wait before trying again"""
+        with file_lock(f'{self.path}.lock'):
+            now = time.time()
+            tokens, updatedAt = self._read(now)
+            tokens = min(self.burst, tokens + max(now - updatedAt, 0) * self.rate_per_second)
+            if tokens - 1 >= self.reserve:
+                self._write(tokens - 1, now)
+                return 0
+            self._write(tokens, now)
+        return min((self.reserve + 1 - tokens) / self.rate_per_second, _MAX_WAIT_SECONDS)
+
+    def acquire(self, n:int=1):
+        """Take n tokens, blocks until they are available"""
+        for _ in range(n):
+            wait = self.try_acquire()
+            while wait > 0:
+                time.sleep(wait)
+                self.waited_seconds += wait
+                wait = self.try_acquire()
+
+    async def acquire_async(self):
+        """Take a token without blocking the event loop, the file lock is taken in a thread"""
+        loop = asyncio.get_running_loop()
+        wait = await loop.run_in_executor(None, self.try_acquire)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            self.waited_seconds += wait
+            wait = await loop.run_in_executor(None, self.try_acquire)
+
+    def _read(self, now:float):
+        """tokens and updatedAt of the state file, a missing or unreadable file is a full bucket"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            return float(state['tokens']), float(state['updatedAt'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return self.burst, now
+
+    def _write(self, tokens:float, updatedAt:float):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'tokens': tokens, 'updatedAt': updatedAt}, f)
+
+class budgeted_identifiers(list):
+    """
+    Identifiers of a thread based scraper that take a token of the budget whenever one is handed out,
+    so the workers send their requests at the rate of the budget instead of in one burst.
+    """
+    def __init__(self, identifiers, budget:request_budget):
+        super().__init__(identifiers)
+        self.budget = budget
+
+    def __iter__(self):
+        for identifier in super().__iter__():
+            self.budget.acquire()
+            yield identifier
@@ -0,0 +1,142 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Create module-level logger
+logger = logging.getLogger(__name__)
+
+# Phases timed in a run, in seconds. lock_wait is the time spent waiting for the write lock.
+TIMERS = ['fetch', 'parse', 'lock_wait', 'insert', 'commit']
+# Events counted in a run. requests and results are locations, rows and failures are database rows.
+COUNTERS = ['requests', 'timeouts', 'results', 'rows', 'failures']
+
+class run_metrics:
+    """
+    Timers and counters of one run of a scraper job.
+
+    The run is registered in scrapeRuns when it starts and updated when it finishes, so a run that
+    never finishes is visible as well. Timers and counters may be updated from several threads, e.g.
+    the scraping thread and the db_writer thread.
+
+    Args:
+        jobName: name of the job, like 'Rapid' or 'Prices'.
+        intervalSeconds: scheduled interval of the job, runs taking longer overran their interval.
+    """
+    def __init__(self, jobName:str, intervalSeconds:float=None):
+        self.jobName = jobName
+        self.intervalSeconds = intervalSeconds
+        self.runId = None
+        self.startedAt = None
+        self.timers = dict.fromkeys(TIMERS, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._started = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, phase:str):
+        """Add the time the block takes to a phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - started)
+
+    def add_time(self, phase:str, seconds:float):
+        with self._lock:
+            self.timers[phase] += seconds
+
+    def count(self, counter:str, n:int=1):
+        with self._lock:
+            self.counters[counter] += n
+
+    def start(self, database):
+        """Register the run in scrapeRuns, the runId identifies it from then on"""
+        self._started = time.perf_counter()
+        self.startedAt = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        with database.connections.writer() as conn:
+            self.runId = database.insert_scrapeRun(conn, self.jobName, self.startedAt, self.intervalSeconds)
+        return self
+
+    def finish(self, database, status:str='ok', metrics_file:str=None):
+        """Store the timers and counters of the run and rewrite the metrics file if one is set"""
+        totalSeconds = time.perf_counter() - self._started
+        if (self.intervalSeconds is not None) and (totalSeconds > self.intervalSeconds):
+            logger.warning(f"{self.jobName} run took {totalSeconds:.1f} seconds, longer than its interval of {self.intervalSeconds:.0f} seconds")
+        logger.info(
+            f"{self.jobName} run {status} in {totalSeconds:.1f} seconds: "
+            + ', '.join(f"{phase} {seconds:.1f}s" for phase, seconds in self.timers.items()) + '; '
+            + ', '.join(f"{counter} {n}" for counter, n in self.counters.items())
+        )
+        finishedAt = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with database.connections.writer() as conn:
+                database.update_scrapeRun(conn, self.runId, finishedAt, status, totalSeconds, self.timers, self.counters)
+            if metrics_file:
+                write_metrics_file(metrics_file, database.select_latest_scrapeRuns())
+        except Exception as e:
+            # losing the metrics of a run must not fail the run
+            logger.error(f"Failed to record metrics of {self.jobName} run {self.runId}: {e}", exc_info=True)
+
+    @contextmanager
+    def recording(self, database, metrics_file:str=None):
+        """Start the run, and finish it as 'failed' if the block raises"""
+        self.start(database)
+        try:
+            yield self
+        except BaseException:
+            self.finish(database, status='failed', metrics_file=metrics_file)
+            raise
+        self.finish(database, metrics_file=metrics_file)
+
+
+def prometheus_text(scrapeRuns:list):
+    """
+    Prometheus text format of the latest run of every job.
+    scrapeRuns are dicts with the columns of the scrapeRuns table.
+    """
+    lines = [
+        '# HELP scraper_run_phase_seconds Time spent per phase in the latest run of a job.',
+        '# TYPE scraper_run_phase_seconds gauge',
+    ]
+    for run in scrapeRuns:
+        for phase in TIMERS:
+            lines.append(f'scraper_run_phase_seconds{{job="{run["jobName"]}",phase="{phase}"}} {run[f"{phase}Seconds"] or 0}')
+    lines += [
+        '# HELP scraper_run_count Events counted in the latest run of a job.',
+        '# TYPE scraper_run_count gauge',
+    ]
+    for run in scrapeRuns:
+        for counter in COUNTERS:
+            lines.append(f'scraper_run_count{{job="{run["jobName"]}",counter="{counter}"}} {run[f"n{counter}"] or 0}')
+
+    gauges = [
+        ('scraper_run_duration_seconds', 'Duration of the latest run of a job.', lambda run: run['totalSeconds']),
+        ('scraper_run_interval_seconds', 'Scheduled interval of a job.', lambda run: run['intervalSeconds']),
+        ('scraper_run_overrun', '1 if the latest run of a job took longer than its interval.',
+         lambda run: int(bool(run['intervalSeconds']) and (run['totalSeconds'] or 0) > run['intervalSeconds'])),
+        ('scraper_run_success', '1 if the latest run of a job finished without an error.', lambda run: int(run['status'] == 'ok')),
+        ('scraper_run_started_timestamp_seconds', 'Start of the latest run of a job.',
+         lambda run: int(datetime.strptime(run['startedAt'], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp())),
+    ]
+    for name, help_text, value in gauges:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for run in scrapeRuns:
+            if value(run) is not None:
+                lines.append(f'{name}{{job="{run["jobName"]}"}} {value(run)}')
+    return '\n'.join(lines) + '\n'
+
+def write_metrics_file(path:str, scrapeRuns:list):
+    """
+    Write the metrics of the latest runs for the node_exporter textfile collector. The file is
+    replaced atomically, so a scrape never reads a half written file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(scrapeRuns))
+    os.replace(temp_path, path)
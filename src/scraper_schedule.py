@@ -1,12 +1,20 @@
 import os
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from scrapers.with_requests.scrape_availability_with_api import scraper as avail_scraper
 from scrapers.with_requests.scrape_locations_with_api import scraper as loc_scraper 
 from scrapers.with_requests.scrape_prices_with_api import scraper as price_scraper
+from async_scraper import async_scraper, get_session
+from request_budget import request_budget, budgeted_identifiers
 from db_tools import db
+from db_writer import db_writer
+from writer_service import open_writer, run_writer_service
+from connection_manager import parse_pragmas
+from file_lock import file_lock
+from run_metrics import run_metrics
 from logging_config import setup_logging
 import logging
 
@@ -16,60 +24,195 @@ import logging
 # Get logger for this module
 logger = logging.getLogger(__name__)
 
-def run_avail(speed:str, max_workers:int, sleep_in_seconds:float, db_pathname:str='./data/db/charging'): 
+def count_requests(metrics:run_metrics, scraper, nrequests:int):
+    """Count the requests of a scraper run, identifiers without a result failed"""
+    metrics.count('requests', nrequests)
+    metrics.count('results', len(scraper.results))
+    # scrapers count the timeouts they hit against the nmaxtimeouts option
+    ntimeouts = getattr(scraper, 'ntimeouts', 0)
+    if isinstance(ntimeouts, int):
+        metrics.count('timeouts', ntimeouts)
+
+def scraper_factory(http_engine:str, thread_scraper, jobName:str, max_workers:int, metrics:run_metrics, min_workers:int=None, budget:request_budget=None):
+    """
+    Scraper class of a job. The async scrapers of a job share its http session across runs, with a
+    connection pool of max_workers connections that stay open for longer than the job interval.
+    With min_workers < max_workers the requests in flight adapt to the upstream in between.
+
+    With a budget every request takes a token. Thread scrapers send their requests themselves,
+    their workers take a token with every identifier they take, see budgeted_identifiers.
+
+    The async scrapers only fetch, every response goes through the parse_response of the thread
+    scraper, so run_avail and run_prices get results of the same shape from both engines.
+    """
+    if http_engine != 'async':
+        if budget is None:
+            return thread_scraper
+        class budgeted_scraper(thread_scraper):
+            def run(self, max_workers:int):
+                identifiers = self.identifiers
+                self.identifiers = budgeted_identifiers(identifiers, budget)
+                try:
+                    return super().run(max_workers=max_workers)
+                finally:
+                    self.identifiers = identifiers
+        return budgeted_scraper
+    parse_func = getattr(thread_scraper, 'parse_response', None)
+    if parse_func is None:
+        logger.warning(f"{thread_scraper.__module__} has no parse_response, the async results are the raw JSON responses")
+    keepalive_seconds = (metrics.intervalSeconds or 3600) + 300
+    session = get_session(jobName, max_workers, keepalive_seconds=keepalive_seconds, min_workers=min_workers)
+    return partial(async_scraper, session=session, budget=budget, parse_func=parse_func)
+
+def job_budget(database:db, jobName:str, request_budget_per_second:float):
+    """Request budget shared by the scrapers of the host next to the database, None without a budget"""
+    if request_budget_per_second <= 0:
+        return None
+    return request_budget(f'{database.name}.budget', request_budget_per_second, jobName)
+
+def stream_scrape(make_scraper, identifiers, max_workers:int, chunk_size:int, writer:db_writer, metrics:run_metrics=None):
+    """
+    Scrape identifiers in chunks of chunk_size and hand every result to the writer,
+    so the results of one chunk are inserted while the next chunk is fetched.
+    """
+    metrics = metrics or run_metrics('stream_scrape')
+    for i in range(0, len(identifiers), chunk_size):
+        chunk = identifiers[i:i + chunk_size]
+        chunk_scraper = make_scraper(chunk)
+        with metrics.timer('fetch'):
+            chunk_scraper.run(max_workers=max_workers)
+        count_requests(metrics, chunk_scraper, len(chunk))
+        # includes waiting for the writer when it falls behind
+        with metrics.timer('parse'):
+            for identifier in chunk_scraper.results.keys():
+                writer.put(chunk_scraper.results[identifier])
+        logger.debug(f"Scraped {min(i + chunk_size, len(identifiers))}/{len(identifiers)} identifiers")
+
+def run_avail(speed:str, max_workers:int, sleep_in_seconds:float, db_pathname:str='./data/db/charging', stream_chunk_size:int=0, delta_keyframe_minutes:float=0, pragmas:dict=None, writer_socket:str=None, shard_availability:bool=False, compact_availability:bool=False, interval_minutes:float=None, metrics_file:str=None, fetch_cache_seconds:float=0, http_engine:str='threads', min_workers:int=None, request_budget_per_second:float=0): 
     logger.info("="*60)
     logger.info(f"Starting availability scrape for speed: {speed}")
     logger.info("="*60)
     
     # create database connection
     database = db(
-        name=db_pathname
+        name=db_pathname,
+        delta_keyframe_minutes=delta_keyframe_minutes,
+        pragmas=pragmas,
+        shard_availability=shard_availability,
+        compact_availability=compact_availability,
+        fetch_cache_seconds=fetch_cache_seconds,
     )
     database.create_db()
-
+    try:
+        frozen = database.freeze_availability_shards()
+    except Exception as e:
+        # freezing can wait for the next run, the availability of this one still has to be logged
+        logger.error(f"Failed to freeze availabilityLog shards: {e}", exc_info=True)
+        frozen = []
+    if frozen:
+        logger.info(f"Froze availabilityLog shards of closed months: {frozen}")
+
+    # timers and counters of the run are stored in scrapeRuns
+    metrics = run_metrics(speed, intervalSeconds=interval_minutes * 60 if interval_minutes else None)
+    with metrics.recording(database, metrics_file=metrics_file):
+        scrape_avail(database, speed, max_workers, sleep_in_seconds, stream_chunk_size, writer_socket, metrics, http_engine, min_workers, request_budget_per_second)
+
+def scrape_avail(database:db, speed:str, max_workers:int, sleep_in_seconds:float, stream_chunk_size:int, writer_socket:str, metrics:run_metrics, http_engine:str='threads', min_workers:int=None, request_budget_per_second:float=0):
     # get locationIds
     locids=database.select_locationIds_by_speed(speed=speed)
     logger.info(f"Found {len(locids)} locations for speed: {speed}")
 
+    # locations another job stored within the fetch cache time are not fetched again
+    recently_fetched = database.select_recently_fetched_locationIds(jobName=speed)
+    if recently_fetched:
+        locids = [locid for locid in locids if locid not in recently_fetched]
+        logger.info(f"Skipping {len(recently_fetched)} locations fetched by other jobs in the last {database.fetch_cache_seconds} seconds, {len(locids)} left")
+
     # setup scraper
     #options = {'timeout': 30, 'sleep_in_seconds': sleep_in_seconds}
     options = {'timeout': (10,10), 'sleep_in_seconds': sleep_in_seconds, 'nmaxtimeouts': 3600,}
-    availability_scraper=avail_scraper(
-        keyword='availability',
-        identifiers=locids,
-        url_re='https://clever.dk/api/chargers/location/{}',
-        out_path='./data/',
-        save_json = False,
-        options = options,
-    )
+    # with the async engine max_workers is the number of requests in flight
+    scraper_class = scraper_factory(http_engine, avail_scraper, speed, max_workers, metrics, min_workers, job_budget(database, speed, request_budget_per_second))
+    def make_scraper(identifiers):
+        return scraper_class(
+            keyword='availability',
+            identifiers=identifiers,
+            url_re='https://clever.dk/api/chargers/location/{}',
+            out_path='./data/',
+            save_json = False,
+            options = options,
+        )
+
+    if writer_socket and stream_chunk_size <= 0:
+        # results reach the writer service through the streaming path
+        stream_chunk_size = max(len(locids), 1)
+
+    if stream_chunk_size > 0:
+        # insert each chunk of locations while the next chunk is scraped
+        logger.info(f"Running availability scraper in streaming mode with chunks of {stream_chunk_size} locations")
+        writer = open_writer(database, 'availability', socket_path=writer_socket, payload_func=lambda v: v['data'], metrics=metrics, runId=metrics.runId)
+        with writer:
+            stream_scrape(make_scraper, locids, max_workers, stream_chunk_size, writer, metrics)
+        ntotalsuccess, ntotalplugs = writer.nsuccess, writer.ntotal
+        metrics.count('rows', ntotalsuccess)
+        metrics.count('failures', max(ntotalplugs - ntotalsuccess, 0))
+        logger.info(f"Availability db-insertion completed for speed: {speed}, Inserted {ntotalsuccess} rows. Found ids for {ntotalplugs} plugs.")
+        return
+
+    availability_scraper=make_scraper(locids)
 
     # run scraper
     logger.info("Running availability scraper")
-    availability_scraper.run(max_workers=max_workers)
+    with metrics.timer('fetch'):
+        availability_scraper.run(max_workers=max_workers)
+    count_requests(metrics, availability_scraper, len(locids))
     availability = availability_scraper.results
     logger.info(f"Scraping completed. Processing {len(availability)} results")
     
     # adding counter to track number of succesfully inserted rows.
     ntotalsuccess = 0
     ntotalplugs = 0 
-    with sqlite3.connect(f'{database.name}.db', timeout=30) as conn:
+    with database.connections.writer(metrics=metrics) as conn, metrics.timer('insert'):
         for locationId in availability.keys():
             v = availability[locationId]['data']
             nlocsuccess, nplugs=database.insert_row_in_availabilityLog_table(
                 conn=conn,
-                loc_avail_query=v
+                loc_avail_query=v,
+                runId=metrics.runId,
             )
             ntotalsuccess += nlocsuccess
             ntotalplugs += nplugs
-    conn.close()
+    metrics.count('rows', ntotalsuccess)
+    metrics.count('failures', max(ntotalplugs - ntotalsuccess, 0))
     logger.info(f"Availability db-insertion completed for speed: {speed}, Inserted {ntotalsuccess} rows. Found ids for {ntotalplugs} plugs.")
 
 
-def run_locations(db_pathname:str='./data/db/charging'):
+def run_locations(db_pathname:str='./data/db/charging', pragmas:dict=None, max_age_hours:float=0, interval_minutes:float=None, metrics_file:str=None):
+    """
+    Scrape all locations and insert new revisions. With max_age_hours > 0 the scrape is skipped
+    if another container synced the locations within that time.
+    """
     logger.info("="*60)
     logger.info("Starting locations scrape")
     logger.info("="*60)
 
+    database=db(name=db_pathname, pragmas=pragmas)
+    database.create_db()
+
+    # containers starting together take turns, the first one syncs and the others find a fresh sync
+    with file_lock(f'{db_pathname}.locations.lock'):
+        if max_age_hours > 0:
+            lastSyncedAt = database.select_lastSyncedAt('locations')
+            if (lastSyncedAt is not None) and (datetime.now(timezone.utc) - lastSyncedAt < timedelta(hours=max_age_hours)):
+                logger.info(f"Locations were synced at {lastSyncedAt} UTC, skipping locations scrape")
+                return
+
+        metrics = run_metrics('Locations', intervalSeconds=interval_minutes * 60 if interval_minutes else None)
+        with metrics.recording(database, metrics_file=metrics_file):
+            scrape_locations(database, metrics)
+
+def scrape_locations(database:db, metrics:run_metrics=None):
+    metrics = metrics or run_metrics('Locations')
     locations_scraper=loc_scraper(
         keyword='locations',
         identifiers=['locations'],
@@ -79,92 +222,168 @@ def run_locations(db_pathname:str='./data/db/charging'):
     )
 
     # Query
-    locations_scraper.run(max_workers = 1)
+    with metrics.timer('fetch'):
+        locations_scraper.run(max_workers = 1)
+    metrics.count('requests')
     locations = locations_scraper.results
     locations=locations[locations_scraper.identifiers[0]]
+    metrics.count('results', len(locations))
     logger.info(f"Retrieved {len(locations)} locations")
     
-    # Insert into database: 
-    database=db(name=db_pathname)
-    database.create_db()
-
-    nmissing_ConnectorCounts = 0
-    with sqlite3.connect(f'{database.name}.db', timeout=30) as conn:
-        for locationId in locations.keys():
-            v = locations[locationId]
-            # insert into locations table
-            database.insert_row_in_locations_table(
-                conn=conn,
-                location=v
-            )
-
-            # insert into connectorGroup table
-            try: 
-                connector_dict = v['connectorCounts']
-            except KeyError:
-                connector_dict = v['plugTypes']
-                nmissing_ConnectorCounts += 1
-
-            for connectorGroup, connectorCount in enumerate(connector_dict):  
-                database.insert_row_in_connectorGroup_table(
-                    conn=conn,
-                    location=v, 
-                    connectorGroup=connectorGroup, 
-                    connectorCount=connectorCount,
-                )
-    conn.close()
+    # Insert into database, the sync time is committed together with the rows
+    with database.connections.writer(metrics=metrics) as conn, metrics.timer('insert'):
+        nlocations, nconnectorGroups, nmissing_ConnectorCounts = database.insert_rows_in_locations_tables(conn, locations)
+        database.update_lastSyncedAt(conn, 'locations', nrows=len(locations))
+    metrics.count('rows', nlocations + nconnectorGroups)
 
+    logger.info(f"Inserted {nlocations} new location revisions and {nconnectorGroups} new connectorGroups")
     logger.warning(f'For {nmissing_ConnectorCounts} locations "connectorCounts" did not exist. Used "plugTypes" instead.')
     logger.info("Locations scrape completed")
 
-def run_prices(max_workers:int, sleep_in_seconds:float, db_pathname:str='./data/db/charging'):
+def run_prices(max_workers:int, sleep_in_seconds:float, db_pathname:str='./data/db/charging', stream_chunk_size:int=0, dedup_price_timetables:bool=False, pragmas:dict=None, writer_socket:str=None, interval_minutes:float=None, metrics_file:str=None, http_engine:str='threads', min_workers:int=None, request_budget_per_second:float=0):
     logger.info("="*60)
     logger.info("Starting pricing scrape for pricing TimeSlots")
     logger.info("="*60)
 
     # create database connection
-    database = db(name=db_pathname)
+    database = db(name=db_pathname, dedup_price_timetables=dedup_price_timetables, pragmas=pragmas)
     database.create_db()
 
+    # timers and counters of the run are stored in scrapeRuns
+    metrics = run_metrics('Prices', intervalSeconds=interval_minutes * 60 if interval_minutes else None)
+    with metrics.recording(database, metrics_file=metrics_file):
+        scrape_prices(database, max_workers, sleep_in_seconds, stream_chunk_size, writer_socket, metrics, http_engine, min_workers, request_budget_per_second)
+
+def scrape_prices(database:db, max_workers:int, sleep_in_seconds:float, stream_chunk_size:int, writer_socket:str, metrics:run_metrics, http_engine:str='threads', min_workers:int=None, request_budget_per_second:float=0):
     # get locationIds
     locids = database.select_all_locationIds()
     logger.info(f"Found {len(locids)} locations for price scraping")
 
+    # resolve known priceGroups with one query instead of one query per plug group
+    with database.connections.reader() as conn:
+        database.load_priceGroup_cache(conn)
+
     # setup scraper
     options = {'timeout': (1,2), 'sleep_in_seconds': sleep_in_seconds, 'nmaxtimeouts': 3600,}
-    prices_scraper = price_scraper(
-        keyword='prices',
-        identifiers=locids,
-        url_re='https://clever.dk/api/v2/chargers/location/{}',
-        out_path='./data/',
-        save_json=False,
-        options=options,
-    )
-
-    # run scraper
-    logger.info("Running prices scraper")
-    prices_scraper.run(max_workers=max_workers)
-    price_data = prices_scraper.results
-    logger.info(f"price scraping completed. Processing {len(price_data)} results")
+    scraper_class = scraper_factory(http_engine, price_scraper, 'Prices', max_workers, metrics, min_workers, job_budget(database, 'Prices', request_budget_per_second))
+    def make_scraper(identifiers):
+        return scraper_class(
+            keyword='prices',
+            identifiers=identifiers,
+            url_re='https://clever.dk/api/v2/chargers/location/{}',
+            out_path='./data/',
+            save_json=False,
+            options=options,
+        )
 
-    # insert into database
-    ntotalsuccess = 0
-    ntotaltotal = 0 
-    with sqlite3.connect(f'{database.name}.db', timeout=30) as conn:
-        for locationId in price_data.keys():
-            plug_data = price_data[locationId]
-            nsuccess, ntotal=database.insert_rows_in_priceTimeSlots_table(
-                conn=conn,
-                plug_data=plug_data)
-            ntotalsuccess += nsuccess
-            ntotaltotal += ntotal
-    conn.close()
+    if writer_socket and stream_chunk_size <= 0:
+        # results reach the writer service through the streaming path
+        stream_chunk_size = max(len(locids), 1)
+
+    if stream_chunk_size > 0:
+        # insert each chunk of locations while the next chunk is scraped
+        logger.info(f"Running prices scraper in streaming mode with chunks of {stream_chunk_size} locations")
+        writer = open_writer(database, 'prices', socket_path=writer_socket, metrics=metrics, runId=metrics.runId)
+        with writer:
+            stream_scrape(make_scraper, locids, max_workers, stream_chunk_size, writer, metrics)
+        ntotalsuccess, ntotaltotal = writer.nsuccess, writer.ntotal
+    else:
+        prices_scraper = make_scraper(locids)
+
+        # run scraper
+        logger.info("Running prices scraper")
+        with metrics.timer('fetch'):
+            prices_scraper.run(max_workers=max_workers)
+        count_requests(metrics, prices_scraper, len(locids))
+        price_data = prices_scraper.results
+        logger.info(f"price scraping completed. Processing {len(price_data)} results")
+
+        # insert into database
+        ntotalsuccess = 0
+        ntotaltotal = 0 
+        with database.connections.writer(metrics=metrics) as conn, metrics.timer('insert'):
+            for locationId in price_data.keys():
+                plug_data = price_data[locationId]
+                nsuccess, ntotal=database.insert_rows_in_priceTimeSlots_table(
+                    conn=conn,
+                    plug_data=plug_data,
+                    runId=metrics.runId)
+                ntotalsuccess += nsuccess
+                ntotaltotal += ntotal
     
     nfailures = ntotaltotal - ntotalsuccess
+    metrics.count('rows', ntotalsuccess)
+    metrics.count('failures', nfailures)
     logger.info(f"Prices db-insertion completed. Inserted {ntotalsuccess} rows")
     if nfailures > 0: 
         logger.warning(f'price scraper had a total of {nfailures} failures when trying to insert data.')
 
+# Job table of the single-process mode, 'type:minute_interval:max_workers:sleep_in_seconds' separated by ';'
+# max_workers and sleep_in_seconds are optional. Mirrors the services in compose.yml.
+DEFAULT_JOBS = 'rapid:5:1:0.1;fast:15:1:0.1;standard:60:1:0.1;prices:60:1:0.5;locations:10080'
+
+def parse_jobs(jobs_string:str):
+    """Parse a job table like 'rapid:5:1:0.1;locations:10080' into a list of job dicts"""
+    jobs = []
+    for job in jobs_string.split(';'):
+        if not job.strip():
+            continue
+        fields = [field.strip() for field in job.split(':')]
+        scraper_type = fields[0].capitalize()
+        if scraper_type not in ['Rapid', 'Fast', 'Standard', 'Prices', 'Locations']:
+            raise ValueError(f"Unknown scraper type '{fields[0]}' in job table")
+        jobs.append({
+            'type': scraper_type,
+            'minute_interval': float(fields[1]),
+            'max_workers': int(fields[2]) if len(fields) > 2 else 1,
+            'sleep_in_seconds': float(fields[3]) if len(fields) > 3 else 0.0,
+        })
+    return jobs
+
+def add_jobs(scheduler, jobs:list, db_pathname:str, stream_chunk_size:int=0, delta_keyframe_minutes:float=0, dedup_price_timetables:bool=False, pragmas:dict=None, writer_socket:str=None, shard_availability:bool=False, compact_availability:bool=False, metrics_file:str=None, fetch_cache_seconds:float=0, http_engine:str='threads', min_workers:int=None, request_budget_per_second:float=0):
+    """
+    Register every job of a job table on one scheduler. The jobs run in the scheduler's thread pool
+    and share the process' connection manager, so their writes are serialized by its writer lock.
+    """
+    for i, job in enumerate(jobs):
+        if job['type'] == 'Locations':
+            func = run_locations
+            kwargs = {'db_pathname': db_pathname, 'pragmas': pragmas, 'max_age_hours': 0, 'interval_minutes': job['minute_interval'], 'metrics_file': metrics_file}
+            first_run = None # locations are scraped on startup
+        elif job['type'] == 'Prices':
+            func = run_prices
+            kwargs = {
+                'max_workers': job['max_workers'], 'sleep_in_seconds': job['sleep_in_seconds'], 'db_pathname': db_pathname,
+                'stream_chunk_size': stream_chunk_size, 'dedup_price_timetables': dedup_price_timetables, 'pragmas': pragmas,
+                'writer_socket': writer_socket, 'interval_minutes': job['minute_interval'], 'metrics_file': metrics_file,
+                'http_engine': http_engine, 'min_workers': min_workers, 'request_budget_per_second': request_budget_per_second,
+            }
+            first_run = datetime.now() + timedelta(seconds=1 + 5 * i) # staggered, so jobs do not start scraping at once
+        else:
+            func = run_avail
+            kwargs = {
+                'speed': job['type'], 'max_workers': job['max_workers'], 'sleep_in_seconds': job['sleep_in_seconds'], 'db_pathname': db_pathname,
+                'stream_chunk_size': stream_chunk_size, 'delta_keyframe_minutes': delta_keyframe_minutes, 'pragmas': pragmas,
+                'writer_socket': writer_socket, 'shard_availability': shard_availability, 'compact_availability': compact_availability,
+                'interval_minutes': job['minute_interval'], 'metrics_file': metrics_file, 'fetch_cache_seconds': fetch_cache_seconds,
+                'http_engine': http_engine, 'min_workers': min_workers, 'request_budget_per_second': request_budget_per_second,
+            }
+            first_run = datetime.now() + timedelta(seconds=1 + 5 * i)
+
+        logger.info(f"  - {job['type']}: every {job['minute_interval']} minutes, {job['max_workers']} workers, sleep {job['sleep_in_seconds']} seconds")
+        scheduler.add_job(
+            func=func,
+            kwargs=kwargs,
+            trigger=IntervalTrigger(minutes=job['minute_interval']),
+            id=f"{job['type']}_scraper",
+            name=f"{job['type']} Scraper",
+            max_instances=1,  # Prevents overlaps
+            coalesce=True,
+            misfire_grace_time=300,
+            next_run_time=first_run,
+        )
+    return scheduler
+
 def run_scraper_schedule(scheduler_class=BlockingScheduler):
     # Initialize logging FIRST, before any other code runs
     setup_logging()
@@ -181,9 +400,24 @@ def run_scraper_schedule(scheduler_class=BlockingScheduler):
     max_workers = int(os.environ.get('MAX_WORKERS', 1))
     sleep_in_seconds = float(os.environ.get('SLEEP_IN_SECONDS', 0.0))
     db_pathname = os.environ.get('DB_PATHNAME', './data/db/charging')
+    stream_chunk_size = int(os.environ.get('STREAM_CHUNK_SIZE', 0)) # 0 disables streaming inserts
+    delta_keyframe_minutes = float(os.environ.get('DELTA_KEYFRAME_MINUTES', 0)) # 0 logs every status, not only changes
+    dedup_price_timetables = bool(int(os.environ.get('DEDUP_PRICE_TIMETABLES', 0))) # 1 only stores timetable changes
+    pragmas = parse_pragmas(os.environ.get('SQLITE_PRAGMAS', '')) # e.g. 'cache_size=-32000;mmap_size=0'
+    locations_max_age_hours = float(os.environ.get('LOCATIONS_MAX_AGE_HOURS', 0)) # 0 always scrapes locations on startup
+    writer_socket = os.environ.get('WRITER_SOCKET') # send writes to the writer service listening on this socket
+    shard_availability = bool(int(os.environ.get('SHARD_AVAILABILITY_LOG', 0))) # 1 writes availabilityLog into monthly shard files
+    compact_availability = bool(int(os.environ.get('COMPACT_AVAILABILITY_LOG', 0))) # 1 writes availabilityLog rows in the compact layout
+    metrics_file = os.environ.get('METRICS_FILE') # Prometheus textfile with the latest run of every job, unset disables
+    fetch_cache_seconds = float(os.environ.get('FETCH_CACHE_SECONDS', 0)) # > 0 skips locations another availability job stored within that time
+    http_engine = os.environ.get('HTTP_ENGINE', 'threads').lower() # 'async' fetches with asyncio, MAX_WORKERS requests in flight
+    request_budget_per_second = float(os.environ.get('REQUEST_BUDGET_PER_SECOND', 0)) # requests per second of all scrapers sharing the database volume, 0 disables
+    min_workers = int(os.environ['MIN_WORKERS']) if os.environ.get('MIN_WORKERS') else None # async engine adapts the requests in flight between MIN_WORKERS and MAX_WORKERS, unset keeps MAX_WORKERS
     
-    # On startup always populate locations table, and initialize database if it does not exist
-    run_locations(db_pathname=db_pathname)
+    # On startup populate locations table unless a recent sync exists, and initialize database if it does not exist.
+    # The writer service only writes what the scrapers send, it creates the database itself.
+    if speed != 'Writer':
+        run_locations(db_pathname=db_pathname, pragmas=pragmas, max_age_hours=locations_max_age_hours, metrics_file=metrics_file)
 
     if (run_mode == 'scheduled') and (speed in ['Standard', 'Fast', 'Rapid']):
         logger.info('Initializing run schedule')
@@ -198,7 +432,13 @@ def run_scraper_schedule(scheduler_class=BlockingScheduler):
         scheduler = scheduler_class()
         scheduler.add_job(
             func=run_avail,
-            args = [speed, max_workers, sleep_in_seconds, db_pathname], #args to funcs
+            kwargs = {
+                'speed': speed, 'max_workers': max_workers, 'sleep_in_seconds': sleep_in_seconds, 'db_pathname': db_pathname,
+                'stream_chunk_size': stream_chunk_size, 'delta_keyframe_minutes': delta_keyframe_minutes, 'pragmas': pragmas,
+                'writer_socket': writer_socket, 'shard_availability': shard_availability, 'compact_availability': compact_availability,
+                'interval_minutes': minute_interval, 'metrics_file': metrics_file, 'fetch_cache_seconds': fetch_cache_seconds,
+                'http_engine': http_engine, 'min_workers': min_workers, 'request_budget_per_second': request_budget_per_second,
+            }, #args to funcs
             trigger = IntervalTrigger(minutes=minute_interval),  # Fixed intervals!
             id = 'Availability_scraper',
             name = f'{speed} Availability Scraper',
@@ -228,7 +468,7 @@ def run_scraper_schedule(scheduler_class=BlockingScheduler):
         scheduler = scheduler_class()
         scheduler.add_job(
             func=run_locations,
-            args = [db_pathname],
+            kwargs = {'db_pathname': db_pathname, 'pragmas': pragmas, 'max_age_hours': 0, 'interval_minutes': location_day_interval * 24 * 60, 'metrics_file': metrics_file},
             trigger = IntervalTrigger(days=location_day_interval),  # Fixed intervals!
             id = 'locations_scraper',
             name = 'locations Scraper',
@@ -257,7 +497,12 @@ def run_scraper_schedule(scheduler_class=BlockingScheduler):
         scheduler = scheduler_class()
         scheduler.add_job(
             func=run_prices,
-            args = [max_workers, sleep_in_seconds, db_pathname], #args to funcs
+            kwargs = {
+                'max_workers': max_workers, 'sleep_in_seconds': sleep_in_seconds, 'db_pathname': db_pathname,
+                'stream_chunk_size': stream_chunk_size, 'dedup_price_timetables': dedup_price_timetables, 'pragmas': pragmas,
+                'writer_socket': writer_socket, 'interval_minutes': minute_interval, 'metrics_file': metrics_file,
+                'http_engine': http_engine, 'min_workers': min_workers, 'request_budget_per_second': request_budget_per_second,
+            }, #args to funcs
             trigger = IntervalTrigger(minutes=minute_interval),  # Fixed intervals!
             id = 'Prices_scraper',
             name = f'Prices Scraper',
@@ -276,6 +521,38 @@ def run_scraper_schedule(scheduler_class=BlockingScheduler):
         except (KeyboardInterrupt, SystemExit):
             logger.info("Scrape schedule was shutdown")
 
+    elif (run_mode == 'scheduled') and (speed == 'All'):
+        jobs = parse_jobs(os.environ.get('JOBS', DEFAULT_JOBS))
+        logger.info('Initializing run schedule')
+        logger.info(f"Schedule configuration: {len(jobs)} jobs in one process")
+
+        scheduler = add_jobs(
+            scheduler=scheduler_class(),
+            jobs=jobs,
+            db_pathname=db_pathname,
+            stream_chunk_size=stream_chunk_size,
+            delta_keyframe_minutes=delta_keyframe_minutes,
+            dedup_price_timetables=dedup_price_timetables,
+            pragmas=pragmas,
+            writer_socket=writer_socket,
+            shard_availability=shard_availability,
+            compact_availability=compact_availability,
+            metrics_file=metrics_file,
+            fetch_cache_seconds=fetch_cache_seconds,
+            http_engine=http_engine,
+            min_workers=min_workers,
+            request_budget_per_second=request_budget_per_second,
+        )
+
+        logger.info("Schedule initialized. Starting scheduled execution loop")
+
+        # Keep running scheduled tasks
+        try:
+            scheduler.start() # blocks if BlockingScheduler is used
+            return scheduler # if BackgroundScheduler is used returns scheduler (used for testing)
+        except (KeyboardInterrupt, SystemExit):
+            logger.info("Scrape schedule was shutdown")
+
 
     elif (run_mode == 'once') and (speed == 'Locations'):
         logger.info('Ran locations scraper.')
@@ -294,6 +571,17 @@ def run_scraper_schedule(scheduler_class=BlockingScheduler):
             max_workers=max_workers, 
             sleep_in_seconds=sleep_in_seconds,
             db_pathname=db_pathname,
+            stream_chunk_size=stream_chunk_size,
+            delta_keyframe_minutes=delta_keyframe_minutes,
+            pragmas=pragmas,
+            writer_socket=writer_socket,
+            shard_availability=shard_availability,
+            compact_availability=compact_availability,
+            metrics_file=metrics_file,
+            fetch_cache_seconds=fetch_cache_seconds,
+            http_engine=http_engine,
+            min_workers=min_workers,
+            request_budget_per_second=request_budget_per_second,
         )
 
     elif (run_mode == 'once' and (speed == 'Prices')):
@@ -307,8 +595,71 @@ def run_scraper_schedule(scheduler_class=BlockingScheduler):
         run_prices(
             max_workers=max_workers,
             sleep_in_seconds=sleep_in_seconds,
-            db_pathname=db_pathname
+            db_pathname=db_pathname,
+            stream_chunk_size=stream_chunk_size,
+            dedup_price_timetables=dedup_price_timetables,
+            pragmas=pragmas,
+            writer_socket=writer_socket,
+            metrics_file=metrics_file,
+            http_engine=http_engine,
+            min_workers=min_workers,
+            request_budget_per_second=request_budget_per_second,
+        )
+
+    elif (run_mode == 'once') and (speed == 'All'):
+        logger.info('Running every job of the job table once')
+        for job in parse_jobs(os.environ.get('JOBS', DEFAULT_JOBS)):
+            if job['type'] == 'Prices':
+                run_prices(
+                    max_workers=job['max_workers'],
+                    sleep_in_seconds=job['sleep_in_seconds'],
+                    db_pathname=db_pathname,
+                    stream_chunk_size=stream_chunk_size,
+                    dedup_price_timetables=dedup_price_timetables,
+                    pragmas=pragmas,
+                    writer_socket=writer_socket,
+                    metrics_file=metrics_file,
+                    http_engine=http_engine,
+                    min_workers=min_workers,
+                    request_budget_per_second=request_budget_per_second,
+                )
+            elif job['type'] != 'Locations': # locations already ran on startup
+                run_avail(
+                    speed=job['type'],
+                    max_workers=job['max_workers'],
+                    sleep_in_seconds=job['sleep_in_seconds'],
+                    db_pathname=db_pathname,
+                    stream_chunk_size=stream_chunk_size,
+                    delta_keyframe_minutes=delta_keyframe_minutes,
+                    pragmas=pragmas,
+                    writer_socket=writer_socket,
+                    shard_availability=shard_availability,
+                    compact_availability=compact_availability,
+                    metrics_file=metrics_file,
+                    fetch_cache_seconds=fetch_cache_seconds,
+                    http_engine=http_engine,
+                    min_workers=min_workers,
+                    request_budget_per_second=request_budget_per_second,
+                )
+
+    elif speed == 'Writer':
+        socket_path = writer_socket or f'{db_pathname}.sock'
+        logger.info(f"Starting writer service on {socket_path}")
+
+        # the writer service owns the write-side settings, scraper processes only send their results
+        database = db(
+            name=db_pathname,
+            delta_keyframe_minutes=delta_keyframe_minutes,
+            dedup_price_timetables=dedup_price_timetables,
+            pragmas=pragmas,
+            shard_availability=shard_availability,
+            compact_availability=compact_availability,
+            fetch_cache_seconds=fetch_cache_seconds,
         )
+        database.create_db()
+        with database.connections.reader() as conn:
+            database.load_priceGroup_cache(conn)
+        run_writer_service(database, socket_path)
 
     else:
         logger.warning(f"Scraper configs could not be resolved.")
\ No newline at end of file
@@ -0,0 +1,117 @@
+import os
+import re
+import glob
+import stat
+import sqlite3
+import logging
+from datetime import datetime, timezone
+
+# Create module-level logger
+logger = logging.getLogger(__name__)
+
+# availabilityLog columns shared by the main table and the shard tables
+SHARD_COLUMNS = ['locationId', 'revision', 'evseId', 'createdAt', 'status', 'timestamp', 'runId']
+
+# columns added to the shard table after shards were first written, older shards do not have them
+SHARD_ADDED_COLUMNS = {'runId': 'INTEGER'}
+
+# rowids of a shard are offset by its month (YYYYMM << 40), so logIds keep increasing across shards
+_LOGID_SHIFT = 40
+
+def shard_month(when:datetime=None):
+    """Month of the shard rows written at `when` (default now) belong to, like '2026_10'"""
+    when = when or datetime.now(timezone.utc)
+    return when.strftime("%Y_%m")
+
+def shard_path(db_name:str, month:str):
+    """File of the availabilityLog shard of a month, next to the main database"""
+    return f'{db_name}_availabilityLog_{month}.db'
+
+def shard_schema(month:str):
+    """Name the shard of a month is attached under"""
+    return f'shard_{month}'
+
+def list_shard_months(db_name:str):
+    """Months that have a shard file, oldest first"""
+    pattern = re.compile(r'_availabilityLog_(\d{4}_\d{2})\.db$')
+    months = []
+    for path in glob.glob(f'{glob.escape(db_name)}_availabilityLog_*.db'):
+        match = pattern.search(path)
+        if match:
+            months.append(match.group(1))
+    return sorted(months)
+
+def attached_shard_months(conn):
+    """Months of the shards attached on a connection"""
+    return sorted(name[len('shard_'):] for _, name, _ in conn.execute("PRAGMA database_list") if name.startswith('shard_'))
+
+def is_frozen(db_name:str, month:str):
+    """Frozen shards are made read-only files"""
+    return not (os.stat(shard_path(db_name, month)).st_mode & stat.S_IWUSR)
+
+def create_shard(db_name:str, month:str, create_script:str):
+    """Create the shard file of a month if it does not exist yet"""
+    path = shard_path(db_name, month)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        # a shard written before a column was added gets it before the script indexes it
+        existing_columns = set(row[1] for row in conn.execute("PRAGMA table_info(availabilityLog)"))
+        if existing_columns:
+            for column, column_type in SHARD_ADDED_COLUMNS.items():
+                if column not in existing_columns:
+                    conn.execute(f"ALTER TABLE availabilityLog ADD COLUMN {column} {column_type}")
+        conn.executescript(create_script)
+    finally:
+        conn.close()
+    return path
+
+def attach_shard(conn, db_name:str, month:str, read_only:bool=False):
+    """ATTACH the shard of a month, not possible inside a transaction"""
+    path = os.path.abspath(shard_path(db_name, month))
+    if read_only:
+        # frozen shards never change, immutable skips locking them
+        mode = 'ro&immutable=1' if is_frozen(db_name, month) else 'ro'
+        conn.execute(f"ATTACH DATABASE 'file:{path}?mode={mode}' AS {shard_schema(month)}")
+    else:
+        conn.execute(f"ATTACH DATABASE ? AS {shard_schema(month)}", (path,))
+    logger.debug(f"Attached availabilityLog shard {month}")
+
+def detach_shard(conn, month:str):
+    conn.execute(f"DETACH DATABASE {shard_schema(month)}")
+    logger.debug(f"Detached availabilityLog shard {month}")
+
+def missing_shard_columns(conn, month:str):
+    """Columns of SHARD_ADDED_COLUMNS the attached shard of a month does not have, frozen shards are never altered"""
+    existing_columns = set(row[1] for row in conn.execute(f"PRAGMA {shard_schema(month)}.table_info(availabilityLog)"))
+    return [column for column in SHARD_ADDED_COLUMNS if column not in existing_columns]
+
+def union_view_sql(months:list, extra_selects:list=(), missing_columns:dict=None):
+    """
+    TEMP availabilityLog view over the main table and the shards of months, with a logId instead of rowid.
+    extra_selects are other sources in the same (logId, *SHARD_COLUMNS) shape.
+    missing_columns maps a month to the columns its shard does not have, they are read as NULL.
+    """
+    missing_columns = missing_columns or {}
+    selects = [f"SELECT rowid AS logId, {', '.join(SHARD_COLUMNS)} FROM main.availabilityLog"]
+    for month in months:
+        offset = int(month.replace('_', '')) << _LOGID_SHIFT
+        columns = ', '.join(
+            f'NULL AS {column}' if column in missing_columns.get(month, ()) else column
+            for column in SHARD_COLUMNS
+        )
+        selects.append(f"SELECT {offset} + rowid, {columns} FROM {shard_schema(month)}.availabilityLog")
+    selects += list(extra_selects)
+    return "CREATE TEMP VIEW availabilityLog AS\n" + "\nUNION ALL\n".join(selects)
+
+def freeze_shard(db_name:str, month:str):
+    """Vacuum a closed shard and make it a read-only file, it is then safe to copy or replicate as is"""
+    path = shard_path(db_name, month)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE") # no -wal and -shm files next to a read-only file
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    logger.info(f"Froze availabilityLog shard {month} at {path}")
@@ -0,0 +1,10 @@
+-- Latest job that stored the availability of a location, shared by the availability jobs of all containers.
+-- With db(fetch_cache_seconds > 0) other jobs neither fetch nor store the location again within that time.
+CREATE TABLE IF NOT EXISTS availabilityFetches (
+    locationId TEXT PRIMARY KEY,
+    jobName TEXT, -- jobName of the run in scrapeRuns, NULL for rows written outside a run
+    storedAt INTEGER NOT NULL, -- unix epoch seconds
+    runId INTEGER REFERENCES scrapeRuns(runId)
+);
+
+CREATE INDEX IF NOT EXISTS idx_availabilityFetches_storedAt ON availabilityFetches(storedAt, jobName);
\ No newline at end of file
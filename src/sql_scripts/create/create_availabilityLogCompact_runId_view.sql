@@ -0,0 +1,14 @@
+-- availabilityLogCompact_view with the runId this migration adds to availabilityLogCompact
+DROP VIEW IF EXISTS availabilityLogCompact_view;
+CREATE VIEW availabilityLogCompact_view AS
+SELECT 
+  k.locationId,
+  k.revision,
+  k.evseId,
+  datetime(a.createdAt, 'unixepoch') AS createdAt,
+  s.status,
+  CASE WHEN typeof(a.timestamp) = 'integer' THEN strftime('%Y-%m-%dT%H:%M:%SZ', a.timestamp, 'unixepoch') ELSE a.timestamp END AS timestamp,
+  a.runId
+FROM availabilityLogCompact a
+JOIN evseKeys k ON k.evseKey = a.evseKey
+LEFT JOIN statusEnum s ON s.statusId = a.statusId
\ No newline at end of file
@@ -0,0 +1,37 @@
+-- Compact availabilityLog layout, used by db(compact_availability=True).
+-- Evses and statuses get integer surrogate keys and times are stored as unix epoch seconds.
+CREATE TABLE IF NOT EXISTS evseKeys (
+    evseKey INTEGER PRIMARY KEY,
+    locationId TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    evseId TEXT NOT NULL,
+    UNIQUE (locationId, revision, evseId),
+    FOREIGN KEY (locationId, revision, evseId) 
+        REFERENCES evseIds(locationId, revision, evseId)
+);
+
+CREATE TABLE IF NOT EXISTS statusEnum (
+    statusId INTEGER PRIMARY KEY,
+    status TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS availabilityLogCompact (
+    evseKey INTEGER NOT NULL REFERENCES evseKeys(evseKey),
+    createdAt INTEGER NOT NULL, -- unix epoch seconds
+    statusId INTEGER REFERENCES statusEnum(statusId),
+    timestamp INTEGER, -- unix epoch seconds, kept as text if it is not in the '%Y-%m-%dT%H:%M:%SZ' format
+    PRIMARY KEY (evseKey, createdAt)
+) WITHOUT ROWID;
+
+-- availabilityLogCompact in the column shape of availabilityLog
+CREATE VIEW IF NOT EXISTS availabilityLogCompact_view AS
+SELECT 
+  k.locationId,
+  k.revision,
+  k.evseId,
+  datetime(a.createdAt, 'unixepoch') AS createdAt,
+  s.status,
+  CASE WHEN typeof(a.timestamp) = 'integer' THEN strftime('%Y-%m-%dT%H:%M:%SZ', a.timestamp, 'unixepoch') ELSE a.timestamp END AS timestamp
+FROM availabilityLogCompact a
+JOIN evseKeys k ON k.evseKey = a.evseKey
+LEFT JOIN statusEnum s ON s.statusId = a.statusId
\ No newline at end of file
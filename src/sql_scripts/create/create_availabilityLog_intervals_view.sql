@@ -0,0 +1,13 @@
+-- Rebuilds the status time series from availabilityLog, also when only status changes are logged.
+-- Every row is valid from its createdAt until the next row of the same evse.
+CREATE VIEW IF NOT EXISTS availabilityLog_intervals AS
+SELECT 
+  rowid AS logId,
+  locationId,
+  revision,
+  evseId,
+  status,
+  timestamp,
+  createdAt AS validFrom,
+  LEAD(createdAt) OVER (PARTITION BY locationId, evseId ORDER BY createdAt, rowid) AS validTo
+FROM availabilityLog;
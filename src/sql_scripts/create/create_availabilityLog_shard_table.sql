@@ -0,0 +1,14 @@
+-- availabilityLog in a monthly shard file. SQLite has no foreign keys across database files,
+-- the evseIds are upserted in the main database before their rows are written here.
+CREATE TABLE IF NOT EXISTS availabilityLog (
+    locationId TEXT, 
+    revision INTEGER,
+    evseId TEXT, 
+    createdAt DATETIME DEFAULT CURRENT_TIMESTAMP,
+    status TEXT, 
+    timestamp TEXT,
+    runId INTEGER -- run that wrote the row, see scrapeRuns in the main database
+);
+
+CREATE INDEX IF NOT EXISTS idx_availabilityLog_location_evse_createdAt ON availabilityLog(locationId, evseId, createdAt);
+CREATE INDEX IF NOT EXISTS idx_availabilityLog_runId ON availabilityLog(runId) WHERE runId IS NOT NULL;
\ No newline at end of file
@@ -0,0 +1,20 @@
+-- Newest revision of every location, kept up to date by a trigger on locations,
+-- so location lookups do not aggregate all of locations.
+CREATE TABLE IF NOT EXISTS latestRevision (
+    locationId TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_latestRevision
+AFTER INSERT ON locations
+BEGIN
+    INSERT INTO latestRevision (locationId, revision) VALUES (NEW.locationId, NEW.revision)
+    ON CONFLICT(locationId) DO UPDATE SET revision = excluded.revision
+    WHERE excluded.revision > latestRevision.revision;
+END;
+
+-- locations inserted before the trigger existed
+INSERT OR REPLACE INTO latestRevision (locationId, revision)
+SELECT locationId, MAX(revision) FROM locations GROUP BY locationId;
+
+CREATE INDEX IF NOT EXISTS idx_connectorGroups_speed_location_revision ON connectorGroups(speed, locationId, revision)
\ No newline at end of file
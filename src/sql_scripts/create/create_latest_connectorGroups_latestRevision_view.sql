@@ -0,0 +1,7 @@
+-- latest_connector_groups on top of latestRevision instead of aggregating locations
+DROP VIEW IF EXISTS latest_connector_groups;
+CREATE VIEW latest_connector_groups AS
+SELECT cg.*
+FROM latestRevision lr
+INNER JOIN connectorGroups cg
+ON lr.locationId = cg.locationId AND lr.revision = cg.revision
\ No newline at end of file
@@ -11,6 +11,8 @@ CREATE TABLE IF NOT EXISTS priceTimeSlots (
     is_next_day BOOLEAN,
     createdAt DATETIME DEFAULT CURRENT_TIMESTAMP,
     timeTableRawData TEXT,
+    firstSeenAt DATETIME, -- first run the slot was seen in (only set for deduplicated timetables)
+    lastSeenAt DATETIME, -- latest run the slot was seen in (only set for deduplicated timetables)
     
     FOREIGN KEY (priceGroupId) REFERENCES priceGroups(priceGroupId) ON DELETE CASCADE
 );
@@ -0,0 +1,11 @@
+-- Fingerprint of the latest stored timetable per priceGroup, used to skip unchanged timetables.
+CREATE TABLE IF NOT EXISTS priceTimetables (
+    priceGroupId INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    firstSeenAt DATETIME, -- first run the timetable was seen in
+    lastSeenAt DATETIME, -- latest run the timetable was seen in
+    FOREIGN KEY (priceGroupId) REFERENCES priceGroups(priceGroupId) ON DELETE CASCADE
+);
+
+-- Slots of the latest stored timetable are looked up by their lastSeenAt
+CREATE INDEX IF NOT EXISTS idx_price_timeslots_group_lastseen ON priceTimeSlots(priceGroupId, lastSeenAt);
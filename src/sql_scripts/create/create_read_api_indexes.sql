@@ -0,0 +1,6 @@
+-- Indexes of the read API of db (iter_status_history, iter_occupancy, iter_current_prices)
+-- the status history reads status and timestamp through the rowid, so the availabilityLog index is not a second copy of every row
+CREATE INDEX IF NOT EXISTS idx_availabilityLog_location_evse_createdAt ON availabilityLog(locationId, evseId, createdAt);
+CREATE INDEX IF NOT EXISTS idx_availabilityAggregated_location_createdAt ON availabilityAggregated(locationId, createdAt, connectorGroup, availableCount, totalCount);
+-- the newest timetable of a priceGroup, lastSeenAt is only set for deduplicated timetables
+CREATE INDEX IF NOT EXISTS idx_price_timeslots_group_seenAt ON priceTimeSlots(priceGroupId, COALESCE(lastSeenAt, createdAt), isCurrent)
\ No newline at end of file
@@ -0,0 +1,5 @@
+-- The rows of one run are found by its runId and read through the rowid, rows written before runIds existed are not indexed
+CREATE INDEX IF NOT EXISTS idx_availabilityLog_runId ON availabilityLog(runId) WHERE runId IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_availabilityAggregated_runId ON availabilityAggregated(runId) WHERE runId IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_availabilityLogCompact_runId ON availabilityLogCompact(runId) WHERE runId IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_price_timeslots_runId ON priceTimeSlots(runId, priceGroupId) WHERE runId IS NOT NULL
\ No newline at end of file
@@ -0,0 +1,22 @@
+-- One row per run of a scraper job with its phase timers and counters, see run_metrics.py
+CREATE TABLE IF NOT EXISTS scrapeRuns (
+    runId INTEGER PRIMARY KEY AUTOINCREMENT,
+    jobName TEXT NOT NULL,
+    startedAt DATETIME NOT NULL,
+    finishedAt DATETIME, -- NULL while running, or when the run was killed
+    status TEXT, -- 'ok' or 'failed'
+    intervalSeconds REAL, -- scheduled interval of the job, NULL for runs that are not scheduled
+    totalSeconds REAL,
+    fetchSeconds REAL,
+    parseSeconds REAL,
+    lock_waitSeconds REAL,
+    insertSeconds REAL,
+    commitSeconds REAL,
+    nrequests INTEGER,
+    ntimeouts INTEGER,
+    nresults INTEGER,
+    nrows INTEGER,
+    nfailures INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_scrapeRuns_job_startedAt ON scrapeRuns(jobName, startedAt);
\ No newline at end of file
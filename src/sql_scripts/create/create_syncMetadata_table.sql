@@ -0,0 +1,6 @@
+-- Last successful run of jobs shared by all containers, e.g. the locations sync
+CREATE TABLE IF NOT EXISTS syncMetadata (
+    syncName TEXT PRIMARY KEY,
+    lastSyncedAt DATETIME NOT NULL,
+    nrows INTEGER -- number of rows received in the sync
+);
\ No newline at end of file
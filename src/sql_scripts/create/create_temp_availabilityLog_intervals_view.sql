@@ -0,0 +1,13 @@
+-- availabilityLog_intervals over the TEMP availabilityLog view of the attached shards,
+-- the view has no rowid so its logId orders the rows instead.
+CREATE TEMP VIEW availabilityLog_intervals AS
+SELECT 
+  logId,
+  locationId,
+  revision,
+  evseId,
+  status,
+  timestamp,
+  createdAt AS validFrom,
+  LEAD(createdAt) OVER (PARTITION BY locationId, evseId ORDER BY createdAt, logId) AS validTo
+FROM availabilityLog;
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- Batches the writer service clients sent, recorded in the transaction of their rows. A client writing a batch
+-- directly after the service did not answer finds it here if the service committed it anyway.
+CREATE TABLE IF NOT EXISTS writerBatches (
+    batchId TEXT PRIMARY KEY,
+    nsuccess INTEGER,
+    ntotal INTEGER,
+    createdAt INTEGER NOT NULL -- unix epoch seconds
+);
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- Counts are computed in python per (plugType, speed) and matched to the connectorGroup of the revision.
+INSERT INTO availabilityAggregated (locationId, revision, connectorGroup, availableCount, totalCount, runId)
+SELECT locationId, revision, connectorGroup, ?, ?, ?
+FROM connectorGroups
+WHERE locationId = ?
+AND revision = ?
+AND plugType IS ?
+AND speed IS ?;
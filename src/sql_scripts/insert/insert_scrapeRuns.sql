@@ -0,0 +1,2 @@
+INSERT INTO scrapeRuns (jobName, startedAt, intervalSeconds)
+VALUES (?, ?, ?);
\ No newline at end of file
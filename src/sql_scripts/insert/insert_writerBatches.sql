@@ -0,0 +1,3 @@
+-- Changes no row if the batch was already written
+INSERT OR IGNORE INTO writerBatches (batchId, createdAt)
+VALUES (?, ?);
\ No newline at end of file
@@ -0,0 +1,10 @@
+-- Claims storing the availability of a location. The claim of another job is only taken over once it is
+-- older than the fetch cache time, the statement then changes no row.
+INSERT INTO availabilityFetches (locationId, jobName, storedAt, runId)
+VALUES (?, (SELECT jobName FROM scrapeRuns WHERE runId = ?), ?, ?)
+ON CONFLICT(locationId) DO UPDATE SET
+    jobName = excluded.jobName,
+    storedAt = excluded.storedAt,
+    runId = excluded.runId
+WHERE availabilityFetches.jobName = excluded.jobName
+OR excluded.storedAt - availabilityFetches.storedAt >= ?;
\ No newline at end of file
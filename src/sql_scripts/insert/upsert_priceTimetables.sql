@@ -0,0 +1,7 @@
+-- firstSeenAt is only reset when the timetable changed
+INSERT INTO priceTimetables (priceGroupId, fingerprint, firstSeenAt, lastSeenAt)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(priceGroupId) DO UPDATE SET
+    firstSeenAt = CASE WHEN fingerprint = excluded.fingerprint THEN firstSeenAt ELSE excluded.firstSeenAt END,
+    fingerprint = excluded.fingerprint,
+    lastSeenAt = excluded.lastSeenAt;
@@ -0,0 +1,5 @@
+INSERT INTO syncMetadata (syncName, lastSyncedAt, nrows)
+VALUES (?, ?, ?)
+ON CONFLICT(syncName) DO UPDATE SET
+    lastSyncedAt = excluded.lastSyncedAt,
+    nrows = excluded.nrows;
\ No newline at end of file
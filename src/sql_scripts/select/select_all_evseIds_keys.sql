@@ -0,0 +1,2 @@
+SELECT locationId, revision, evseId
+FROM evseIds;
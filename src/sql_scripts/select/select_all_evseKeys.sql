@@ -0,0 +1 @@
+SELECT evseKey, locationId, revision, evseId FROM evseKeys;
\ No newline at end of file
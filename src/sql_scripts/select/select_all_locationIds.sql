@@ -1,4 +1,7 @@
-
-SELECT DISTINCT locationId
-FROM latest_connector_groups
-ORDER BY locationId;
\ No newline at end of file
+SELECT lr.locationId
+FROM latestRevision lr
+WHERE EXISTS (
+  SELECT 1 FROM connectorGroups cg
+  WHERE cg.locationId = lr.locationId AND cg.revision = lr.revision
+)
+ORDER BY lr.locationId;
\ No newline at end of file
@@ -0,0 +1,2 @@
+SELECT locationId, evseIdsHash, priceGroupId
+FROM priceGroups;
@@ -0,0 +1,2 @@
+SELECT priceGroupId, fingerprint, lastSeenAt
+FROM priceTimetables;
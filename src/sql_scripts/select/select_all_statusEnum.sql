@@ -0,0 +1 @@
+SELECT statusId, status FROM statusEnum;
\ No newline at end of file
@@ -0,0 +1,14 @@
+-- availabilityLogCompact rows for the TEMP availabilityLog view, WITHOUT ROWID tables have no rowid
+-- and (evseKey, createdAt) is unique, so the logId is only offset above the logIds of other sources.
+SELECT 
+  (1 << 62) + a.createdAt AS logId,
+  k.locationId,
+  k.revision,
+  k.evseId,
+  datetime(a.createdAt, 'unixepoch') AS createdAt,
+  s.status,
+  CASE WHEN typeof(a.timestamp) = 'integer' THEN strftime('%Y-%m-%dT%H:%M:%SZ', a.timestamp, 'unixepoch') ELSE a.timestamp END AS timestamp,
+  a.runId
+FROM availabilityLogCompact a
+JOIN evseKeys k ON k.evseKey = a.evseKey
+LEFT JOIN statusEnum s ON s.statusId = a.statusId
\ No newline at end of file
@@ -0,0 +1,4 @@
+SELECT locationId, evseId, status, timestamp
+FROM availabilityLog
+WHERE runId = ?
+ORDER BY locationId, evseId;
\ No newline at end of file
@@ -0,0 +1,4 @@
+SELECT plugType, speed, revision, connectorGroup
+FROM connectorGroups
+WHERE locationId = ?
+ORDER BY createdAt DESC;
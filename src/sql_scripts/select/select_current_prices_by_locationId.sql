@@ -0,0 +1,13 @@
+-- Current price of every priceGroup of a location, taken from the newest timetable of the group
+SELECT pg.priceGroupId, pg.connectorGroup, pg.plugType, pg.speed, ts.product, ts.isFlat, ts.from_datetime, ts.to_datetime, ts.price
+FROM priceGroups pg
+INNER JOIN priceTimeSlots ts
+ON ts.priceGroupId = pg.priceGroupId
+WHERE pg.locationId = ?
+AND COALESCE(ts.lastSeenAt, ts.createdAt) = (
+  SELECT MAX(COALESCE(lastSeenAt, createdAt))
+  FROM priceTimeSlots
+  WHERE priceGroupId = pg.priceGroupId
+)
+AND ts.isCurrent = 1
+ORDER BY pg.priceGroupId, ts.product;
\ No newline at end of file
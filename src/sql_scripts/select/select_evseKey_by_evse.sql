@@ -0,0 +1 @@
+SELECT evseKey FROM evseKeys WHERE locationId = ? AND revision = ? AND evseId = ?;
\ No newline at end of file
@@ -0,0 +1 @@
+SELECT lastSyncedAt FROM syncMetadata WHERE syncName = ?;
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- Last logged row of every evse, rowid breaks ties between rows created within the same second.
+SELECT locationId, evseId, status, timestamp, CAST(strftime('%s', createdAt) AS INTEGER)
+FROM availabilityLog
+WHERE rowid IN (
+  SELECT MAX(rowid)
+  FROM availabilityLog
+  GROUP BY locationId, evseId
+);
@@ -0,0 +1,4 @@
+-- Last logged row of every evse, also works on the TEMP views of sharded databases where rowid does not exist.
+SELECT locationId, evseId, status, timestamp, CAST(strftime('%s', validFrom) AS INTEGER)
+FROM availabilityLog_intervals
+WHERE validTo IS NULL;
\ No newline at end of file
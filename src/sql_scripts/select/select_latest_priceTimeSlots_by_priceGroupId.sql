@@ -0,0 +1,5 @@
+-- Columns after id have to match timeslot_key in db_tools
+SELECT id, product, isFlat, from_datetime, to_datetime, price, is_next_day
+FROM priceTimeSlots
+WHERE priceGroupId = ?
+AND lastSeenAt = ?;
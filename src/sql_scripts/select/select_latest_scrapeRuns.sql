@@ -0,0 +1,10 @@
+-- Latest finished run of every job
+SELECT *
+FROM scrapeRuns
+WHERE runId IN (
+    SELECT MAX(runId)
+    FROM scrapeRuns
+    WHERE finishedAt IS NOT NULL
+    GROUP BY jobName
+)
+ORDER BY jobName;
\ No newline at end of file
@@ -1,5 +1,6 @@
-
-SELECT DISTINCT locationId
-FROM latest_connector_groups
-Where speed = ?
-ORDER BY locationId;
\ No newline at end of file
+SELECT DISTINCT cg.locationId
+FROM connectorGroups cg
+INNER JOIN latestRevision lr
+ON lr.locationId = cg.locationId AND lr.revision = cg.revision
+WHERE cg.speed = ?
+ORDER BY cg.locationId;
\ No newline at end of file
@@ -0,0 +1,2 @@
+-- Changes whenever a location revision or connectorGroup is added, both are only ever inserted
+SELECT (SELECT MAX(rowid) FROM locations), (SELECT MAX(rowid) FROM connectorGroups);
\ No newline at end of file
@@ -0,0 +1,6 @@
+SELECT createdAt, connectorGroup, availableCount, totalCount
+FROM availabilityAggregated
+WHERE locationId = ?
+AND createdAt >= ?
+AND createdAt < ?
+ORDER BY createdAt, connectorGroup;
\ No newline at end of file
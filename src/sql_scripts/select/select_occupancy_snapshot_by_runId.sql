@@ -0,0 +1,4 @@
+SELECT locationId, connectorGroup, availableCount, totalCount
+FROM availabilityAggregated
+WHERE runId = ?
+ORDER BY locationId, connectorGroup;
\ No newline at end of file
@@ -0,0 +1,3 @@
+SELECT evseIdsHash, priceGroupId
+FROM priceGroups
+WHERE locationId = ?;
@@ -0,0 +1,4 @@
+SELECT locationId, priceGroupId, product, isFlat, from_datetime, to_datetime, isCurrent, price
+FROM priceTimeSlots
+WHERE runId = ?
+ORDER BY priceGroupId, id;
\ No newline at end of file
@@ -0,0 +1,3 @@
+SELECT lastSeenAt
+FROM priceTimetables
+WHERE priceGroupId = ?;
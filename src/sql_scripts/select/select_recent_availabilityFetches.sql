@@ -0,0 +1,5 @@
+-- Locations stored by other jobs since a time
+SELECT locationId
+FROM availabilityFetches
+WHERE storedAt >= ?
+AND jobName IS NOT ?;
\ No newline at end of file
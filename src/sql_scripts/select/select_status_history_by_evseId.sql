@@ -0,0 +1,7 @@
+SELECT evseId, createdAt, status, timestamp
+FROM availabilityLog
+WHERE locationId = ?
+AND evseId = ?
+AND createdAt >= ?
+AND createdAt < ?
+ORDER BY createdAt;
\ No newline at end of file
@@ -0,0 +1,6 @@
+SELECT evseId, createdAt, status, timestamp
+FROM availabilityLog
+WHERE locationId = ?
+AND createdAt >= ?
+AND createdAt < ?
+ORDER BY evseId, createdAt;
\ No newline at end of file
@@ -0,0 +1,6 @@
+SELECT evseId, status, timestamp, validFrom, validTo
+FROM availabilityLog_intervals
+WHERE locationId = ?
+AND (validTo IS NULL OR validTo >= ?)
+AND validFrom <= ?
+ORDER BY evseId, validFrom, logId;
@@ -0,0 +1,3 @@
+SELECT nsuccess, ntotal
+FROM writerBatches
+WHERE batchId = ?;
\ No newline at end of file
@@ -0,0 +1,2 @@
+DELETE FROM writerBatches
+WHERE createdAt < ?;
\ No newline at end of file
@@ -0,0 +1,4 @@
+UPDATE priceTimeSlots
+SET lastSeenAt = ?
+WHERE priceGroupId = ?
+AND lastSeenAt = ?;
@@ -0,0 +1,3 @@
+UPDATE priceTimeSlots
+SET lastSeenAt = ?, isCurrent = ?
+WHERE id = ?;
\ No newline at end of file
@@ -0,0 +1,15 @@
+UPDATE scrapeRuns
+SET finishedAt = ?,
+    status = ?,
+    totalSeconds = ?,
+    fetchSeconds = ?,
+    parseSeconds = ?,
+    lock_waitSeconds = ?,
+    insertSeconds = ?,
+    commitSeconds = ?,
+    nrequests = ?,
+    ntimeouts = ?,
+    nresults = ?,
+    nrows = ?,
+    nfailures = ?
+WHERE runId = ?;
\ No newline at end of file
@@ -0,0 +1,3 @@
+UPDATE writerBatches
+SET nsuccess = ?, ntotal = ?
+WHERE batchId = ?;
\ No newline at end of file
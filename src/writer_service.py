@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import socketserver
+import threading
+import logging
+from db_writer import db_writer
+
+# Create module-level logger
+logger = logging.getLogger(__name__)
+
+# What the writer service can insert, keyed by the kind clients send with a batch
+INSERT_FUNCS = {
+    'availability': lambda database, conn, item, runId: database.insert_row_in_availabilityLog_table(conn=conn, loc_avail_query=item, runId=runId),
+    'prices': lambda database, conn, item, runId: database.insert_rows_in_priceTimeSlots_table(conn=conn, plug_data=item, runId=runId),
+}
+
+def insert_items(database, conn, kind:str, items:list, runId:int=None):
+    """Insert the items of a batch of run runId, an item that fails is logged and skipped. Returns (nsuccess, ntotal)"""
+    insert_func = INSERT_FUNCS[kind]
+    nsuccess, ntotal = 0, 0
+    for item in items:
+        try:
+            item_nsuccess, item_ntotal = insert_func(database, conn, item, runId)
+            nsuccess += item_nsuccess
+            ntotal += item_ntotal
+        except Exception as e:
+            logger.error(f"Failed to write {kind} item: {e}", exc_info=True)
+    return nsuccess, ntotal
+
+def insert_batch(database, conn, kind:str, items:list, runId:int=None, batchId:str=None):
+    """
+    Insert a batch of a service_writer once. Its batchId is recorded in writerBatches in the same
+    transaction, a batch that was already written, by the service or by the client writing it directly
+    after the service did not answer, is skipped and returns the (nsuccess, ntotal) of the first write.
+    """
+    if batchId is None:
+        return insert_items(database, conn, kind, items, runId)
+    written = database.claim_writer_batch(conn, batchId)
+    if written is not None:
+        logger.info(f"Batch {batchId} was already written, skipping it")
+        return written
+    nsuccess, ntotal = insert_items(database, conn, kind, items, runId)
+    database.update_writer_batch(conn, batchId, nsuccess, ntotal)
+    return nsuccess, ntotal
+
+
+class _request_handler(socketserver.StreamRequestHandler):
+    """
+    One client connection, every line is a JSON batch {"kind": ..., "items": [...], "runId": ..., "batchId": ...}
+    answered by one JSON line
+    """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                nsuccess, ntotal = self.server.service.submit(request['kind'], request['items'], request.get('runId'), request.get('batchId'))
+                response = {'nsuccess': nsuccess, 'ntotal': ntotal}
+            except Exception as e:
+                response = {'error': str(e)}
+            self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+class _unix_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class writer_service:
+    """
+    Owns the database and writes the batches that scraper processes send over a Unix domain socket.
+
+    Batches of all clients go through one db_writer, so batches arriving together are committed
+    in one transaction and no other process has to wait on SQLite's write lock. A client gets
+    its answer once its batch is committed. Batches with a batchId are written once, see insert_batch,
+    the batchIds are kept for a day.
+
+    Args:
+        database: db instance to write into.
+        socket_path: path of the Unix domain socket.
+        batch_size: maximum number of client batches committed per transaction.
+        timeout: seconds a client batch waits to be committed before the client gets an error,
+            below the timeout of writer_client so the client can write the batch itself.
+    """
+    def __init__(self, database, socket_path:str, batch_size:int=25, timeout:float=240):
+        self.database = database
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.writer = db_writer(
+            database,
+            insert_func=self._insert,
+            batch_size=batch_size,
+            on_commit=self._on_commit,
+        )
+        self.server = None
+        self._pruned_at = 0
+
+    def submit(self, kind:str, items:list, runId:int=None, batchId:str=None):
+        """Queue a batch for the writer thread and wait until it is committed"""
+        if kind not in INSERT_FUNCS:
+            raise ValueError(f"Unknown kind '{kind}'")
+        pending = {'kind': kind, 'items': items, 'runId': runId, 'batchId': batchId, 'done': threading.Event(), 'result': None}
+        self.writer.put(pending)
+        deadline = time.monotonic() + self.timeout
+        while not pending['done'].wait(1):
+            if not self.writer.is_alive():
+                raise RuntimeError('Writer thread stopped before the batch was committed')
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Batch was not committed within {self.timeout} seconds")
+        if isinstance(pending['result'], Exception):
+            raise pending['result']
+        return pending['result']
+
+    def _insert(self, conn, pending):
+        if time.monotonic() - self._pruned_at > 3600:
+            self.database.delete_writer_batches(conn, max_age_hours=24)
+            self._pruned_at = time.monotonic()
+        return insert_batch(self.database, conn, pending['kind'], pending['items'], pending['runId'], pending['batchId'])
+
+    def _on_commit(self, items, results):
+        for pending, result in zip(items, results):
+            pending['result'] = result
+            pending['done'].set()
+
+    def start(self):
+        """Start the writer thread and listen on the socket, returns without serving"""
+        if os.path.exists(self.socket_path):
+            # left behind by a service that did not shut down cleanly
+            os.remove(self.socket_path)
+        self.writer.start()
+        self.server = _unix_server(self.socket_path, _request_handler)
+        self.server.service = self
+        logger.info(f"Writer service listening on {self.socket_path}")
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def close(self):
+        """Stop accepting batches, flush the queued ones and remove the socket"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.writer.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        logger.info(f"Writer service stopped, wrote {self.writer.nitems} batches")
+
+
+class writer_client:
+    """Connection to a writer service, raises OSError if the service can not be reached"""
+    def __init__(self, socket_path:str, timeout:float=300):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(socket_path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.file = self.sock.makefile('rwb')
+
+    def write(self, kind:str, items:list, runId:int=None, batchId:str=None):
+        """Send a batch of run runId and wait until it is committed, returns (nsuccess, ntotal)"""
+        self.file.write((json.dumps({'kind': kind, 'items': items, 'runId': runId, 'batchId': batchId}) + '\n').encode())
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('Writer service closed the connection')
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(f"Writer service failed to write batch: {response['error']}")
+        return response['nsuccess'], response['ntotal']
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class service_writer:
+    """
+    Same interface as db_writer, but a sender thread sends the items in batches to a writer service,
+    so scraping continues while the service writes. The scraper blocks when queue_size batches wait.
+
+    If the service fails or stops answering, the batch and the remaining ones are written directly
+    into the database. Every batch has a batchId the service records with its rows, so a batch the
+    service committed but did not answer in time is not written twice, see insert_batch.
+    """
+    def __init__(self, database, kind:str, client:writer_client, payload_func=None, batch_size:int=25, queue_size:int=4, metrics=None, runId:int=None):
+        self.database = database
+        self.kind = kind
+        self.client = client
+        self.metrics = metrics
+        self.runId = runId
+        self.payload_func = payload_func or (lambda item: item)
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.nsuccess = 0
+        self.ntotal = 0
+        self._batch = []
+        self._thread = threading.Thread(target=self._run, name='service_writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put(self, item):
+        """Add an item to the batch, hands the batch to the sender thread once it is full."""
+        self._batch.append(self.payload_func(item))
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def close(self):
+        """Send the remaining items, stop the sender thread and return (nsuccess, ntotal)."""
+        self._flush()
+        self.queue.put(None)
+        self._thread.join()
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        return self.nsuccess, self.ntotal
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _flush(self):
+        if self._batch:
+            items, self._batch = self._batch, []
+            self.queue.put(items)
+
+    def _run(self):
+        while True:
+            items = self.queue.get()
+            if items is None:
+                return
+            self._send(items, uuid.uuid4().hex)
+
+    def _send(self, items:list, batchId:str):
+        if self.client is not None:
+            started = time.perf_counter()
+            try:
+                nsuccess, ntotal = self.client.write(self.kind, items, self.runId, batchId)
+            except (OSError, RuntimeError, ValueError) as e:
+                logger.warning(f"Writer service failed, writing directly into the database: {e}")
+                self.client.close()
+                self.client = None
+            else:
+                # the service's lock wait and commit are part of the round trip
+                if self.metrics is not None:
+                    self.metrics.add_time('insert', time.perf_counter() - started)
+                self.nsuccess += nsuccess
+                self.ntotal += ntotal
+                return
+
+        try:
+            with self.database.connections.writer(metrics=self.metrics) as conn:
+                started = time.perf_counter()
+                nsuccess, ntotal = insert_batch(self.database, conn, self.kind, items, self.runId, batchId)
+                if self.metrics is not None:
+                    self.metrics.add_time('insert', time.perf_counter() - started)
+        except Exception as e:
+            # the scraper keeps handing over batches, the sender thread has to keep taking them
+            logger.error(f"service_writer failed to write {len(items)} items: {e}", exc_info=True)
+            return
+        self.nsuccess += nsuccess
+        self.ntotal += ntotal
+
+
+def open_writer(database, kind:str, socket_path:str=None, payload_func=None, metrics=None, runId:int=None):
+    """
+    Writer for the results of one run. Uses the writer service when socket_path is set and
+    reachable, and otherwise a local db_writer that writes directly into the database.
+    metrics is an optional run_metrics of the run and runId the scrapeRuns run the rows belong to.
+    """
+    payload_func = payload_func or (lambda item: item)
+    if socket_path:
+        try:
+            client = writer_client(socket_path)
+            logger.info(f"Sending {kind} results to the writer service at {socket_path}")
+            return service_writer(database, kind, client, payload_func=payload_func, metrics=metrics, runId=runId)
+        except OSError as e:
+            logger.warning(f"Writer service at {socket_path} is not reachable, writing directly into the database: {e}")
+
+    insert_func = INSERT_FUNCS[kind]
+    return db_writer(database, insert_func=lambda conn, item: insert_func(database, conn, payload_func(item), runId), metrics=metrics)
+
+def run_writer_service(database, socket_path:str):
+    """Serve until the process is stopped"""
+    service = writer_service(database, socket_path).start()
+    try:
+        service.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Writer service was shutdown")
+    finally:
+        service.close()
@@ -0,0 +1,357 @@
+"""
+Synthetic-load benchmark of the insert paths of db.
+
+Generates locations, availability and price payloads for nlocations locations with nevses evses each,
+replays them through insert_rows_in_locations_tables, insert_row_in_availabilityLog_table and
+insert_rows_in_priceTimeSlots_table, and reports rows/s, p50/p99 latency per insert call, WAL growth and
+peak RSS. The results are written as JSON, so runs of different versions can be compared.
+
+Run from the repository root:
+    PYTHONPATH=src python tests/benchmarks/benchmark_db_inserts.py --nlocations 1000 --nevses 4
+    PYTHONPATH=src python tests/benchmarks/benchmark_db_inserts.py --compare data/benchmarks/<earlier run>.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+try:
+    import resource
+except ImportError: # not available on windows, peak RSS is not reported there
+    resource = None
+
+from db_tools import db
+
+PLUG_TYPES = [('Type 2', 'Standard'), ('CCS', 'Fast'), ('CCS', 'Rapid'), ('CHAdeMO', 'Rapid')]
+STATUSES = ['Available', 'Occupied', 'OutOfOrder', 'Unknown']
+
+# ============================================================================
+# Synthetic payloads, shaped like the responses of the scrapers
+# ============================================================================
+
+def generate_locations(nlocations:int, nevses:int, rng:random.Random, revision:int=1):
+    """locationId -> location, as returned by the locations scraper"""
+    locations = {}
+    for i in range(nlocations):
+        locationId = f'BENCH{i:07d}'
+        # every connectorGroup gets at least one evse
+        plugs = rng.sample(PLUG_TYPES, k=rng.randint(1, max(1, min(2, nevses))))
+        locations[locationId] = {
+            'locationId': locationId,
+            'revision': revision,
+            'name': f'Benchmark location {i}',
+            'partnerStatus': 'No',
+            'isRoamingPartner': True,
+            'origin': 'benchmark',
+            'coordinates': {'lat': 55 + rng.random(), 'lng': 10 + rng.random()},
+            'timestamp': {'seconds': 1735689600 + i, 'nanoseconds': 0},
+            'connectorCounts': [
+                {'plugType': plugType, 'speed': speed, 'count': nevses}
+                for plugType, speed in plugs
+            ],
+            # not part of the scraped object, lets the other generators build matching evses
+            '_plugs': plugs,
+        }
+    return locations
+
+def evse_plug(location:dict, evse:int):
+    """(plugType, speed) of an evse, the evses are spread over the connectorGroups of the location"""
+    plugs = location['_plugs']
+    return plugs[evse % len(plugs)]
+
+def generate_availability(location:dict, nevses:int, rng:random.Random, statuses:dict, timestamp:str, change_rate:float):
+    """
+    Availability query of a location, as returned by the availability scrapers.
+    statuses holds the last status of every evse, change_rate of the evses change status per round.
+    """
+    evses, availability = {}, {}
+    for evse in range(nevses):
+        evseId = f"{location['locationId']}*{evse}"
+        plugType, speed = evse_plug(location, evse)
+        if (evseId not in statuses) or (rng.random() < change_rate):
+            statuses[evseId] = rng.choice(STATUSES)
+        evses[evseId] = {
+            'evseId': evseId,
+            'connectors': {f'{evseId}-1': {
+                'evseConnectorId': f'{evseId}-1',
+                'plugType': plugType,
+                'powerType': 'AC' if speed == 'Standard' else 'DC',
+                'maxPowerKw': 22 if speed == 'Standard' else 150,
+                'connectorId': '1',
+                'speed': speed,
+            }},
+        }
+        availability[evseId] = {'evseId': evseId, 'status': statuses[evseId], 'timestamp': timestamp}
+    return {
+        'locationId': location['locationId'],
+        'revision': location['revision'],
+        'evses': evses,
+        'availability': {'evses': availability},
+    }
+
+def generate_prices(location:dict, nevses:int, rng:random.Random, nslots:int, change_rate:float, day:datetime):
+    """Price query of a location, as returned by the prices scraper, with an hourly timetable per plug group"""
+    plugs = []
+    for plugType, speed in location['_plugs']:
+        connectors = [
+            {'evseId': f"{location['locationId']}*{evse}", 'plugType': plugType, 'speed': speed}
+            for evse in range(nevses) if evse_plug(location, evse) == (plugType, speed)
+        ]
+        # prices follow the plug group, a few of them change from run to run
+        base_price = 3.0 + PLUG_TYPES.index((plugType, speed))
+        timeTable = []
+        for slot in range(nslots):
+            start = day + timedelta(hours=slot)
+            end = start + timedelta(minutes=59)
+            price = base_price + (rng.random() if rng.random() < change_rate else 0)
+            timeTable.append({
+                'from_date_string': start.strftime('%d.%m.%Y'),
+                'from_time_string': start.strftime('%H:%M'),
+                'to_date_string': end.strftime('%d.%m.%Y'),
+                'to_time_string': end.strftime('%H:%M'),
+                'price_string': f'{price:.2f}',
+                'is_next_day': start.date() != day.date(),
+            })
+        plugs.append({
+            'connectors': connectors,
+            'prices': [{'product': 'Ad hoc', 'isFlat': False, 'timeTable': timeTable}],
+        })
+    return {'locationId': location['locationId'], 'plugs': plugs}
+
+# ============================================================================
+# Measurements
+# ============================================================================
+
+def percentile(values:list, q:float):
+    """Nearest-rank percentile, None for no values"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+def file_size(path:str):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def peak_rss_bytes():
+    """Peak resident set size of the process so far, None where it is not available"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def replay(database, phase:str, payloads:list, insert_func, batch_size:int):
+    """
+    Insert the payloads with insert_func(conn, payload) -> nrows, committing every batch_size payloads
+    like db_writer does. Latencies are per insert call, the commits count towards the throughput.
+    """
+    wal_path = f'{database.name}.db-wal'
+    wal_before = file_size(wal_path)
+    latencies, nrows = [], 0
+    started = time.perf_counter()
+    for i in range(0, len(payloads), batch_size):
+        with database.connections.writer() as conn:
+            database.attach_availability_shard(conn)
+            conn.execute("BEGIN")
+            for payload in payloads[i:i + batch_size]:
+                call_started = time.perf_counter()
+                nrows += insert_func(conn, payload)
+                latencies.append(time.perf_counter() - call_started)
+    seconds = time.perf_counter() - started
+
+    return {
+        'phase': phase,
+        'ncalls': len(payloads),
+        'nrows': nrows,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(nrows / seconds, 1) if seconds > 0 else None,
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'wal_growth_bytes': file_size(wal_path) - wal_before,
+        'db_bytes': file_size(f'{database.name}.db'),
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+def git_revision():
+    """Commit of the benchmarked tree, None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(
+        db_name:str,
+        nlocations:int=500,
+        nevses:int=4,
+        rounds:int=5,
+        price_rounds:int=2,
+        nslots:int=24,
+        batch_size:int=25,
+        change_rate:float=0.1,
+        seed:int=0,
+        delta_keyframe_minutes:float=0,
+        dedup_price_timetables:bool=False,
+        shard_availability:bool=False,
+        compact_availability:bool=False,
+    ):
+    """
+    Create a fresh database at db_name and replay the synthetic load into it.
+    Returns the results as a dict, one entry per phase in 'phases'.
+    """
+    parameters = {key: value for key, value in locals().items() if key != 'db_name'}
+    rng = random.Random(seed)
+    database = db(
+        name=db_name,
+        delta_keyframe_minutes=delta_keyframe_minutes,
+        dedup_price_timetables=dedup_price_timetables,
+        shard_availability=shard_availability,
+        compact_availability=compact_availability,
+    )
+    database.create_db()
+
+    locations = generate_locations(nlocations, nevses, rng)
+    phases = []
+    try:
+        # the locations scraper returns every location at once, they are inserted in chunks of batch_size
+        location_items = list(locations.items())
+        location_chunks = [dict(location_items[i:i + batch_size]) for i in range(0, len(location_items), batch_size)]
+        phases.append(replay(
+            database, 'locations', location_chunks,
+            lambda conn, chunk: sum(database.insert_rows_in_locations_tables(conn, chunk)[:2]),
+            batch_size=1,
+        ))
+
+        statuses = {}
+        started_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for run in range(rounds):
+            timestamp = (started_at + timedelta(minutes=5 * run)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            payloads = [
+                generate_availability(location, nevses, rng, statuses, timestamp, change_rate)
+                for location in locations.values()
+            ]
+            phases.append(replay(
+                database, f'availability_round_{run}', payloads,
+                lambda conn, payload: database.insert_row_in_availabilityLog_table(conn, payload)[0],
+                batch_size=batch_size,
+            ))
+
+        for run in range(price_rounds):
+            payloads = [
+                generate_prices(location, nevses, rng, nslots, change_rate, started_at)
+                for location in locations.values()
+            ]
+            phases.append(replay(
+                database, f'prices_round_{run}', payloads,
+                lambda conn, payload: database.insert_rows_in_priceTimeSlots_table(conn, plug_data=payload)[0],
+                batch_size=batch_size,
+            ))
+    finally:
+        database.clear_caches()
+        database.close_connections()
+
+    return {
+        'createdAt': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'phases': phases,
+    }
+
+def summarize(results:dict):
+    """Phases of the same kind (all availability rounds, all price rounds) merged into one line each"""
+    summary = {}
+    for phase in results['phases']:
+        kind = phase['phase'].split('_round_')[0]
+        entry = summary.setdefault(kind, {'nrows': 0, 'seconds': 0, 'latency_p99_ms': 0})
+        entry['nrows'] += phase['nrows']
+        entry['seconds'] += phase['seconds']
+        entry['latency_p99_ms'] = max(entry['latency_p99_ms'], phase['latency_p99_ms'] or 0)
+    for entry in summary.values():
+        entry['rows_per_second'] = round(entry['nrows'] / entry['seconds'], 1) if entry['seconds'] > 0 else None
+    return summary
+
+def print_results(results:dict, previous:dict=None):
+    for phase in results['phases']:
+        print(
+            f"{phase['phase']:<24} {phase['nrows']:>9} rows {phase['rows_per_second'] or 0:>11.1f} rows/s"
+            f"  p50 {phase['latency_p50_ms'] or 0:>8.3f} ms  p99 {phase['latency_p99_ms'] or 0:>8.3f} ms"
+            f"  WAL +{phase['wal_growth_bytes']:>10} B"
+        )
+    if results['phases'][-1]['peak_rss_bytes'] is not None:
+        print(f"peak RSS {results['phases'][-1]['peak_rss_bytes'] / 2**20:.1f} MiB")
+
+    if previous is None:
+        return
+    print(f"\ncompared to {previous.get('git_revision')} from {previous.get('createdAt')}:")
+    current_summary, previous_summary = summarize(results), summarize(previous)
+    for kind, entry in current_summary.items():
+        before = previous_summary.get(kind)
+        if not before or not before['rows_per_second'] or not entry['rows_per_second']:
+            continue
+        change = 100 * (entry['rows_per_second'] / before['rows_per_second'] - 1)
+        print(f"{kind:<24} {before['rows_per_second']:>11.1f} -> {entry['rows_per_second']:>11.1f} rows/s ({change:+.1f}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nlocations', type=int, default=500)
+    parser.add_argument('--nevses', type=int, default=4, help='evses per location')
+    parser.add_argument('--rounds', type=int, default=5, help='availability scrapes of every location')
+    parser.add_argument('--price-rounds', type=int, default=2, help='price scrapes of every location')
+    parser.add_argument('--nslots', type=int, default=24, help='timetable slots per plug group')
+    parser.add_argument('--batch-size', type=int, default=25, help='payloads committed per transaction')
+    parser.add_argument('--change-rate', type=float, default=0.1, help='share of statuses and prices changing per round')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--delta-keyframe-minutes', type=float, default=0)
+    parser.add_argument('--dedup-price-timetables', action='store_true')
+    parser.add_argument('--shard-availability', action='store_true')
+    parser.add_argument('--compact-availability', action='store_true')
+    parser.add_argument('--output', default=None, help='JSON file of the results, default data/benchmarks/benchmark_<time>.json')
+    parser.add_argument('--compare', default=None, help='JSON file of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='benchmark_db_')
+    try:
+        results = run_benchmark(
+            db_name=os.path.join(directory, 'bench'),
+            nlocations=args.nlocations,
+            nevses=args.nevses,
+            rounds=args.rounds,
+            price_rounds=args.price_rounds,
+            nslots=args.nslots,
+            batch_size=args.batch_size,
+            change_rate=args.change_rate,
+            seed=args.seed,
+            delta_keyframe_minutes=args.delta_keyframe_minutes,
+            dedup_price_timetables=args.dedup_price_timetables,
+            shard_availability=args.shard_availability,
+            compact_availability=args.compact_availability,
+        )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    output = args.output or os.path.join('data', 'benchmarks', f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    print_results(results, previous)
+    print(f"\nresults written to {output}")
+
+if __name__ == '__main__':
+    main()
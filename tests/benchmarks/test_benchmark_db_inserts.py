@@ -0,0 +1,22 @@
+from benchmark_db_inserts import run_benchmark, summarize, main
+import json
+
+def test_benchmark_smoke(tmp_path):
+    results = run_benchmark(db_name=str(tmp_path / 'bench'), nlocations=4, nevses=2, rounds=2, price_rounds=2, nslots=3, batch_size=2)
+    phases = [phase['phase'] for phase in results['phases']]
+    assert phases == ['locations', 'availability_round_0', 'availability_round_1', 'prices_round_0', 'prices_round_1'], f'unexpected phases {phases}'
+
+    locations = results['phases'][0]
+    assert locations['nrows'] > 4, f'the locations and their connectorGroups should be inserted, got {locations}'
+    availability = results['phases'][1]
+    assert availability['nrows'] == 8 and availability['latency_p99_ms'] is not None, f'every evse should be logged, got {availability}'
+    assert set(summarize(results)) == {'locations', 'availability', 'prices'}, 'rounds should be summarized per kind'
+
+def test_benchmark_writes_json(tmp_path):
+    output = tmp_path / 'results.json'
+    main(['--nlocations', '2', '--nevses', '1', '--rounds', '1', '--price-rounds', '1', '--nslots', '2', '--output', str(output)])
+    main(['--nlocations', '2', '--nevses', '1', '--rounds', '1', '--price-rounds', '1', '--nslots', '2',
+          '--output', str(tmp_path / 'again.json'), '--compare', str(output)])
+    with open(output, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    assert results['parameters']['nlocations'] == 2 and results['phases'], f'the results should be stored as JSON, got {results}'
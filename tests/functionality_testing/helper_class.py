@@ -1,6 +1,7 @@
 from db_tools import db
 import json
 import os
+import glob
 import sqlite3
 
 class tdb(db): 
@@ -49,7 +50,14 @@ class tdb(db):
         print(f'for {nmissing_ConnectorCounts} locations "connectorCounts" did not exist. Used "plugTypes" instead.')
 
     def clean_up_db(self):
+        self.clear_caches()
+        self.close_connections()
         db_file = f'{self.name}.db'
 
         if os.path.exists(db_file):
             os.remove(db_file)
+
+        # availabilityLog shards and lock files next to the database
+        for path in glob.glob(f'{self.name}_availabilityLog_*.db*') + glob.glob(f'{self.name}.*.lock'):
+            os.chmod(path, 0o644)
+            os.remove(path)
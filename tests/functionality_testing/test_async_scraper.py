@@ -0,0 +1,249 @@
+import json
+import time
+import asyncio
+import threading
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+pytest.importorskip('aiohttp')
+from async_scraper import async_scraper, aimd_controller, http_session, get_session, close_sessions
+from request_budget import request_budget
+from helper_class import tdb
+
+###############################################################################################################################
+# Fixtures:
+###############################################################################################################################
+class stub_handler(BaseHTTPRequestHandler):
+    """
+    /location/<id> answers like the availability api, /slow/<id> answers after a second, /error/<id> with a 503
+    and /limited/<id> with a 429 while more than server.capacity requests are in flight. /availability/<id>
+    and /prices/<id> answer with the availability and the plugs and prices of a location with one evse.
+    """
+    protocol_version = 'HTTP/1.1' # keep-alive
+    wbufsize = 65536 # headers and body in one send, no delayed ACK between them
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.inflight += 1
+            server.max_inflight = max(server.max_inflight, server.inflight)
+            server.connections.add(self.client_address)
+        try:
+            kind, identifier = self.path.strip('/').split('/')
+            if kind == 'slow':
+                time.sleep(1)
+            time.sleep(0.01)
+            if kind == 'error':
+                self.send_response(503)
+                body = b''
+            elif (kind == 'limited') and (server.inflight > server.capacity):
+                self.send_response(429)
+                self.send_header('Retry-After', '0.05')
+                body = b''
+            else:
+                self.send_response(200)
+                body = json.dumps(stub_response(kind, identifier)).encode()
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.inflight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+def stub_response(kind, identifier):
+    if kind == 'availability':
+        return {'data': {
+            'locationId': identifier,
+            'revision': 1,
+            'evses': {'1': {'evseId': '1', 'connectors': {}}},
+            'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+        }}
+    if kind == 'prices':
+        return {'plugs': [{
+            'connectors': [{'evseId': '1', 'plugType': 'Type 2', 'speed': 'Standard'}],
+            'prices': [{'product': 'test', 'isFlat': False, 'timeTable': [
+                {'from_date_string': '01.01.2025', 'from_time_string': f'{hour:02d}:00',
+                 'to_date_string': '01.01.2025', 'to_time_string': f'{hour:02d}:59',
+                 'price_string': f'{hour}.00', 'is_next_day': False}
+                for hour in range(2)
+            ]}],
+        }]}
+    return {'data': {'locationId': identifier}}
+
+class stub_http_server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128 # connections opened at once are not refused
+
+@pytest.fixture
+def stub_server():
+    server = stub_http_server(('127.0.0.1', 0), stub_handler)
+    server.lock = threading.Lock()
+    server.inflight = 0
+    server.max_inflight = 0
+    server.connections = set()
+    server.capacity = 5
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def mock_db(tmp_path):
+    database = tdb(name=str(tmp_path / 'test'))
+    database.create_db()
+    with database.connections.writer() as conn:
+        database.insert_row(conn, 'locations', {'locationId': 'ABC', 'revision': 1, 'name': 'test', 'ts_seconds': 100, 'ts_nanoseconds': 200})
+        database.insert_row(conn, 'connectorGroups', {'locationId': 'ABC', 'revision': 1, 'connectorGroup': 1})
+        database.insert_row(conn, 'evseids', {'locationId': 'ABC', 'revision': 1, 'evseId': '1'})
+    yield database
+    database.clean_up_db()
+
+def make_scraper(server, kind, identifiers, session=None, budget=None, parse_func=None, **options):
+    return async_scraper(
+        keyword='availability',
+        identifiers=identifiers,
+        url_re=f'http://127.0.0.1:{server.server_address[1]}/{kind}/{{}}',
+        out_path='./data/',
+        save_json=False,
+        options={'timeout': (1, 2), 'sleep_in_seconds': 0, **options},
+        session=session,
+        budget=budget,
+        parse_func=parse_func,
+    )
+
+###############################################################################################################################
+# Tests:
+###############################################################################################################################
+def test_async_scraper_results(stub_server):
+    identifiers = [f'L{i}' for i in range(200)]
+    scraper = make_scraper(stub_server, 'location', identifiers)
+    scraper.run(max_workers=20)
+
+    assert scraper.results == {identifier: {'data': {'locationId': identifier}} for identifier in identifiers}, \
+        'every identifier should have its parsed JSON response, like the thread based scrapers'
+    assert 1 < stub_server.max_inflight <= 20, f'at most max_workers requests should be in flight, got {stub_server.max_inflight}'
+    assert len(stub_server.connections) <= 20, f'connections should be kept alive and reused, got {len(stub_server.connections)}'
+
+def test_async_scraper_deadlines_and_errors(stub_server):
+    scraper = make_scraper(stub_server, 'slow', ['A', 'B'], timeout=0.3)
+    started = time.perf_counter()
+    scraper.run(max_workers=2)
+    assert scraper.results == {} and scraper.ntimeouts == 2, f'requests past their deadline should time out, got {scraper.results}, {scraper.ntimeouts}'
+    assert time.perf_counter() - started < 1, 'the run should not wait for the slow responses'
+
+    scraper = make_scraper(stub_server, 'error', ['A'])
+    scraper.run(max_workers=1)
+    assert scraper.results == {} and scraper.nerrors == 1, 'a response that is not 200 should not become a result'
+
+def test_async_scraper_nmaxtimeouts(stub_server):
+    scraper = make_scraper(stub_server, 'slow', [f'L{i}' for i in range(5)], timeout=0.2, nmaxtimeouts=2)
+    scraper.run(max_workers=1)
+    assert scraper.ntimeouts == 2, f'the remaining requests should be given up after nmaxtimeouts timeouts, got {scraper.ntimeouts}'
+
+def test_http_session_reused_across_runs(stub_server):
+    session = http_session('Rapid', max_workers=5)
+    try:
+        for run in range(3):
+            scraper = make_scraper(stub_server, 'location', [f'L{i}' for i in range(20)], session=session)
+            scraper.run(max_workers=5)
+            assert len(scraper.results) == 20, f'run {run} should get every result, got {len(scraper.results)}'
+            if run == 0:
+                connections = set(stub_server.connections)
+        assert stub_server.connections == connections, 'runs after the first should reuse the connections of the first run'
+        assert session.nconnects == 1, f'the session should only connect once, connected {session.nconnects} times'
+
+        # connection errors make the session reconnect before the next run
+        scraper = async_scraper('availability', ['A'], 'http://127.0.0.1:1/location/{}', session=session)
+        scraper.run(max_workers=5)
+        assert scraper.nconnection_errors == 1 and not session.healthy, 'a refused connection should mark the session unhealthy'
+        make_scraper(stub_server, 'location', ['A'], session=session).run(max_workers=5)
+        assert session.nconnects == 2 and session.healthy, 'the session should reconnect before the next run'
+    finally:
+        session.close()
+
+def test_get_session():
+    try:
+        session = get_session('Fast', 4)
+        assert get_session('Fast', 4) is session, 'the runs of a job should share its session'
+        assert get_session('Standard', 4) is not session, 'jobs should have their own sessions'
+        resized = get_session('Fast', 8)
+        assert resized is not session and resized.max_workers == 8, 'the pool should follow a changed max_workers'
+    finally:
+        close_sessions()
+
+def test_aimd_controller():
+    async def requests(controller, outcomes):
+        for outcome in outcomes:
+            started = await controller.acquire()
+            await controller.release(started, outcome)
+
+    controller = aimd_controller(2, 10)
+    controller.start_run()
+    asyncio.run(requests(controller, ['ok'] * 30))
+    assert 6 <= controller.limit <= 10, f'successful requests should raise the limit by about one per round, got {controller.limit}'
+
+    limit = controller.limit
+    async def congestion():
+        # requests in flight together see the same congestion, it should only count once
+        started = [await controller.acquire() for _ in range(3)]
+        for request_started in started:
+            await controller.release(request_started, 'backoff')
+    asyncio.run(congestion())
+    assert controller.limit == limit / 2 and controller.nbackoffs == 1, f'a round of failures should halve the limit once, got {controller.limit}'
+
+    asyncio.run(requests(controller, ['backoff'] * 5))
+    assert controller.limit == 2, f'the limit should not drop below min_workers, got {controller.limit}'
+    asyncio.run(requests(controller, ['ok'] * 200))
+    assert controller.limit == 10, f'the limit should not exceed max_workers, got {controller.limit}'
+
+def test_adaptive_concurrency(stub_server):
+    session = http_session('Rapid', max_workers=50, min_workers=1)
+    try:
+        make_scraper(stub_server, 'location', [f'L{i}' for i in range(300)], session=session).run(max_workers=50)
+        learned = session.controller.limit
+        assert learned > 10, f'a healthy upstream should get more requests in flight, got {learned}'
+
+        stub_server.max_inflight = 0
+        scraper = make_scraper(stub_server, 'limited', [f'L{i}' for i in range(300)], session=session)
+        scraper.run(max_workers=50)
+        assert stub_server.max_inflight > stub_server.capacity, 'the next run should start at the learned limit, not at min_workers'
+        assert session.controller.nbackoffs > 0 and session.controller.limit < learned, \
+            f'429 responses should cut the limit, got {session.controller.limit} after {session.controller.nbackoffs} backoffs'
+        assert len(scraper.results) > 150, f'most requests should get through the throttled upstream, got {len(scraper.results)}'
+    finally:
+        session.close()
+
+def test_async_scraper_request_budget(stub_server, tmp_path):
+    budget = request_budget(str(tmp_path / 'charging.budget'), 100, 'Rapid', burst=1)
+    scraper = make_scraper(stub_server, 'location', [f'L{i}' for i in range(30)], budget=budget)
+    started = time.perf_counter()
+    scraper.run(max_workers=30)
+    assert len(scraper.results) == 30, f'every request should get through, got {len(scraper.results)}'
+    assert time.perf_counter() - started > 0.25, 'every request should take a token of the 100 per second budget'
+    assert stub_server.max_inflight < 10, f'the budget should spread the requests instead of sending them at once, got {stub_server.max_inflight} in flight'
+
+def test_async_results_insert(stub_server, mock_db):
+    # like the price scraper, the parsing adds the locationId to the plugs of a location
+    def parse_prices(identifier, response):
+        return {'locationId': identifier, 'plugs': response['plugs']}
+
+    availability = make_scraper(stub_server, 'availability', ['ABC'])
+    availability.run(max_workers=1)
+    prices = make_scraper(stub_server, 'prices', ['ABC'], parse_func=parse_prices)
+    prices.run(max_workers=1)
+    unparsed = make_scraper(stub_server, 'location', ['ABC'], parse_func=parse_prices)
+    unparsed.run(max_workers=1)
+    assert (unparsed.results, unparsed.nerrors) == ({}, 1), \
+        f'a response the parsing fails on should count as error, got {unparsed.results} and {unparsed.nerrors} errors'
+
+    with mock_db.connections.writer() as conn:
+        avail_result = mock_db.insert_row_in_availabilityLog_table(conn, loc_avail_query=availability.results['ABC']['data'])
+        price_result = mock_db.insert_rows_in_priceTimeSlots_table(conn, plug_data=prices.results['ABC'])
+        nslots = conn.execute("SELECT COUNT(*) FROM priceTimeSlots").fetchone()[0]
+    assert avail_result == (1, 1), f'the availability of the async engine should be inserted, got {avail_result}'
+    assert price_result == (2, 2) and nslots == 2, f'the prices of the async engine should be inserted, got {price_result} and {nslots} slots'
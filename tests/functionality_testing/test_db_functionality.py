@@ -1,5 +1,10 @@
 from helper_class import tdb as db
+from db_writer import db_writer
+from writer_service import writer_service, writer_client, open_writer
+from run_metrics import run_metrics
+from db_tools import SQL_SCRIPTS, SCHEMA_VERSION, validate_sql_scripts, insert_statement, compact_timestamp
 import sqlite3
+import threading
 import json
 import pytest
 
@@ -69,6 +74,55 @@ def tdb_mockdata(tdb):
 def test_create_db(tdb):
     assert tdb.check_if_db_exists(), f'{tdb.name}.db was not created'
 
+def test_schema_migrations(tdb):
+    with tdb.connections.writer() as conn: 
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION, 'create_db should set the schema version'
+
+        # an up to date database is only version checked
+        statements = []
+        conn.set_trace_callback(statements.append)
+    tdb.create_db()
+    with tdb.connections.writer() as conn: 
+        conn.set_trace_callback(None)
+    assert statements == ['PRAGMA user_version'], f'create_db should not run create scripts on a current database, got {statements}'
+
+    # a database from before the priceTimetables migration
+    with tdb.connections.writer() as conn: 
+        conn.execute("DROP TABLE priceTimetables")
+        conn.execute("DROP INDEX idx_price_timeslots_group_lastseen")
+        conn.execute("DROP INDEX idx_price_timeslots_group_seenAt")
+        conn.execute("ALTER TABLE priceTimeSlots DROP COLUMN lastSeenAt")
+        conn.execute("PRAGMA user_version = 2")
+    tdb.create_db()
+    with tdb.connections.writer() as conn: 
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(priceTimeSlots)")]
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE name = 'priceTimetables'")]
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+    assert 'lastSeenAt' in columns and tables == ['priceTimetables'], 'pending migrations should be applied'
+    assert version == SCHEMA_VERSION, 'the schema version should be updated after migrating'
+
+def test_sql_scripts_registry():
+    assert ('select', 'select_all_locationIds.sql') in SQL_SCRIPTS, 'select scripts should be loaded at import'
+    assert insert_statement('locations', ('locationId', 'revision')) is insert_statement('locations', ('locationId', 'revision')), \
+        'INSERT statements should only be built once'
+
+    broken_scripts = {**SQL_SCRIPTS, ('select', 'broken.sql'): 'SELECT missingColumn FROM locations;'}
+    with pytest.raises(ValueError, match='broken.sql'):
+        validate_sql_scripts(broken_scripts)
+
+def test_connection_manager_shares_connections(tdb):
+    other_instance = db(name=tdb.name)
+    assert other_instance.connections is tdb.connections, 'db instances of the same database should share connections'
+
+    with tdb.connections.writer() as conn: 
+        synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    assert (synchronous, foreign_keys) == (1, 1), 'the PRAGMA profile should be applied to the writer'
+
+    with tdb.connections.reader() as conn: 
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO locations (locationId, revision) VALUES ('ABC', 1)")
+
 def test_foreign_keys_on_availabilityAggregated(tdb_mockdata):
     ## insert create_availabilityAggregated_table with right parameters
     availability_agg_insert = {
@@ -141,6 +195,478 @@ def test_foreign_keys_on_connectorGroup(tdb_mockdata):
     conn.close()
     assert error.sqlite_errorcode == 787, 'sqlite does not return 787 error when inserting non existing revision'
 
+def test_insert_rows_isolates_failing_rows(tdb_mockdata):
+    ## a batch where only the middle rows violate the foreign key on evseIds
+    rows = [
+        {'locationId': 'ABC', 'revision': 1, 'evseId': evseId, 'status': 'Available', 'timestamp': 100}
+        for evseId in ['1', '1', '9998', '9999', '1']
+    ]
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        nsuccess, failures=tdb_mockdata.insert_rows(conn, 'availabilityLog', rows)
+    conn.close()
+    assert nsuccess == 3, f'3 rows should be inserted, but {nsuccess} were'
+    assert [row['evseId'] for row, _ in failures] == ['9998', '9999'], 'only the rows with non existing evseIds should fail'
+    assert all(error.sqlite_errorcode == 787 for _, error in failures), 'failing rows should report the 787 error'
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM availabilityLog")
+        count = cursor.fetchone()[0]
+        assert count == 3, f'there should be 3 entries, but db have {count}'
+    conn.close()
+
+def test_db_writer_streams_items(tdb_mockdata):
+    # every item is one row, and item 3 fails on the foreign key
+    def insert_func(conn, evseId):
+        row = {'locationId': 'ABC', 'revision': 1, 'evseId': evseId, 'status': 'Available', 'timestamp': 100}
+        nsuccess, _ = tdb_mockdata.insert_rows(conn, 'availabilityLog', [row])
+        return nsuccess, 1
+
+    writer = db_writer(tdb_mockdata, insert_func=insert_func, queue_size=2, batch_size=3)
+    with writer:
+        for evseId in ['1', '1', '9999', '1', '1']:
+            writer.put(evseId)
+    assert (writer.nsuccess, writer.ntotal) == (4, 5), f'writer should report (4, 5) but reported {(writer.nsuccess, writer.ntotal)}'
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM availabilityLog")
+        count = cursor.fetchone()[0]
+        assert count == 4, f'there should be 4 entries, but db have {count}'
+    conn.close()
+
+def test_db_writer_on_commit_fails(tdb_mockdata):
+    def insert_func(conn, evseId):
+        return 1, 1
+
+    def on_commit(items, results):
+        raise ValueError('on_commit failed')
+
+    writer = db_writer(tdb_mockdata, insert_func=insert_func, queue_size=1, batch_size=1, on_commit=on_commit)
+    with writer:
+        for evseId in ['1', '1', '1']:
+            writer.put(evseId)
+    assert (writer.nsuccess, writer.ntotal) == (3, 3), f'writer should keep writing after on_commit failed, but reported {(writer.nsuccess, writer.ntotal)}'
+
+    # a batch whose commit is never reported fails instead of waiting forever
+    service = writer_service(tdb_mockdata, socket_path='test.sock', timeout=0.5)
+    service.writer.on_commit = on_commit
+    service.writer.start()
+    try:
+        with pytest.raises(TimeoutError):
+            service.submit('availability', [])
+    finally:
+        service.close()
+
+def test_writer_service(tdb_mockdata):
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    service = writer_service(tdb_mockdata, socket_path='test.sock').start()
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    try:
+        client = writer_client('test.sock')
+        result = client.write('availability', [loc_avail_query, loc_avail_query])
+        client.close()
+    finally:
+        service.close()
+    assert result == (2, 2), f'the writer service should report (2, 2) but reported {result}'
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM availabilityLog")
+        count = cursor.fetchone()[0]
+        assert count == 2, f'there should be 2 entries, but db have {count}'
+    conn.close()
+
+    # without a running service the results are written directly
+    assert isinstance(open_writer(tdb_mockdata, 'availability', socket_path='test.sock'), db_writer), \
+        'open_writer should fall back to direct writes'
+
+def test_service_writer_late_answer(tdb_mockdata):
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    service = writer_service(tdb_mockdata, socket_path='test.sock').start()
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+
+    # the service can not commit while another writer holds the database
+    locked, release = threading.Event(), threading.Event()
+    def hold_writer():
+        with tdb_mockdata.connections.writer():
+            locked.set()
+            release.wait()
+    threading.Thread(target=hold_writer, daemon=True).start()
+    locked.wait()
+    try:
+        writer = open_writer(tdb_mockdata, 'availability', socket_path='test.sock')
+        writer.client.sock.settimeout(0.2)
+        with writer:
+            writer.put(loc_avail_query)
+            writer.put(loc_avail_query)
+            # the client gives up on the service and waits for the database itself
+            threading.Timer(0.5, release.set).start()
+    finally:
+        service.close()
+    assert (writer.nsuccess, writer.ntotal) == (2, 2), f'the writer should report (2, 2) but reported {(writer.nsuccess, writer.ntotal)}'
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        count = conn.execute("SELECT COUNT(*) FROM availabilityLog").fetchone()[0]
+        nbatches = conn.execute("SELECT COUNT(*) FROM writerBatches").fetchone()[0]
+    conn.close()
+    assert count == 2, f'the batch should be written once by the service or the client, but db have {count} entries'
+    assert nbatches == 1, f'the batch should be recorded once, but db have {nbatches} batches'
+
+def test_scrapeRuns_metrics(tdb, tmp_path):
+    metrics_file = tmp_path / 'scrapers.prom'
+    metrics = run_metrics('Rapid', intervalSeconds=300)
+    with metrics.recording(tdb, metrics_file=str(metrics_file)):
+        with metrics.timer('fetch'):
+            pass
+        with tdb.connections.writer(metrics=metrics) as conn: 
+            conn.execute("SELECT 1")
+        metrics.count('requests', 3)
+        metrics.count('rows', 2)
+
+    with pytest.raises(RuntimeError):
+        with run_metrics('Prices').recording(tdb):
+            raise RuntimeError('scrape failed')
+
+    runs = {run['jobName']: run for run in tdb.select_latest_scrapeRuns()}
+    assert runs['Rapid']['status'] == 'ok' and runs['Rapid']['runId'] == metrics.runId, f'the run should be recorded, got {runs}'
+    assert (runs['Rapid']['nrequests'], runs['Rapid']['nrows'], runs['Rapid']['intervalSeconds']) == (3, 2, 300), f'the counters should be stored, got {runs["Rapid"]}'
+    assert runs['Rapid']['commitSeconds'] > 0, 'the commit of the writer should be timed'
+    assert runs['Prices']['status'] == 'failed', 'a run that raised should be recorded as failed'
+
+    metrics_text = metrics_file.read_text()
+    assert 'scraper_run_count{job="Rapid",counter="requests"} 3' in metrics_text, f'the counters should be exported, got {metrics_text}'
+    assert 'scraper_run_overrun{job="Rapid"} 0' in metrics_text, 'a run within its interval should not be an overrun'
+
+def test_runId_snapshots(tdb_mockdata):
+    def loc_avail_query(status):
+        return {
+            'locationId': 'ABC',
+            'revision': 1,
+            'evses': {'1': {'evseId': '1', 'connectors': {}}},
+            'availability': {'evses': {'1': {'evseId': '1', 'status': status, 'timestamp': '2025-01-01T00:00:00Z'}}},
+        }
+
+    runIds = []
+    for status in ['Available', 'Occupied']:
+        metrics = run_metrics('Rapid').start(tdb_mockdata)
+        with tdb_mockdata.connections.writer() as conn: 
+            tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query(status), runId=metrics.runId)
+        runIds.append(metrics.runId)
+
+    snapshots = [list(tdb_mockdata.iter_availability_snapshot(runId)) for runId in runIds]
+    assert snapshots == [[('ABC', '1', 'Available', '2025-01-01T00:00:00Z')], [('ABC', '1', 'Occupied', '2025-01-01T00:00:00Z')]], \
+        f'every run should only return its own rows, got {snapshots}'
+    occupancy = list(tdb_mockdata.iter_occupancy_snapshot(runIds[1]))
+    assert occupancy == [('ABC', 1, 0, 1)], f'the aggregated availability of the run should be returned, got {occupancy}'
+
+    with tdb_mockdata.connections.reader() as conn: 
+        sql_script = SQL_SCRIPTS[('select', 'select_availability_snapshot_by_runId.sql')]
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql_script}", (runIds[0],))]
+    assert plan[0] == 'SEARCH availabilityLog USING INDEX idx_availabilityLog_runId (runId=?)', f'a snapshot should be an index lookup, got {plan}'
+
+def test_runId_in_shards_without_runId(tdb_mockdata):
+    from shards import shard_month, create_shard, freeze_shard
+    # a frozen shard written before runIds existed
+    create_shard(tdb_mockdata.name, '2000_01', """
+        CREATE TABLE availabilityLog (locationId TEXT, revision INTEGER, evseId TEXT, createdAt DATETIME DEFAULT CURRENT_TIMESTAMP, status TEXT, timestamp TEXT);
+    """)
+    freeze_shard(tdb_mockdata.name, '2000_01')
+
+    tdb_mockdata.shard_availability = True
+    metrics = run_metrics('Rapid').start(tdb_mockdata)
+    with tdb_mockdata.connections.writer() as conn: 
+        tdb_mockdata.insert_row_in_availabilityLog_table(conn, {
+            'locationId': 'ABC',
+            'revision': 1,
+            'evses': {'1': {'evseId': '1', 'connectors': {}}},
+            'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+        }, runId=metrics.runId)
+
+    snapshot = list(tdb_mockdata.iter_availability_snapshot(metrics.runId))
+    assert snapshot == [('ABC', '1', 'Available', '2025-01-01T00:00:00Z')], f'the row should be found in the shard of {shard_month()}, got {snapshot}'
+
+def test_availability_fetch_cache(tdb_mockdata):
+    def loc_avail_query(status):
+        return {
+            'locationId': 'ABC',
+            'revision': 1,
+            'evses': {'1': {'evseId': '1', 'connectors': {}}},
+            'availability': {'evses': {'1': {'evseId': '1', 'status': status, 'timestamp': '2025-01-01T00:00:00Z'}}},
+        }
+
+    tdb_mockdata.fetch_cache_seconds = 240
+    results = []
+    for jobName, status in [('Rapid', 'Available'), ('Fast', 'Occupied'), ('Rapid', 'Occupied')]:
+        metrics = run_metrics(jobName).start(tdb_mockdata)
+        with tdb_mockdata.connections.writer() as conn: 
+            results.append(tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query(status), runId=metrics.runId))
+    assert results == [(1, 1), (0, 0), (1, 1)], f'only the job that stored the location within the fetch cache time should store it again, got {results}'
+
+    with tdb_mockdata.connections.reader() as conn: 
+        statuses = [row[0] for row in conn.execute("SELECT status FROM availabilityLog WHERE locationId = 'ABC' ORDER BY rowid")]
+    assert statuses == ['Available', 'Occupied'], f'the rows of the Fast job should have been skipped, got {statuses}'
+
+    assert tdb_mockdata.select_recently_fetched_locationIds(jobName='Fast') == {'ABC'}, 'other jobs should skip fetching the location'
+    assert tdb_mockdata.select_recently_fetched_locationIds(jobName='Rapid') == set(), 'the job that stored the location should fetch it again'
+
+    # an expired claim is taken over by another job
+    with tdb_mockdata.connections.writer() as conn: 
+        conn.execute("UPDATE availabilityFetches SET storedAt = storedAt - 240")
+    metrics = run_metrics('Fast').start(tdb_mockdata)
+    with tdb_mockdata.connections.writer() as conn: 
+        result = tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query('Available'), runId=metrics.runId)
+    assert result == (1, 1), f'the location should be stored once the fetch cache time passed, got {result}'
+
+def test_delta_availabilityLog(tdb_mockdata):
+    def loc_avail_query(status):
+        return {
+            'locationId': 'ABC',
+            'revision': 1,
+            'evses': {'1': {'evseId': '1', 'connectors': {}}},
+            'availability': {'evses': {'1': {'evseId': '1', 'status': status, 'timestamp': '2025-01-01T00:00:00Z'}}},
+        }
+
+    tdb_mockdata.delta_keyframe_minutes = 60
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        for status in ['Available', 'Available', 'Occupied']:
+            nsuccess, nplugs = tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query(status))
+            assert (nsuccess, nplugs) == (1, 1), 'unchanged statuses should still be reported as logged'
+
+        # the cache is rebuilt from the database, so a restart does not log the status again
+        tdb_mockdata.clear_caches()
+        tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query('Occupied'))
+    conn.close()
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        cursor = conn.cursor()
+        cursor.execute("SELECT status FROM availabilityLog ORDER BY rowid")
+        statuses = [row[0] for row in cursor.fetchall()]
+        assert statuses == ['Available', 'Occupied'], f'only status changes should be logged, but db have {statuses}'
+    conn.close()
+
+    intervals = tdb_mockdata.select_status_intervals('ABC')
+    assert [row[1] for row in intervals] == ['Available', 'Occupied'], 'intervals should follow the logged statuses'
+    assert intervals[0][4] == intervals[1][3], 'an interval should end when the next status starts'
+    assert intervals[1][4] is None, 'the current status should not have an end'
+
+def test_sharded_availabilityLog(tdb_mockdata):
+    from shards import shard_path, shard_month, create_shard, is_frozen
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    tdb_mockdata.shard_availability = True
+    with tdb_mockdata.connections.writer() as conn: 
+        tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        main_count = conn.execute("SELECT COUNT(*) FROM availabilityLog").fetchone()[0]
+    conn.close()
+    with sqlite3.connect(shard_path(tdb_mockdata.name, shard_month()), timeout=30) as conn: 
+        shard_count = conn.execute("SELECT COUNT(*) FROM availabilityLog").fetchone()[0]
+    conn.close()
+    assert (main_count, shard_count) == (0, 1), f'the row should be written into the shard, found {(main_count, shard_count)} in main and shard'
+
+    intervals = tdb_mockdata.select_status_intervals('ABC')
+    assert len(intervals) == 1, f'the shard should be read through the availabilityLog views, got {intervals}'
+
+    # shards of closed months are frozen, the current one is not
+    create_shard(tdb_mockdata.name, '2000_01', SQL_SCRIPTS[('create', 'create_availabilityLog_shard_table.sql')])
+    frozen = tdb_mockdata.freeze_availability_shards()
+    assert frozen == ['2000_01'] and is_frozen(tdb_mockdata.name, '2000_01'), f'only the closed shard should be frozen, got {frozen}'
+
+def test_sharded_availabilityLog_rollover(tdb_mockdata, monkeypatch):
+    import db_tools
+    from shards import shard_month, is_frozen
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    tdb_mockdata.shard_availability = True
+    # the last run of a closed month, its shard stays attached to the writer and a reader
+    monkeypatch.setattr(db_tools, 'shard_month', lambda *args: shard_month(*args) if args else '2000_01')
+    with tdb_mockdata.connections.writer() as conn: 
+        tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+    assert len(tdb_mockdata.select_status_intervals('ABC')) == 1, 'the row should be read from the shard'
+    monkeypatch.undo()
+
+    # every run after the rollover tries to freeze the closed shard before it scrapes
+    frozen = [tdb_mockdata.freeze_availability_shards() for _ in range(2)]
+    assert frozen == [['2000_01'], []] and is_frozen(tdb_mockdata.name, '2000_01'), f'the closed shard should be frozen once, got {frozen}'
+
+    with tdb_mockdata.connections.writer() as conn: 
+        nsuccess, _ = tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+    assert nsuccess == 1, 'rows should go into the shard of the new month'
+    assert len(tdb_mockdata.select_status_intervals('ABC')) == 2, 'the frozen shard should still be read'
+
+def test_compact_availabilityLog(tdb_mockdata):
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    tdb_mockdata.compact_availability = True
+    with tdb_mockdata.connections.writer() as conn: 
+        nsuccess, _ = tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+    assert nsuccess == 1, f'1 row should be inserted, but {nsuccess} were'
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        compact_row = conn.execute("SELECT evseKey, statusId, timestamp FROM availabilityLogCompact").fetchall()
+        view_row = conn.execute("SELECT locationId, revision, evseId, status, timestamp FROM availabilityLogCompact_view").fetchall()
+    conn.close()
+    assert compact_row == [(1, 1, 1735689600)], f'the row should be stored with integer keys and epoch seconds, got {compact_row}'
+    assert view_row == [('ABC', 1, '1', 'Available', '2025-01-01T00:00:00Z')], f'the view should present the availabilityLog columns, got {view_row}'
+
+    intervals = tdb_mockdata.select_status_intervals('ABC')
+    assert [interval[:3] for interval in intervals] == [('1', 'Available', '2025-01-01T00:00:00Z')], \
+        f'the compact rows should be read through the availabilityLog views, got {intervals}'
+    assert compact_timestamp('2025-01-01T00:00:00.123Z') == '2025-01-01T00:00:00.123Z', 'timestamps in another format should be kept as text'
+
+def test_compact_view_runId(tdb_mockdata):
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    tdb_mockdata.compact_availability = True
+    metrics = run_metrics('Rapid').start(tdb_mockdata)
+    with tdb_mockdata.connections.writer() as conn: 
+        tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query, runId=metrics.runId)
+        rows = conn.execute("SELECT evseId, status, runId FROM availabilityLogCompact_view").fetchall()
+    assert rows == [('1', 'Available', metrics.runId)], f'the view should present the runId of the rows, got {rows}'
+
+def test_compact_evseKeys_cache_dropped_on_rollback(tdb_mockdata):
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    tdb_mockdata.compact_availability = True
+    # a batch of the db_writer that fails after its evseKey and statusId were inserted
+    with pytest.raises(RuntimeError):
+        with tdb_mockdata.connections.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+            raise RuntimeError('batch failed')
+
+    with tdb_mockdata.connections.writer() as conn:
+        nsuccess, _ = tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+        rows = conn.execute("SELECT locationId, evseId, status FROM availabilityLogCompact_view").fetchall()
+    assert nsuccess == 1, f'the evse of the rolled-back batch should get its evseKey again, but {nsuccess} rows were inserted'
+    assert rows == [('ABC', '1', 'Available')], f'the row should be stored with the new keys, got {rows}'
+
+def test_read_api(tdb_mockdata):
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    plug_data = {
+        'locationId': 'ABC',
+        'plugs': [{
+            'connectors': [{'evseId': '1', 'plugType': 'Type 2', 'speed': 'Standard'}],
+            'prices': [{'product': 'test', 'isFlat': False, 'timeTable': [
+                {'from_date_string': '01.01.2025', 'from_time_string': f'{hour:02d}:00',
+                 'to_date_string': '01.01.2025', 'to_time_string': f'{hour:02d}:59',
+                 'price_string': price, 'is_next_day': False}
+                for hour, price in enumerate(['1.00', '2.00'])
+            ]}],
+        }],
+    }
+    tdb_mockdata.dedup_price_timetables = True
+    with tdb_mockdata.connections.writer() as conn: 
+        tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+        tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data)
+
+    history = tdb_mockdata.iter_status_history('ABC', batch_size=1)
+    assert not isinstance(history, list), 'the status history should be streamed'
+    assert [row[::2] for row in history] == [('1', 'Available')], 'the logged status should be in the status history'
+    assert len(list(tdb_mockdata.iter_status_history('ABC', evseId='1'))) == 1, 'the evse should have 1 logged status'
+    assert list(tdb_mockdata.iter_status_history('ABC', evseId='2')) == [], 'an unknown evse should have no status history'
+    assert list(tdb_mockdata.iter_status_history('ABC', end='2000-01-01')) == [], 'rows outside the time range should be skipped'
+
+    occupancy = [row[1:] for row in tdb_mockdata.iter_occupancy('ABC')]
+    assert occupancy == [(1, 1, 1)], f'connectorGroup 1 should have 1 of 1 evses available, got {occupancy}'
+
+    prices = [row[4:] for row in tdb_mockdata.iter_current_prices('ABC')]
+    assert prices == [('test', 0, '2025-01-01 00:00:00', '2025-01-01 00:59:00', '1.00')], f'only the current slot should be returned, got {prices}'
+
+def test_read_api_query_plans(tdb):
+    scripts = [
+        'select_status_history_by_locationId.sql',
+        'select_status_history_by_evseId.sql',
+        'select_occupancy_by_locationId.sql',
+        'select_current_prices_by_locationId.sql',
+    ]
+    with tdb.connections.reader() as conn: 
+        for script_name in scripts:
+            sql_script = SQL_SCRIPTS[('select', script_name)]
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql_script}", [None] * sql_script.count('?'))]
+            assert not [step for step in plan if step.startswith('SCAN')], f'{script_name} should only search indexes, got {plan}'
+            assert [step for step in plan if 'COVERING INDEX' in step or 'USING INDEX' in step], f'{script_name} should use an index, got {plan}'
+
+def test_insert_availabilityLog_with_new_evse(tdb_mockdata):
+    # evse '2' is not in evseIds yet, so it has to be inserted before its availability
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'2': {'evseId': '2', 'connectors': {'2-1': {'evseConnectorId': '2-1', 'plugType': 'Type 2', 'speed': 'Standard'}}}},
+        'availability': {'evses': {'2': {'evseId': '2', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    statements = []
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        conn.set_trace_callback(statements.append)
+        nsuccess, nplugs = tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+    conn.close()
+    assert (nsuccess, nplugs) == (1, 1), f'availability of the new evse should be logged, but got {(nsuccess, nplugs)}'
+    nlog_inserts = len([sql for sql in statements if sql.startswith('INSERT INTO availabilityLog')])
+    assert nlog_inserts == 1, f'availabilityLog row should be inserted once without a foreign key retry, but was tried {nlog_inserts} times'
+    assert ('ABC', 1, '2') in tdb_mockdata.load_evseIds_cache(conn=None), 'new evse should be added to the evseIds cache'
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM evseIds")
+        count = cursor.fetchone()[0]
+        assert count == 2, f'there should be 2 entries, but db have {count}'
+    conn.close()
+
+def test_insert_availabilityAggregated(tdb_mockdata):
+    loc_avail_query = {
+        'locationId': 'ABC',
+        'revision': 1,
+        'evses': {'1': {'evseId': '1', 'connectors': {}}},
+        'availability': {'evses': {'1': {'evseId': '1', 'status': 'Available', 'timestamp': '2025-01-01T00:00:00Z'}}},
+    }
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        tdb_mockdata.insert_row_in_availabilityLog_table(conn, loc_avail_query)
+    conn.close()
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        cursor = conn.cursor()
+        cursor.execute("SELECT locationId, revision, connectorGroup, availableCount, totalCount FROM availabilityAggregated")
+        rows = cursor.fetchall()
+        assert rows == [('ABC', 1, 1, 1, 1)], f'one aggregated row for connectorGroup 1 was expected, but db have {rows}'
+    conn.close()
+
 def test_insert_availabilityLog(tdb_sampledata):
     with open('tests/data/availability_test.json', 'r', encoding='utf-8') as f:
         availability = json.load(f)
@@ -212,6 +738,188 @@ def test_insert_priceTimeSlots(tdb_sampledata):
         assert count == 52, f'row Count in priceTimeSlots should be 52, but is {count}'
     conn.close()
 
+def test_insert_deduplicated_priceTimeSlots(tdb_mockdata):
+    def plug_data(prices):
+        timeTable = [
+            {'from_date_string': '01.01.2025', 'from_time_string': f'{hour:02d}:00',
+             'to_date_string': '01.01.2025', 'to_time_string': f'{hour:02d}:59',
+             'price_string': price, 'is_next_day': False}
+            for hour, price in enumerate(prices)
+        ]
+        return {
+            'locationId': 'ABC',
+            'plugs': [{
+                'connectors': [{'evseId': '1', 'plugType': 'Type 2', 'speed': 'Standard'}],
+                'prices': [{'product': 'test', 'isFlat': False, 'timeTable': timeTable}],
+            }],
+        }
+
+    tdb_mockdata.dedup_price_timetables = True
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        # the second run is unchanged, the third run changes the price of the second slot
+        for prices in [['1.00', '2.00'], ['1.00', '2.00'], ['1.00', '3.00']]:
+            nsuccess, ntotal = tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data(prices))
+            assert nsuccess == ntotal == 2, f'both slots should be stored, but {nsuccess}/{ntotal} were'
+    conn.close()
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        cursor = conn.cursor()
+        cursor.execute("SELECT price, firstSeenAt IS NOT NULL, lastSeenAt IS NOT NULL FROM priceTimeSlots ORDER BY id")
+        rows = cursor.fetchall()
+        assert rows == [('1.00', 1, 1), ('2.00', 1, 1), ('3.00', 1, 1)], f'only changed slots should be inserted, but db have {rows}'
+
+        cursor.execute("SELECT COUNT(*) FROM priceTimetables")
+        count = cursor.fetchone()[0]
+        assert count == 1, f'there should be 1 timetable fingerprint, but db have {count}'
+    conn.close()
+
+def test_deduplicated_priceTimeSlots_current_slot(tdb_mockdata):
+    def plug_data(hours):
+        timeTable = [
+            {'from_date_string': '01.01.2025', 'from_time_string': f'{hour:02d}:00',
+             'to_date_string': '01.01.2025', 'to_time_string': f'{hour:02d}:59',
+             'price_string': f'{hour}.00', 'is_next_day': False}
+            for hour in hours
+        ]
+        return {
+            'locationId': 'ABC',
+            'plugs': [{
+                'connectors': [{'evseId': '1', 'plugType': 'Type 2', 'speed': 'Standard'}],
+                'prices': [{'product': 'test', 'isFlat': False, 'timeTable': timeTable}],
+            }],
+        }
+
+    tdb_mockdata.dedup_price_timetables = True
+    with tdb_mockdata.connections.writer() as conn: 
+        tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data([0, 1, 2]))
+        # the first run was an hour ago
+        conn.execute("UPDATE priceTimeSlots SET firstSeenAt = '2000-01-01 00:00:00', lastSeenAt = '2000-01-01 00:00:00'")
+        conn.execute("UPDATE priceTimetables SET lastSeenAt = '2000-01-01 00:00:00'")
+    # the timetable rolls forward by one slot, the second slot becomes the current one
+    with tdb_mockdata.connections.writer() as conn: 
+        tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data([1, 2, 3]))
+
+    prices = [row[4:] for row in tdb_mockdata.iter_current_prices('ABC')]
+    assert prices == [('test', 0, '2025-01-01 01:00:00', '2025-01-01 01:59:00', '1.00')], f'the slot that became current should be returned, got {prices}'
+    with tdb_mockdata.connections.reader() as conn: 
+        rows = conn.execute("SELECT price, isCurrent FROM priceTimeSlots ORDER BY id").fetchall()
+    assert rows == [('0.00', 1), ('1.00', 1), ('2.00', 0), ('3.00', 0)], f'only the extended slot should change, got {rows}'
+
+def test_deduplicated_priceTimeSlots_cache_behind_db(tdb_mockdata):
+    plug_data = {
+        'locationId': 'ABC',
+        'plugs': [{
+            'connectors': [{'evseId': '1', 'plugType': 'Type 2', 'speed': 'Standard'}],
+            'prices': [{'product': 'test', 'isFlat': False, 'timeTable': [
+                {'from_date_string': '01.01.2025', 'from_time_string': f'{hour:02d}:00',
+                 'to_date_string': '01.01.2025', 'to_time_string': f'{hour:02d}:59',
+                 'price_string': price, 'is_next_day': False}
+                for hour, price in enumerate(['1.00', '2.00'])
+            ]}],
+        }],
+    }
+    tdb_mockdata.dedup_price_timetables = True
+    with tdb_mockdata.connections.writer() as conn:
+        tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data)
+        # another process stores the same timetable, the cached lastSeenAt is now behind the database
+        conn.execute("UPDATE priceTimeSlots SET lastSeenAt = '2000-01-01 00:00:00'")
+        conn.execute("UPDATE priceTimetables SET lastSeenAt = '2000-01-01 00:00:00'")
+
+    with tdb_mockdata.connections.writer() as conn:
+        counts = tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data)
+        rows = conn.execute("SELECT price, lastSeenAt > '2000-01-01 00:00:00' FROM priceTimeSlots ORDER BY id").fetchall()
+    assert counts == (2, 2), f'both slots should be stored, got {counts}'
+    assert rows == [('1.00', 1), ('2.00', 1)], f'the slots stored by the other process should be extended, got {rows}'
+
+def test_priceGroups_resolved_from_cache(tdb_mockdata):
+    plug_data = {
+        'locationId': 'ABC',
+        'plugs': [
+            {'connectors': [{'evseId': evseId, 'plugType': 'Type 2', 'speed': 'Standard'}], 'prices': []}
+            for evseId in ['1', '2']
+        ],
+    }
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data)
+
+        # the second run should find both priceGroups in the cache
+        statements = []
+        conn.set_trace_callback(statements.append)
+        tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data)
+    conn.close()
+    assert not [sql for sql in statements if 'priceGroups' in sql], 'known priceGroups should not be queried again'
+
+    with sqlite3.connect(f'{tdb_mockdata.name}.db', timeout=30) as conn: 
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM priceGroups")
+        count = cursor.fetchone()[0]
+        assert count == 2, f'there should be 2 priceGroups, but db have {count}'
+    conn.close()
+
+def test_priceGroups_cache_dropped_on_rollback(tdb_mockdata):
+    plug_data = {
+        'locationId': 'ABC',
+        'plugs': [{
+            'connectors': [{'evseId': '1', 'plugType': 'Type 2', 'speed': 'Standard'}],
+            'prices': [{'product': 'test', 'isFlat': True, 'timeTable': [
+                {'from_date_string': '01.01.2025', 'from_time_string': '00:00', 'to_date_string': '01.01.2025',
+                 'to_time_string': '23:59', 'price_string': '1.00', 'is_next_day': False},
+            ]}],
+        }],
+    }
+    # a batch of the db_writer that fails after its priceGroup was inserted
+    with pytest.raises(RuntimeError):
+        with tdb_mockdata.connections.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data)
+            raise RuntimeError('batch failed')
+
+    with tdb_mockdata.connections.writer() as conn:
+        counts = tdb_mockdata.insert_rows_in_priceTimeSlots_table(conn, plug_data=plug_data)
+        nslots = conn.execute("SELECT COUNT(*) FROM priceTimeSlots").fetchone()[0]
+    assert counts == (1, 1), f'the priceGroup of the rolled-back batch should be inserted again, got {counts}'
+    assert nslots == 1, f'there should be 1 priceTimeSlot, but db have {nslots}'
+
+def test_insert_locations_tables_and_sync(tdb):
+    locations = {
+        'ABC': {'locationId': 'ABC', 'revision': 1, 'connectorCounts': [{'plugType': 'Type 2', 'speed': 'Standard', 'count': 2}]},
+        'DEF': {'locationId': 'DEF', 'revision': 1, 'plugTypes': [{'plugType': 'CCS', 'speed': 'Rapid', 'count': 1}]},
+    }
+    assert tdb.select_lastSyncedAt('locations') is None, 'locations should not be synced yet'
+
+    with tdb.connections.writer() as conn: 
+        counts = tdb.insert_rows_in_locations_tables(conn, locations)
+        tdb.update_lastSyncedAt(conn, 'locations', nrows=len(locations))
+        repeated_counts = tdb.insert_rows_in_locations_tables(conn, locations)
+    assert counts == (2, 2, 1), f'expected 2 new locations, 2 new connectorGroups and 1 location without connectorCounts, got {counts}'
+    assert repeated_counts == (0, 0, 1), f'known revisions should be ignored, got {repeated_counts}'
+    assert tdb.select_lastSyncedAt('locations') is not None, 'the locations sync should be recorded'
+
+def test_latestRevision_and_cached_locationIds(tdb):
+    def location(revision, speed):
+        return {'locationId': 'ABC', 'revision': revision, 'connectorCounts': [{'plugType': 'Type 2', 'speed': speed, 'count': 2}]}
+
+    with tdb.connections.writer() as conn: 
+        tdb.insert_rows_in_locations_tables(conn, {'ABC': location(1, 'Standard')})
+    assert tdb.select_locationIds_by_speed('Standard') == ['ABC'], 'ABC should be a Standard location'
+
+    # unchanged locations are served from the cache
+    with tdb.connections.reader() as conn: 
+        statements = []
+        conn.set_trace_callback(statements.append)
+    assert tdb.select_locationIds_by_speed('Standard') == ['ABC'], 'the cached locationIds should be returned'
+    with tdb.connections.reader() as conn: 
+        conn.set_trace_callback(None)
+    assert statements == ['PRAGMA data_version'], f'unchanged locations should not be selected again, got {statements}'
+
+    # a new revision moves the location to another speed
+    with tdb.connections.writer() as conn: 
+        tdb.insert_rows_in_locations_tables(conn, {'ABC': location(2, 'Fast')})
+        latest = conn.execute("SELECT locationId, revision FROM latestRevision").fetchall()
+    assert latest == [('ABC', 2)], f'latestRevision should hold the newest revision, got {latest}'
+    assert tdb.select_locationIds_by_speed('Standard') == [], 'the cache should be refreshed after a new revision'
+    assert tdb.select_locationIds_by_speed('Fast') == ['ABC'], 'ABC should be a Fast location after its new revision'
+
 def test_select_locationId_by_speed(tdb_sampledata):
     # ['Standard', 'Fast', 'Rapid', 'Unknown']
     slocids=tdb_sampledata.select_locationIds_by_speed('Standard')
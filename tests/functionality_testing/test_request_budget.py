@@ -0,0 +1,77 @@
+import time
+import asyncio
+import multiprocessing
+from file_lock import file_lock
+from request_budget import request_budget, budgeted_identifiers
+
+def draw_tokens(path, rate_per_second, jobName, n):
+    request_budget(path, rate_per_second, jobName, burst=5).acquire(n)
+
+def test_request_budget_rate(tmp_path):
+    budget = request_budget(str(tmp_path / 'charging.budget'), 100, 'Rapid', burst=10)
+    started = time.perf_counter()
+    budget.acquire(10)
+    assert time.perf_counter() - started < 0.05, 'a full bucket should hand out its burst at once'
+    budget.acquire(20)
+    elapsed = time.perf_counter() - started
+    assert 0.15 < elapsed < 0.5, f'tokens after the burst should come at the rate, 20 tokens took {elapsed:.2f} seconds'
+
+def test_request_budget_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'charging.budget')
+    started = time.perf_counter()
+    processes = [multiprocessing.Process(target=draw_tokens, args=(path, 100, 'Rapid', 20)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    assert all(process.exitcode == 0 for process in processes), 'the processes should get their tokens'
+    assert elapsed > 0.3, f'40 tokens of a shared 100 per second bucket with a burst of 5 should take 0.35 seconds, took {elapsed:.2f}'
+
+def test_request_budget_priorities(tmp_path):
+    path = str(tmp_path / 'charging.budget')
+    rapid = request_budget(path, 1, 'Rapid', burst=8)
+    prices = request_budget(path, 1, 'Prices', burst=8)
+    assert prices.try_acquire() == 0, 'prices should get tokens from a full bucket'
+    # prices leaves 3 * 0.25 * 8 tokens for the jobs before it
+    while prices.try_acquire() == 0:
+        pass
+    assert prices.reserve == 6 and rapid.try_acquire() == 0, 'rapid should still get the tokens prices leaves in the bucket'
+    while rapid.try_acquire() == 0:
+        pass
+    wait = prices.try_acquire()
+    assert wait == 1, f'prices should wait for the bucket to refill above its reserve, waits {wait}'
+
+def test_budgeted_identifiers(tmp_path):
+    budget = request_budget(str(tmp_path / 'charging.budget'), 100, 'Rapid', burst=1)
+    identifiers = budgeted_identifiers([f'L{i}' for i in range(20)], budget)
+    assert len(identifiers) == 20 and identifiers[0] == 'L0', 'the identifiers should still be a list'
+    started = time.perf_counter()
+    handed_out = []
+    for identifier in identifiers:
+        handed_out.append((identifier, time.perf_counter() - started))
+    assert [identifier for identifier, _ in handed_out] == [f'L{i}' for i in range(20)], 'every identifier should be handed out'
+    assert handed_out[-1][1] > 0.15, f'the identifiers should be handed out at the rate, took {handed_out[-1][1]:.2f} seconds'
+
+def test_acquire_async_does_not_block_the_loop(tmp_path):
+    budget = request_budget(str(tmp_path / 'charging.budget'), 100, 'Rapid', burst=1)
+
+    async def acquire_while_locked():
+        ticks = 0
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        ticker = asyncio.create_task(tick())
+        # another process holds the lock of the bucket
+        with file_lock(f'{budget.path}.lock'):
+            acquiring = asyncio.create_task(budget.acquire_async())
+            await asyncio.sleep(0.2)
+            assert not acquiring.done(), 'the token should wait for the lock'
+        await acquiring
+        ticker.cancel()
+        return ticks
+
+    ticks = asyncio.run(acquire_while_locked())
+    assert ticks > 10, f'the event loop should keep running while the lock is taken, ticked {ticks} times'
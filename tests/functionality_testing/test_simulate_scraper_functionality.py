@@ -289,6 +289,31 @@ def test_run_prices_scheduled(
     mock_location_scraper.run.assert_called_once()
     mock_price_scraper.run.assert_called_once()
 
+def test_run_all_scheduled(
+        env_prices_scheduled, 
+        monkeypatch,
+        mock_location_scraper,
+        mock_avail_scraper,
+        mock_price_scraper,
+        tdb,
+        mock_db_with_tdb,
+    ):
+    from apscheduler.schedulers.background import BackgroundScheduler
+    monkeypatch.setenv('SCRAPER_TYPE', 'all')
+    monkeypatch.setenv('JOBS', 'standard:1:1:0.1;prices:1:1:0.1;locations:10080')
+    sch = run_scraper_schedule(scheduler_class=BackgroundScheduler)
+    # Verify scheduler was created
+    assert sch is not None
+    job_ids = [job.id for job in sch.get_jobs()]
+    assert job_ids == ['Standard_scraper', 'Prices_scraper', 'Locations_scraper'], f'every job of the job table should be scheduled, got {job_ids}'
+    # Let it run briefly, the prices job starts 5 seconds after the availability job
+    time.sleep(8)
+    # Stop scheduler
+    sch.shutdown(wait=True)
+    mock_location_scraper.run.assert_called_once()
+    mock_avail_scraper.run.assert_called_once()
+    mock_price_scraper.run.assert_called_once()
+
 # def test_run_scraper_as_main_once(
 #         env_locations_once, 
 #         mock_location_scraper,